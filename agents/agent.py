@@ -32,4 +32,23 @@ class Agent(ABC):
         Returns:
             str: The action to be taken by the agent.
         """
-        pass
\ No newline at end of file
+        pass
+
+    async def aact(self, message_history: List[str], phase: str) -> str:
+        """
+        Asynchronous variant of act, so that several agents can act at the same time.
+
+        By default act is run in a worker thread. Agents with a native asynchronous backend can override this.
+
+        Args:
+            message_history (List[str]): A list of previous messages.
+            phase (str): The current phase of the agent.
+
+        Returns:
+            str: The action to be taken by the agent.
+        """
+        # asyncio takes most of the import time of the engine, so it is only imported by coroutines, whose
+        # caller's event loop has already loaded it
+        import asyncio
+
+        return await asyncio.to_thread(self.act, message_history, phase)
@@ -0,0 +1,216 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from .constraints import choice_allowed_tokens
+
+# Put in the queue to stop the worker thread
+_STOP = object()
+
+
+class BatchScheduler:
+    """
+    Groups prompts from many concurrently running games into batches for a single generate call.
+
+    The scheduler is a callable with the same interface as an outlines model, so it can be passed as the llm
+    of an OutlinesAgent. Each call blocks until its batch is generated, so games must run concurrently
+    (e.g. several tournament.aplay_game in one event loop, which run Agent.act in worker threads) for batches
+    to fill up. The default executor of the event loop must then have at least max_batch_size threads.
+
+    Attributes:
+        generate_batch (Callable[..., List[str]]): Generates one completion per prompt. It must accept the keyword
+            arguments that callers pass, e.g. stop_at, max_tokens or is_in, and can declare them in an
+            accepted_kwargs attribute.
+        max_batch_size (int): The maximum number of prompts in a batch.
+        max_wait_time (float): The maximum time in seconds a prompt waits for the batch to fill up.
+        num_requests (int): The number of prompts generated so far.
+        num_batches (int): The number of batches generated so far.
+        accepted_kwargs (Optional[FrozenSet[str]]): The keyword arguments accepted by generate_batch, or None if it
+            does not declare them.
+    """
+    def __init__(
+        self,
+        generate_batch: Callable[..., List[str]],
+        max_batch_size: int = 8,
+        max_wait_time: float = 0.05,
+    ) -> None:
+        """
+        Initializes a BatchScheduler object and starts its worker thread.
+
+        Args:
+            generate_batch (Callable[..., List[str]]): Generates one completion per prompt.
+            max_batch_size (int): The maximum number of prompts in a batch. Defaults to 8.
+            max_wait_time (float): The maximum time in seconds a prompt waits for the batch to fill up. Defaults to 0.05.
+
+        Returns:
+            None
+        """
+        self.generate_batch = generate_batch
+        self.accepted_kwargs = getattr(generate_batch, "accepted_kwargs", None)
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.num_requests = 0
+        self.num_batches = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        # Makes closing and queueing atomic, so no prompt is queued after _STOP
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __call__(self, prompt: str, **kwargs: Any) -> str:
+        """
+        Generates a completion for the prompt as part of the next batch.
+
+        Args:
+            prompt (str): The prompt.
+            **kwargs (Any): Keyword arguments passed to generate_batch, e.g. stop_at, max_tokens or is_in. A prompt
+                is only generated with prompts of the same arguments.
+
+        Returns:
+            str: The completion.
+        """
+        kwargs = {name: value for name, value in kwargs.items() if value}
+        key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in kwargs.items()))
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The BatchScheduler is closed.")
+            self._queue.put((prompt, key, kwargs, future))
+        return future.result()
+
+    def close(self) -> None:
+        """
+        Generates the pending prompts and stops the worker thread. Later calls raise a RuntimeError.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        """
+        Worker loop collecting prompts into batches and generating them.
+
+        Returns:
+            None
+        """
+        stopped = False
+        while not stopped:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait_time
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopped = True
+                    break
+                batch.append(item)
+
+            # Prompts with different arguments, e.g. stop sequences, cannot share a generate call
+            key_to_batch = {}
+            for prompt, key, kwargs, future in batch:
+                key_to_batch.setdefault(key, (kwargs, []))[1].append((prompt, future))
+            for kwargs, key_batch in key_to_batch.values():
+                self._generate(key_batch, kwargs)
+
+        # Nothing is generated after _STOP, so any prompt left behind it fails rather than waiting forever
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[-1].set_exception(RuntimeError("The BatchScheduler is closed."))
+
+    def _generate(self, batch: List[tuple], kwargs: Dict[str, Any]) -> None:
+        """
+        Generates a batch and hands the completions back to the waiting callers.
+
+        Args:
+            batch (List[tuple]): The (prompt, future) pairs of the batch.
+            kwargs (Dict[str, Any]): The keyword arguments of generate_batch shared by the batch.
+
+        Returns:
+            None
+        """
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            completions = list(self.generate_batch(prompts, **kwargs))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        if len(completions) != len(batch):
+            e = ValueError(f"generate_batch returned {len(completions)} completions for {len(batch)} prompts.")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.num_requests += len(batch)
+        self.num_batches += 1
+        for (_, future), completion in zip(batch, completions):
+            future.set_result(completion)
+
+
+def transformers_generate_batch(model: Any, tokenizer: Any, max_new_tokens: int = 50, **generate_kwargs: Any) -> Callable[..., List[str]]:
+    """
+    Creates a batch generate function for a local transformers causal language model.
+
+    Prompts are left padded into a single tensor and generated with one model.generate call.
+    The returned function takes optional stop_at sequences, where generation of a sequence stops, a max_tokens
+    limit, and is_in choices that every completion is constrained to.
+
+    Args:
+        model (Any): The transformers model, e.g. from AutoModelForCausalLM.from_pretrained.
+        tokenizer (Any): The tokenizer of the model.
+        max_new_tokens (int): The maximum number of generated tokens per prompt, unless max_tokens is passed.
+            Defaults to 50.
+        **generate_kwargs (Any): Extra keyword arguments of model.generate, e.g. do_sample or temperature.
+
+    Returns:
+        Callable[..., List[str]]: The batch generate function.
+    """
+    # Decoder-only models continue from the last position, so padding must go on the left
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    def generate_batch(
+        prompts: List[str],
+        stop_at: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        is_in: Optional[List[str]] = None,
+    ) -> List[str]:
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+        constraint_kwargs = {"stop_strings": stop_at, "tokenizer": tokenizer} if stop_at else {}
+        if is_in:
+            constraint_kwargs["prefix_allowed_tokens_fn"] = choice_allowed_tokens(
+                tokenizer, is_in, inputs["input_ids"].shape[1]
+            )
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_tokens or max_new_tokens,
+            pad_token_id=tokenizer.pad_token_id,
+            **constraint_kwargs,
+            **generate_kwargs,
+        )
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        return tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+    generate_batch.accepted_kwargs = frozenset({"stop_at", "max_tokens", "is_in"})
+    return generate_batch
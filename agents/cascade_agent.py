@@ -0,0 +1,323 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import metrics
+from utils import GamePhase
+from .history import HistoryCompactor
+from .outlines_agent import OutlinesAgent, _split_prompt
+
+
+class Tier:
+    """
+    One model of a cascade, e.g. a small local transformers model or a hosted model.
+
+    Attributes:
+        name (str): The name of the tier, used in the counters.
+        llm (Callable): The outlines model. To escalate on low confidence, it must provide
+            generate_with_confidence(prompt, **kwargs), or complete_with_confidence(key, prefix, tail, **kwargs)
+            with prefix reuse, like agents.prefix_cache.PrefixCachingLLM.
+        prompt_cost (float): The cost of 1000 prompt tokens.
+        completion_cost (float): The cost of 1000 completion tokens.
+        reuse_prefix (bool): Whether the llm reuses the encoded prompt prefix between turns.
+    """
+    def __init__(
+        self, name: str, llm: Callable, prompt_cost: float = 0.0, completion_cost: float = 0.0, reuse_prefix: bool = False
+    ) -> None:
+        """
+        Initializes a Tier object.
+
+        Args:
+            name (str): The name of the tier.
+            llm (Callable): The outlines model.
+            prompt_cost (float): The cost of 1000 prompt tokens. Defaults to 0.0, e.g. for a local model.
+            completion_cost (float): The cost of 1000 completion tokens. Defaults to 0.0.
+            reuse_prefix (bool): Whether the llm reuses the encoded prompt prefix between turns. The llm must then
+                provide complete(key, prefix, tail), e.g. a local PrefixCachingLLM, unlike a hosted model.
+                Defaults to False.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.llm = llm
+        self.prompt_cost = prompt_cost
+        self.completion_cost = completion_cost
+        self.reuse_prefix = reuse_prefix
+
+
+class PhasePolicy:
+    """
+    When a cascade escalates to the next tier in a phase.
+
+    Attributes:
+        min_confidence (float): The confidence below which an action is escalated.
+        first_tier (int): The index of the first tier tried, e.g. 1 to always use the expensive model.
+    """
+    def __init__(self, min_confidence: float = 0.0, first_tier: int = 0) -> None:
+        """
+        Initializes a PhasePolicy object.
+
+        Args:
+            min_confidence (float): The confidence below which an action is escalated. Defaults to 0.0, which
+                only escalates actions that cannot be parsed.
+            first_tier (int): The index of the first tier tried. Defaults to 0.
+
+        Returns:
+            None
+        """
+        self.min_confidence = min_confidence
+        self.first_tier = first_tier
+
+
+class CascadeStats:
+    """
+    Counters of the tiers of cascade agents, to be shared by the agents of an experiment.
+
+    Attributes:
+        tiers (Dict[str, Dict[str, float]]): Per tier: calls, accepted actions, escalations by reason, seconds,
+            prompt and completion tokens, cost, and the games played and won by the agents using it.
+    """
+    def __init__(self) -> None:
+        self.tiers = {}
+        self._lock = threading.Lock()
+
+    def record_call(
+        self, tier: Tier, phase: str, seconds: float, prompt_tokens: int, completion_tokens: int, escalation: Optional[str]
+    ) -> None:
+        """
+        Records an llm call of a tier.
+
+        Args:
+            tier (Tier): The tier.
+            phase (str): The phase of the action.
+            seconds (float): The latency of the call.
+            prompt_tokens (int): The number of prompt tokens.
+            completion_tokens (int): The number of completion tokens.
+            escalation (Optional[str]): Why the action was escalated to the next tier, "parse_failure" or
+                "low_confidence", or None if it was accepted.
+
+        Returns:
+            None
+        """
+        cost = (prompt_tokens * tier.prompt_cost + completion_tokens * tier.completion_cost) / 1000
+        with self._lock:
+            counters = self._counters(tier.name)
+            counters["calls"] += 1
+            counters["seconds"] += seconds
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["cost"] += cost
+            if escalation is None:
+                counters["accepted"] += 1
+            else:
+                counters[escalation] += 1
+
+        registry = metrics.registry
+        if registry is not None:
+            registry.observe("cascade_call_seconds", seconds, tier=tier.name, phase=phase)
+            registry.inc("cascade_cost_total", cost, tier=tier.name)
+            if escalation is not None:
+                registry.inc("cascade_escalations_total", tier=tier.name, phase=phase, reason=escalation)
+
+    def record_game(self, tier_names: List[str], won: bool) -> None:
+        """
+        Records the outcome of a game for the tiers whose actions an agent played in it.
+
+        Args:
+            tier_names (List[str]): The names of the tiers.
+            won (bool): Whether the agent won.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for tier_name in tier_names:
+                counters = self._counters(tier_name)
+                counters["games"] += 1
+                counters["wins"] += won
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the counters of every tier with derived rates.
+
+        Returns:
+            Dict[str, Dict[str, float]]: Per tier, the counters plus the mean latency, the escalation rate and the
+                win rate.
+        """
+        with self._lock:
+            summary = {}
+            for tier_name, counters in self.tiers.items():
+                calls = counters["calls"]
+                summary[tier_name] = {
+                    **counters,
+                    "mean_seconds": counters["seconds"] / calls if calls else 0.0,
+                    "escalation_rate": (calls - counters["accepted"]) / calls if calls else 0.0,
+                    "win_rate": counters["wins"] / counters["games"] if counters["games"] else 0.0,
+                }
+            return summary
+
+    def _counters(self, tier_name: str) -> Dict[str, float]:
+        counters = self.tiers.get(tier_name)
+        if counters is None:
+            counters = dict.fromkeys(
+                ["calls", "accepted", "parse_failure", "low_confidence", "seconds", "prompt_tokens",
+                 "completion_tokens", "cost", "games", "wins"],
+                0,
+            )
+            self.tiers[tier_name] = counters
+        return counters
+
+
+class CascadeAgent(OutlinesAgent):
+    """
+    Agent trying a cheap model first and escalating to more expensive ones when its action is not good enough.
+
+    An action is escalated to the next tier when it cannot be parsed, or when the confidence of the model is below
+    the min_confidence of the phase. The action of the last tier is always accepted. A phase can also start at a
+    later tier, e.g. to always vote with the expensive model.
+
+    Attributes:
+        name (str): The name of the agent.
+        tiers (List[Tier]): The models, from the cheapest to the most expensive.
+        policy (Dict[str, PhasePolicy]): The escalation policy per phase name.
+        default_policy (PhasePolicy): The escalation policy of the phases left out of policy.
+        stats (CascadeStats): The counters of the tiers.
+    """
+    def __init__(
+        self,
+        name: str,
+        tiers: List[Tier],
+        policy: Optional[Dict[Union[GamePhase, str], PhasePolicy]] = None,
+        default_policy: Optional[PhasePolicy] = None,
+        stats: Optional[CascadeStats] = None,
+        history_compactor: Optional[HistoryCompactor] = None,
+        stop_at: Optional[List[str]] = None,
+        constrained: bool = False,
+        phase_max_tokens: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """
+        Initializes a new CascadeAgent instance.
+
+        Args:
+            name (str): The name of the agent.
+            tiers (List[Tier]): The models, from the cheapest to the most expensive.
+            policy (Optional[Dict[Union[GamePhase, str], PhasePolicy]]): The escalation policy per phase, e.g.
+                {GamePhase.VOTING: PhasePolicy(first_tier=1)}. Defaults to None, which uses default_policy.
+            default_policy (Optional[PhasePolicy]): The escalation policy of the phases left out of policy.
+                Defaults to None, which only escalates actions that cannot be parsed.
+            stats (Optional[CascadeStats]): The counters of the tiers, shared with other agents. Defaults to None,
+                which creates counters for this agent.
+            history_compactor (Optional[HistoryCompactor]): Compacts the message history to a token budget.
+                Defaults to None.
+            stop_at (Optional[List[str]]): Stop sequences passed to the llms. Defaults to None.
+            constrained (bool): Whether votes and guesses are constrained, as in OutlinesAgent. Defaults to False.
+            phase_max_tokens (Optional[Dict[str, int]]): The maximum number of generated tokens per phase name.
+                Defaults to None.
+
+        Returns:
+            None
+        """
+        super().__init__(
+            name,
+            tiers[-1].llm,
+            reuse_prefix=tiers[-1].reuse_prefix,
+            history_compactor=history_compactor,
+            stop_at=stop_at,
+            constrained=constrained,
+            phase_max_tokens=phase_max_tokens,
+        )
+        for tier in tiers[:-1]:
+            self._check_llm(tier.llm, tier.reuse_prefix)
+        self.tiers = tiers
+        self.policy = {getattr(phase, "name", phase): phase_policy for phase, phase_policy in (policy or {}).items()}
+        self.default_policy = default_policy or PhasePolicy()
+        self.stats = stats or CascadeStats()
+        self._tiers_used = set()
+        self._num_seen = 0
+
+    def act(self, message_history: List[str], phase: str) -> str:
+        """
+        Perform an action based on the given message history and phase, escalating through the tiers.
+
+        Args:
+            message_history (List[str]): A list of previous messages.
+            phase (str): The current phase of the agent.
+
+        Returns:
+            str: The action to be taken by the agent.
+        """
+        if len(message_history) < self._num_seen:
+            # A new game started with the same agent
+            self._tiers_used = set()
+        self._num_seen = len(message_history)
+
+        phase_policy = self.policy.get(phase, self.default_policy)
+        llm_kwargs = self._llm_kwargs(message_history, phase)
+        prompt = self._build_prompt(message_history, phase)
+        prompt_tokens = metrics.count_tokens(prompt)
+        last_tier = len(self.tiers) - 1
+        for index in range(min(phase_policy.first_tier, last_tier), last_tier + 1):
+            tier = self.tiers[index]
+            needs_confidence = index < last_tier and phase_policy.min_confidence > 0
+            start = time.perf_counter()
+            raw_action, confidence = self._complete_with_confidence(tier, prompt, llm_kwargs, needs_confidence)
+            seconds = time.perf_counter() - start
+            action = self._parse_action(raw_action, llm_kwargs)
+
+            escalation = None
+            if index < last_tier:
+                if action is None:
+                    escalation = "parse_failure"
+                elif confidence < phase_policy.min_confidence:
+                    escalation = "low_confidence"
+            self.stats.record_call(
+                tier, phase, seconds, prompt_tokens, metrics.count_tokens(raw_action), escalation
+            )
+            if escalation is None:
+                break
+
+        self._tiers_used.add(tier.name)
+        if action is None:
+            action = "I have nothing to say."
+            if metrics.registry is not None:
+                metrics.registry.inc("parse_failures_total", phase=phase)
+        return action
+
+    def record_outcome(self, won: bool) -> None:
+        """
+        Credits the outcome of the current game to the tiers whose actions the agent played in it.
+
+        Called once per game by tournament.play_game, tournament.aplay_game and the game server when the game ends.
+
+        Args:
+            won (bool): Whether the agent won.
+
+        Returns:
+            None
+        """
+        self.stats.record_game(sorted(self._tiers_used), won)
+        self._tiers_used = set()
+
+    def _complete_with_confidence(
+        self, tier: Tier, prompt: str, llm_kwargs: Dict[str, Any], needs_confidence: bool
+    ) -> Tuple[str, float]:
+        """
+        Generates the raw action of a prompt with a tier, with the confidence of its llm if needed and available.
+
+        Args:
+            tier (Tier): The tier.
+            prompt (str): The prompt.
+            llm_kwargs (Dict[str, Any]): The keyword arguments of the llm call.
+            needs_confidence (bool): Whether the confidence is used.
+
+        Returns:
+            Tuple[str, float]: The raw action and the confidence, 1.0 if it is not needed or the llm does not provide it.
+        """
+        llm = tier.llm
+        if needs_confidence and tier.reuse_prefix and hasattr(llm, "complete_with_confidence"):
+            prefix, tail = _split_prompt(prompt)
+            return llm.complete_with_confidence(self, prefix, tail, **llm_kwargs)
+        if needs_confidence and not tier.reuse_prefix and hasattr(llm, "generate_with_confidence"):
+            return llm.generate_with_confidence(prompt, **llm_kwargs)
+        return self._complete(llm, prompt, llm_kwargs, tier.reuse_prefix), 1.0
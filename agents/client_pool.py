@@ -0,0 +1,255 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Callable, List, Optional
+
+# Exception class names raised by LLM clients for transient failures (e.g. openai.RateLimitError)
+RETRYABLE_ERROR_NAMES = ("RateLimit", "Timeout", "APIConnection", "ServiceUnavailable", "InternalServerError")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at a constant rate.
+
+    Attributes:
+        rate (float): The number of tokens added per second.
+        capacity (float): The maximum number of tokens in the bucket.
+    """
+    def __init__(self, per_minute: float, capacity: Optional[float] = None) -> None:
+        """
+        Initializes a full TokenBucket object.
+
+        Args:
+            per_minute (float): The number of tokens added per minute.
+            capacity (Optional[float]): The maximum number of tokens in the bucket. Defaults to None, which allows
+                a burst of one minute worth of tokens.
+
+        Returns:
+            None
+        """
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> None:
+        """
+        Takes tokens from the bucket, waiting until enough are available.
+
+        Amounts larger than the capacity wait for a full bucket and leave it empty.
+
+        Args:
+            amount (float): The number of tokens. Defaults to 1.
+
+        Returns:
+            None
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait_time = (amount - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check if an error from an LLM client is transient, so that the request can be retried.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        bool: True for rate limits, timeouts, connection errors and server errors, False otherwise.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    if isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError)):
+        return True
+    return any(name in type(error).__name__ for name in RETRYABLE_ERROR_NAMES)
+
+
+class ClientPool:
+    """
+    Shared, rate limited front for an LLM backend used by many agents and games.
+
+    Requests wait for the requests per minute and tokens per minute buckets, at most max_in_flight requests
+    run at the same time, and transient errors are retried with jittered exponential backoff. The pool is a
+    callable with the same interface as the wrapped llm, so it can be passed as the llm of every OutlinesAgent.
+
+    Attributes:
+        llm (Callable[..., str]): The wrapped llm.
+        request_bucket (Optional[TokenBucket]): The requests per minute limit, or None.
+        token_bucket (Optional[TokenBucket]): The tokens per minute limit, or None.
+        max_retries (int): The maximum number of retries of a request.
+        base_delay (float): The backoff delay in seconds before the first retry.
+        max_delay (float): The maximum backoff delay in seconds.
+        max_output_tokens (int): The output tokens counted against the tokens per minute limit for each request.
+        count_tokens (Callable[[str], int]): Counts the tokens of a prompt.
+        num_requests (int): The number of requests sent, including retries.
+        num_retries (int): The number of retries.
+        accepted_kwargs (Optional[FrozenSet[str]]): The keyword arguments accepted by the wrapped llm, or None if
+            it does not declare them.
+    """
+    def __init__(
+        self,
+        llm: Callable[..., str],
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_in_flight: int = 8,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        max_output_tokens: int = 50,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ) -> None:
+        """
+        Initializes a ClientPool object.
+
+        Args:
+            llm (Callable[..., str]): The wrapped llm.
+            requests_per_minute (Optional[float]): The requests per minute limit. Defaults to None, which is unlimited.
+            tokens_per_minute (Optional[float]): The tokens per minute limit. Defaults to None, which is unlimited.
+            max_in_flight (int): The maximum number of concurrent requests. Defaults to 8.
+            max_retries (int): The maximum number of retries of a request. Defaults to 5.
+            base_delay (float): The backoff delay in seconds before the first retry. Defaults to 1.0.
+            max_delay (float): The maximum backoff delay in seconds. Defaults to 60.0.
+            max_output_tokens (int): The output tokens counted for each request, i.e. the max_tokens of the llm. Defaults to 50.
+            count_tokens (Optional[Callable[[str], int]]): Counts the tokens of a prompt. Defaults to None, which
+                estimates 4 characters per token.
+
+        Returns:
+            None
+        """
+        self.llm = llm
+        self.accepted_kwargs = getattr(llm, "accepted_kwargs", None)
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_output_tokens = max_output_tokens
+        self.count_tokens = count_tokens or (lambda prompt: len(prompt) // 4)
+        self.num_requests = 0
+        self.num_retries = 0
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt: str, **kwargs: Any) -> str:
+        """
+        Sends a prompt to the llm once the rate limits allow it, retrying transient errors.
+
+        Args:
+            prompt (str): The prompt.
+            **kwargs (Any): Extra keyword arguments of the llm, e.g. stop_at. A max_tokens argument replaces
+                max_output_tokens in the tokens counted for the request.
+
+        Returns:
+            str: The completion.
+        """
+        num_tokens = self.count_tokens(prompt) + kwargs.get("max_tokens", self.max_output_tokens)
+        for attempt in range(self.max_retries + 1):
+            if self.request_bucket:
+                self.request_bucket.acquire(1)
+            if self.token_bucket:
+                self.token_bucket.acquire(num_tokens)
+
+            with self._in_flight:
+                with self._lock:
+                    self.num_requests += 1
+                try:
+                    return self.llm(prompt, **kwargs)
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+
+            with self._lock:
+                self.num_retries += 1
+            # Full jitter keeps many agents backing off at the same time from retrying in lockstep
+            time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+
+class HTTPCompletionClient:
+    """
+    Minimal client for an OpenAI compatible /completions endpoint, e.g. a local server or a stub in tests.
+
+    Attributes:
+        base_url (str): The base URL of the API, e.g. "http://localhost:8000/v1".
+        model_name (str): The name of the model.
+        max_tokens (int): The maximum number of generated tokens.
+        temperature (float): The sampling temperature.
+        api_key (Optional[str]): The API key sent as a bearer token, or None.
+        timeout (float): The request timeout in seconds.
+        accepted_kwargs (FrozenSet[str]): The keyword arguments of a call.
+    """
+    accepted_kwargs = frozenset({"stop_at", "max_tokens"})
+
+    def __init__(
+        self,
+        base_url: str,
+        model_name: str,
+        max_tokens: int = 50,
+        temperature: float = 1.0,
+        api_key: Optional[str] = None,
+        timeout: float = 60.0,
+    ) -> None:
+        """
+        Initializes an HTTPCompletionClient object.
+
+        Args:
+            base_url (str): The base URL of the API, e.g. "http://localhost:8000/v1".
+            model_name (str): The name of the model.
+            max_tokens (int): The maximum number of generated tokens. Defaults to 50.
+            temperature (float): The sampling temperature. Defaults to 1.0.
+            api_key (Optional[str]): The API key sent as a bearer token. Defaults to None.
+            timeout (float): The request timeout in seconds. Defaults to 60.0.
+
+        Returns:
+            None
+        """
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def __call__(self, prompt: str, stop_at: Optional[List[str]] = None, max_tokens: Optional[int] = None) -> str:
+        """
+        Sends a completion request.
+
+        Args:
+            prompt (str): The prompt.
+            stop_at (Optional[List[str]]): Stop sequences. Defaults to None.
+            max_tokens (Optional[int]): The maximum number of generated tokens. Defaults to None, which uses
+                the max_tokens of the client.
+
+        Returns:
+            str: The completion.
+        """
+        body = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature,
+        }
+        if stop_at:
+            body["stop"] = stop_at
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        request = urllib.request.Request(
+            f"{self.base_url}/completions", data=json.dumps(body).encode("utf-8"), headers=headers
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())["choices"][0]["text"]
@@ -0,0 +1,34 @@
+from typing import Any, Callable, List
+
+
+def choice_allowed_tokens(tokenizer: Any, choices: List[str], prompt_length: int) -> Callable[[int, Any], List[int]]:
+    """
+    Creates a prefix_allowed_tokens_fn for transformers' model.generate that constrains the completion to a choice.
+
+    At every step, only the tokens continuing one of the choices are allowed, and the end of sequence token once
+    a choice is complete, so the completion is one of the choices whatever the model prefers. This is the is_in
+    argument of the outlines models, for local transformers backends.
+
+    Args:
+        tokenizer (Any): The tokenizer of the model.
+        choices (List[str]): The choices.
+        prompt_length (int): The number of tokens of the (padded) prompts, after which the completion starts.
+
+    Returns:
+        Callable[[int, Any], List[int]]: The function returning the allowed tokens of a sequence.
+    """
+    sequences = [tokenizer(choice, add_special_tokens=False).input_ids for choice in choices]
+    eos_token_id = tokenizer.eos_token_id
+
+    def allowed_tokens(batch_id: int, input_ids: Any) -> List[int]:
+        generated = input_ids[prompt_length:].tolist()
+        allowed = {
+            sequence[len(generated)] for sequence in sequences
+            if len(sequence) > len(generated) and sequence[:len(generated)] == generated
+        }
+        if generated in sequences:
+            allowed.add(eos_token_id)
+        # A sequence past its choice, e.g. padding in a batch, can only end
+        return sorted(allowed) or [eos_token_id]
+
+    return allowed_tokens
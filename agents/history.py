@@ -0,0 +1,200 @@
+from typing import Dict, List, Tuple
+
+# Moderator messages announcing a phase, followed by the instructions of the phase
+PHASE_ANNOUNCEMENT_PREFIX = "Moderator: Game enters "
+ROUND_START_PREFIX = "Moderator: Game enters description phase"
+
+
+class HistoryCompactor:
+    """
+    Compacts an agent's message history to fit in a token budget.
+
+    Within budget the history is left untouched. Past the budget, the phase instructions repeated by the
+    moderator every round are shortened after their first occurrence, then completed rounds are collapsed
+    into one summary message each, oldest first. The messages before the first round (the role and keyword
+    announcements) and the most recent rounds are always kept verbatim.
+
+    A compactor follows the history of one agent. Its token counts are memoized per message and, like its
+    counters, cleared when a new game starts, i.e. when the history gets shorter.
+
+    Attributes:
+        max_tokens (int): The token budget of the message history.
+        keep_recent_rounds (int): The number of most recent rounds, including the current one, kept verbatim.
+        tokens_before (int): The total number of history tokens before compaction, over the calls of the game.
+        tokens_after (int): The total number of history tokens after compaction, over the calls of the game.
+    """
+    def __init__(self, max_tokens: int = 1500, keep_recent_rounds: int = 2, encoding_name: str = "cl100k_base") -> None:
+        """
+        Initializes a HistoryCompactor object.
+
+        Args:
+            max_tokens (int): The token budget of the message history. Defaults to 1500.
+            keep_recent_rounds (int): The number of most recent rounds kept verbatim. Defaults to 2.
+            encoding_name (str): The tiktoken encoding used to count tokens. Defaults to "cl100k_base".
+
+        Returns:
+            None
+        """
+        self.max_tokens = max_tokens
+        self.keep_recent_rounds = keep_recent_rounds
+        self.tokens_before = 0
+        self.tokens_after = 0
+        # Imported here so that importing the agents does not load tiktoken unless a compactor is used
+        import tiktoken
+
+        self._encoding = tiktoken.get_encoding(encoding_name)
+        self._num_tokens = {}
+        self._num_seen = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        """
+        The total number of history tokens removed by compaction, over the calls of the game.
+        """
+        return self.tokens_before - self.tokens_after
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Returns the token counters.
+
+        Returns:
+            Dict[str, int]: The counters.
+        """
+        return {"tokens_before": self.tokens_before, "tokens_after": self.tokens_after, "tokens_saved": self.tokens_saved}
+
+    def reset(self) -> None:
+        """
+        Clears the counters and the memoized token counts, e.g. before a new game.
+
+        Returns:
+            None
+        """
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._num_tokens = {}
+        self._num_seen = 0
+
+    def compact(self, message_history: List[str]) -> List[str]:
+        """
+        Compacts the message history if it exceeds the token budget.
+
+        Args:
+            message_history (List[str]): A list of previous messages.
+
+        Returns:
+            List[str]: The compacted message history. It may still exceed the budget if the verbatim parts do.
+        """
+        if len(message_history) < self._num_seen:
+            # A new game started with the same agent
+            self.reset()
+        self._num_seen = len(message_history)
+
+        num_tokens = self.count_tokens(message_history)
+        self.tokens_before += num_tokens
+        if num_tokens > self.max_tokens:
+            message_history = self._deduplicate_announcements(message_history)
+            num_tokens = self.count_tokens(message_history)
+
+        if num_tokens > self.max_tokens:
+            preamble, rounds = self._split_rounds(message_history)
+            num_collapsible = max(0, len(rounds) - self.keep_recent_rounds)
+            for i in range(num_collapsible):
+                rounds[i] = [self._summarize_round(i + 1, rounds[i])]
+                message_history = preamble + [message for messages in rounds for message in messages]
+                num_tokens = self.count_tokens(message_history)
+                if num_tokens <= self.max_tokens:
+                    break
+
+        self.tokens_after += num_tokens
+        return message_history
+
+    def count_tokens(self, message_history: List[str]) -> int:
+        """
+        Counts the tokens of a message history.
+
+        Args:
+            message_history (List[str]): A list of messages.
+
+        Returns:
+            int: The number of tokens.
+        """
+        total = 0
+        for message in message_history:
+            if message not in self._num_tokens:
+                self._num_tokens[message] = len(self._encoding.encode(message))
+            total += self._num_tokens[message]
+        return total
+
+    def _deduplicate_announcements(self, message_history: List[str]) -> List[str]:
+        """
+        Shortens repeated phase announcements to their first sentence.
+
+        Args:
+            message_history (List[str]): A list of messages.
+
+        Returns:
+            List[str]: The messages with repeated announcements shortened.
+        """
+        seen = set()
+        messages = []
+        for message in message_history:
+            if message.startswith(PHASE_ANNOUNCEMENT_PREFIX):
+                if message in seen:
+                    message = message.split(". ")[0] + "."
+                else:
+                    seen.add(message)
+            messages.append(message)
+        return messages
+
+    def _split_rounds(self, message_history: List[str]) -> Tuple[List[str], List[List[str]]]:
+        """
+        Splits a message history into the messages before the first round and the messages of each round.
+
+        Args:
+            message_history (List[str]): A list of messages.
+
+        Returns:
+            Tuple[List[str], List[List[str]]]: The preamble messages and the messages of each round.
+        """
+        preamble = []
+        rounds = []
+        for message in message_history:
+            if message.startswith(ROUND_START_PREFIX):
+                rounds.append([])
+            (rounds[-1] if rounds else preamble).append(message)
+        return preamble, rounds
+
+    def _summarize_round(self, round_number: int, messages: List[str]) -> str:
+        """
+        Collapses the messages of a completed round into a single summary message.
+
+        The summary keeps the descriptions, the agent's own votes and the moderator's outcome announcements.
+        Discussion messages are dropped.
+
+        Args:
+            round_number (int): The number of the round, starting at 1.
+            messages (List[str]): The messages of the round.
+
+        Returns:
+            str: The summary message.
+        """
+        descriptions = []
+        votes = []
+        outcomes = []
+        phase = None
+        for message in messages:
+            if message.startswith(PHASE_ANNOUNCEMENT_PREFIX):
+                phase = message[len(PHASE_ANNOUNCEMENT_PREFIX):].split(" ")[0]
+            elif message.startswith("Moderator: "):
+                outcomes.append(message[len("Moderator: "):])
+            elif phase == "description":
+                descriptions.append(message)
+            elif phase in ("voting", "guessing"):
+                votes.append(message)
+
+        summary = f"Moderator: Summary of round {round_number}. Descriptions: {' | '.join(descriptions)}."
+        if votes:
+            summary += f" Your vote: {' | '.join(votes)}."
+        if outcomes:
+            summary += f" {' '.join(outcomes)}"
+        return summary
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class CachedLLM:
+    """
+    Prompt to response cache in front of an llm callable, e.g. the llm of an OutlinesAgent.
+
+    Responses are kept in an in-memory LRU backed by an SQLite file on disk, so reruns of an experiment
+    (or replays of a tournament) do not call the model again. Entries are keyed by the model identity,
+    the sampling parameters and the prompt. Sampled responses are reused as they are, so the cache is meant
+    for reproducible reruns rather than for drawing fresh samples.
+
+    The total size on disk is kept as a running count, read again from the file only when it exceeds the limit.
+    Hits are recorded in memory and written to the file before the next eviction, so that entries served from
+    memory are not evicted from disk as if they were unused.
+
+    Attributes:
+        llm (Callable[[str], str]): The wrapped llm.
+        model_id (str): The identity of the model, e.g. "openai/gpt-4".
+        sampling_params (Dict[str, Any]): The sampling parameters of the llm, e.g. max_tokens and temperature.
+        max_memory_entries (int): The maximum number of responses kept in memory.
+        max_disk_bytes (int): The maximum total size of the responses kept on disk.
+        memory_hits (int): The number of calls answered from memory.
+        disk_hits (int): The number of calls answered from disk.
+        misses (int): The number of calls forwarded to the llm.
+        accepted_kwargs (Optional[FrozenSet[str]]): The keyword arguments accepted by the wrapped llm, or None if
+            it does not declare them.
+    """
+    def __init__(
+        self,
+        llm: Callable[[str], str],
+        model_id: str,
+        sampling_params: Optional[Dict[str, Any]] = None,
+        path: Optional[str] = None,
+        max_memory_entries: int = 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        """
+        Initializes a CachedLLM object.
+
+        Args:
+            llm (Callable[[str], str]): The wrapped llm.
+            model_id (str): The identity of the model, e.g. "openai/gpt-4".
+            sampling_params (Optional[Dict[str, Any]]): The sampling parameters of the llm. Defaults to None.
+            path (Optional[str]): The path of the SQLite file. Defaults to None, which only caches in memory.
+            max_memory_entries (int): The maximum number of responses kept in memory. Defaults to 1024.
+            max_disk_bytes (int): The maximum total size of the responses kept on disk. Defaults to 256 MiB.
+
+        Returns:
+            None
+        """
+        self.llm = llm
+        self.accepted_kwargs = getattr(llm, "accepted_kwargs", None)
+        self.model_id = model_id
+        self.sampling_params = sampling_params or {}
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_size = 0
+        # Time of the last hit of the entries used since the last write, by key
+        self._last_used = {}
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, response TEXT, size INTEGER, last_used REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+            self._db.commit()
+            self._disk_size = self._read_disk_size()
+
+    def __call__(self, prompt: str, **kwargs: Any) -> str:
+        """
+        Returns the cached response to the prompt, calling the llm on a miss.
+
+        Args:
+            prompt (str): The prompt.
+            **kwargs (Any): Extra keyword arguments of the llm, e.g. stop_at. They are part of the cache key.
+
+        Returns:
+            str: The response.
+        """
+        key = self._key(prompt, kwargs)
+        with self._lock:
+            response = self._get(key)
+        if response is not None:
+            return response
+
+        response = self.llm(prompt, **kwargs)
+        with self._lock:
+            self.misses += 1
+            self._put(key, response)
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters.
+
+        Returns:
+            Dict[str, int]: The counters.
+        """
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+    def close(self) -> None:
+        """
+        Writes the pending hits and closes the SQLite file.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._db is not None:
+                self._write_last_used()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def _key(self, prompt: str, kwargs: Dict[str, Any]) -> str:
+        """
+        Computes the cache key of a prompt.
+
+        Args:
+            prompt (str): The prompt.
+            kwargs (Dict[str, Any]): Extra keyword arguments of the llm call.
+
+        Returns:
+            str: The cache key.
+        """
+        payload = json.dumps([self.model_id, self.sampling_params, kwargs, prompt], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        """
+        Looks up a key in memory, then on disk.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[str]: The cached response, or None on a miss.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            if self._db is not None:
+                self._last_used[key] = time.time()
+            return self._memory[key]
+
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT response FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._last_used[key] = time.time()
+        self.disk_hits += 1
+        self._remember(key, row[0])
+        return row[0]
+
+    def _put(self, key: str, response: str) -> None:
+        """
+        Stores a response in memory and on disk, evicting the least recently used entries past the limits.
+
+        Args:
+            key (str): The cache key.
+            response (str): The response.
+
+        Returns:
+            None
+        """
+        self._remember(key, response)
+        if self._db is None:
+            return
+
+        size = len(response.encode("utf-8"))
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO cache (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, response, size, time.time()),
+        )
+        if cursor.rowcount:
+            self._disk_size += size
+        else:
+            # Stored meanwhile, e.g. by another thread that missed the same prompt
+            self._last_used[key] = time.time()
+
+        if self._disk_size > self.max_disk_bytes or len(self._last_used) >= self.max_memory_entries:
+            self._write_last_used()
+        if self._disk_size > self.max_disk_bytes:
+            # Other processes may write to the same file, so the total is read again before evicting
+            self._disk_size = self._read_disk_size()
+            evicted = []
+            for evicted_key, evicted_size in self._db.execute("SELECT key, size FROM cache ORDER BY last_used"):
+                if self._disk_size <= self.max_disk_bytes:
+                    break
+                evicted.append((evicted_key,))
+                self._disk_size -= evicted_size
+            self._db.executemany("DELETE FROM cache WHERE key = ?", evicted)
+        self._db.commit()
+
+    def _read_disk_size(self) -> int:
+        """
+        Reads the total size of the responses on disk.
+
+        Returns:
+            int: The size in bytes.
+        """
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def _write_last_used(self) -> None:
+        """
+        Writes the time of the last hit of the entries used since the last write, without committing.
+
+        Returns:
+            None
+        """
+        if self._last_used:
+            self._db.executemany(
+                "UPDATE cache SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._last_used.items()],
+            )
+            self._last_used = {}
+
+    def _remember(self, key: str, response: str) -> None:
+        """
+        Stores a response in the in-memory LRU.
+
+        Args:
+            key (str): The cache key.
+            response (str): The response.
+
+        Returns:
+            None
+        """
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
@@ -1,8 +1,15 @@
-from typing import Callable, List
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import bs4
 import outlines.text as text
+
+import metrics
 from .agent import Agent
+from .history import HistoryCompactor
+from .parsing import AliveAgentTracker, extract_tag
+
+# Stop sequences of a constrained guess: the keyword ends with its tag or its line
+GUESS_STOP_AT = ["</message>", "\n"]
 
 
 @text.prompt
@@ -26,6 +33,22 @@ def build_prompt(name: str, message_history: List[str], phase: str):
     {{name}}:"""
 
 
+def _split_prompt(prompt: str) -> Tuple[str, str]:
+    """
+    Split a prompt rendered by build_prompt into the append-only header and message history, and the phase note.
+
+    Trailing whitespace of the history goes to the tail, so the prefix of a later turn extends the prefix of an earlier one.
+
+    Args:
+        prompt (str): The prompt rendered by build_prompt.
+
+    Returns:
+        Tuple[str, str]: The prefix and the tail of the prompt.
+    """
+    prefix = prompt[:prompt.rindex("Note:")].rstrip()
+    return prefix, prompt[len(prefix):]
+
+
 class OutlinesAgent(Agent):
     """
     Agent that uses the outlines model to generate responses.
@@ -33,20 +56,58 @@ class OutlinesAgent(Agent):
     Attributes:
         name (str): The name of the agent.
         llm (Callable): The outlines model.
+        reuse_prefix (bool): Whether the llm reuses the encoded prompt prefix between turns.
+        history_compactor (Optional[HistoryCompactor]): Compacts the message history to a token budget, or None.
+        stop_at (Optional[List[str]]): Stop sequences passed to the llm, or None.
+        constrained (bool): Whether votes are chosen among the alive agents and guesses are bounded strings.
+        phase_max_tokens (Dict[str, int]): The maximum number of generated tokens per phase name.
     """
-    def __init__(self, name: str, llm: Callable) -> None:
+    def __init__(
+        self,
+        name: str,
+        llm: Callable,
+        reuse_prefix: bool = False,
+        history_compactor: Optional[HistoryCompactor] = None,
+        stop_at: Optional[List[str]] = None,
+        constrained: bool = False,
+        phase_max_tokens: Optional[Dict[str, int]] = None,
+    ) -> None:
         """
         Initializes a new Agent instance.
 
         Args:
             name (str): The name of the agent.
             llm (Callable): The outlines model.
+            reuse_prefix (bool): Whether the llm reuses the encoded prompt prefix between turns. The llm must then
+                provide complete(key, prefix, tail), e.g. agents.prefix_cache.PrefixCachingLLM. Defaults to False.
+            history_compactor (Optional[HistoryCompactor]): Compacts the message history to a token budget before
+                the prompt is built. Defaults to None, which keeps the full history.
+            stop_at (Optional[List[str]]): Stop sequences passed to the llm as stop_at, e.g. ["</message>"] to stop
+                generating once the message is closed. Defaults to None, which generates up to the token limit.
+            constrained (bool): Whether to constrain the generation per phase: in VOTING, the llm chooses among the
+                alive agents seen in the message history through is_in, and in GUESSING, the keyword stops at the
+                end of its tag or line. The llm must then accept is_in and stop_at, like the outlines OpenAI
+                completion models, PrefixCachingLLM, or a BatchScheduler of transformers_generate_batch.
+                llms declaring the keyword arguments they accept in an accepted_kwargs attribute, like the llm
+                wrappers of this package, are checked here; others are assumed to accept them.
+                Defaults to False, which generates free text in every phase.
+            phase_max_tokens (Optional[Dict[str, int]]): The maximum number of generated tokens per phase name,
+                e.g. {"VOTING": 5, "GUESSING": 10}, passed to the llm as max_tokens. The llm must then accept
+                max_tokens, unlike the outlines OpenAI completion models, which take it when they are created.
+                Phases left out use the limit of the llm. Defaults to None.
 
         Returns:
             None
         """
         super().__init__(name)
         self.llm = llm
+        self.reuse_prefix = reuse_prefix
+        self.history_compactor = history_compactor
+        self.stop_at = stop_at
+        self.constrained = constrained
+        self.phase_max_tokens = phase_max_tokens or {}
+        self._tracker = AliveAgentTracker(name)
+        self._check_llm(llm, reuse_prefix)
 
     def act(self, message_history: List[str], phase: str) -> str:
         """
@@ -59,16 +120,129 @@ class OutlinesAgent(Agent):
         Returns:
             str: The action to be taken by the agent.
         """
-        prompt = build_prompt(name=self.name, message_history=message_history, phase=phase)
-        raw_action = self.llm(prompt)
-        parsed_result = self._parse_raw_action(raw_action, tag="message")
-        if parsed_result:
-            action = parsed_result.text
-        else:
+        llm_kwargs = self._llm_kwargs(message_history, phase)
+        prompt = self._build_prompt(message_history, phase)
+        start = time.perf_counter()
+        raw_action = self._complete(self.llm, prompt, llm_kwargs, self.reuse_prefix)
+        registry = metrics.registry
+        if registry is not None:
+            registry.observe("llm_call_seconds", time.perf_counter() - start, phase=phase)
+            registry.inc("prompt_tokens_total", metrics.count_tokens(prompt), phase=phase)
+            registry.inc("completion_tokens_total", metrics.count_tokens(raw_action), phase=phase)
+
+        action = self._parse_action(raw_action, llm_kwargs)
+        if action is None:
             action = "I have nothing to say."
+            if registry is not None:
+                registry.inc("parse_failures_total", phase=phase)
         return action
 
-    def _parse_raw_action(self, raw_action: str, tag: str = "message") -> bs4.element.Tag:
+    def _build_prompt(self, message_history: List[str], phase: str) -> str:
+        """
+        Builds the prompt of a turn, after compacting the message history if a compactor is set.
+
+        Args:
+            message_history (List[str]): A list of previous messages.
+            phase (str): The current phase of the agent.
+
+        Returns:
+            str: The prompt.
+        """
+        if self.history_compactor is not None:
+            message_history = self.history_compactor.compact(message_history)
+        return build_prompt(name=self.name, message_history=message_history, phase=phase)
+
+    def _complete(self, llm: Callable, prompt: str, llm_kwargs: Dict[str, Any], reuse_prefix: bool) -> str:
+        """
+        Generates the raw action of a prompt, reusing the encoded prompt prefix if enabled.
+
+        Args:
+            llm (Callable): The outlines model.
+            prompt (str): The prompt.
+            llm_kwargs (Dict[str, Any]): The keyword arguments of the llm call.
+            reuse_prefix (bool): Whether the llm reuses the encoded prompt prefix between turns.
+
+        Returns:
+            str: The raw action.
+        """
+        if reuse_prefix:
+            prefix, tail = _split_prompt(prompt)
+            return llm.complete(self, prefix, tail, **llm_kwargs)
+        return llm(prompt, **llm_kwargs)
+
+    def _parse_action(self, raw_action: str, llm_kwargs: Dict[str, Any]) -> Optional[str]:
+        """
+        Extracts the action from a raw action generated with the keyword arguments of a phase.
+
+        Args:
+            raw_action (str): The raw action.
+            llm_kwargs (Dict[str, Any]): The keyword arguments of the llm call.
+
+        Returns:
+            Optional[str]: The action, or None if the raw action cannot be parsed.
+        """
+        choices = llm_kwargs.get("is_in")
+        if choices and raw_action.strip() in choices:
+            return raw_action.strip()
+        return self._parse_raw_action(raw_action, tag="message") or None
+
+    def _llm_kwargs(self, message_history: List[str], phase: str) -> Dict[str, Any]:
+        """
+        Returns the keyword arguments of the llm call of a phase.
+
+        Args:
+            message_history (List[str]): A list of previous messages, before compaction.
+            phase (str): The current phase of the agent.
+
+        Returns:
+            Dict[str, Any]: The keyword arguments, e.g. stop_at, is_in and max_tokens.
+        """
+        llm_kwargs = {"stop_at": self.stop_at} if self.stop_at else {}
+        if self.constrained:
+            # Always read the history, so that eliminations announced in other phases are not missed
+            alive_agents = self._tracker.update(message_history)
+            if phase == "VOTING" and alive_agents:
+                llm_kwargs = {"is_in": list(alive_agents)}
+            elif phase == "GUESSING":
+                llm_kwargs = {"stop_at": GUESS_STOP_AT}
+        max_tokens = self.phase_max_tokens.get(phase)
+        if max_tokens is not None:
+            llm_kwargs["max_tokens"] = max_tokens
+        return llm_kwargs
+
+    def _check_llm(self, llm: Callable, reuse_prefix: bool) -> None:
+        """
+        Checks that an llm supports the calls of the agent, so that options it does not support fail here rather
+        than at the first vote.
+
+        The keyword arguments are checked against the accepted_kwargs attribute of the llm, if it declares one.
+
+        Args:
+            llm (Callable): The outlines model.
+            reuse_prefix (bool): Whether the agent reuses the encoded prompt prefix with this llm.
+
+        Returns:
+            None
+        """
+        if reuse_prefix and not callable(getattr(llm, "complete", None)):
+            raise ValueError(
+                f"The llm of {self.name} ({type(llm).__name__}) has no complete method, needed by reuse_prefix=True."
+            )
+        needed = {}
+        if self.stop_at:
+            needed["stop_at"] = "stop_at"
+        if self.constrained:
+            needed["stop_at"] = needed["is_in"] = "constrained=True"
+        if self.phase_max_tokens:
+            needed["max_tokens"] = "phase_max_tokens"
+        accepted = getattr(llm, "accepted_kwargs", None)
+        if accepted is None:
+            return
+        for kwarg, option in needed.items():
+            if kwarg not in accepted:
+                raise ValueError(f"The llm of {self.name} ({type(llm).__name__}) does not accept {kwarg}, needed by {option}.")
+
+    def _parse_raw_action(self, raw_action: str, tag: str = "message") -> Optional[str]:
         """
         Parse the raw action and extract the text content of the tag
 
@@ -77,7 +251,6 @@ class OutlinesAgent(Agent):
             tag (str): The tag to be extracted from the raw action.
 
         Returns:
-            
+            Optional[str]: The text content of the tag, or None if the tag is missing.
         """
-        parser = bs4.BeautifulSoup(raw_action, "html.parser")
-        return parser.find(tag)
\ No newline at end of file
+        return extract_tag(raw_action, tag)
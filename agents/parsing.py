@@ -0,0 +1,100 @@
+import re
+from typing import Dict, List, Optional
+
+# Compiled patterns per tag, e.g. for "message": <message>...</message>, or <message>... until the end of the text
+_TAG_PATTERNS: Dict[str, re.Pattern] = {}
+
+# A closing tag cut off by the token limit or a stop sequence, e.g. "</" or "</mess"
+_PARTIAL_CLOSING_TAG = re.compile(r"<(?:/[A-Za-z]*)?$")
+
+ELIMINATION_PREFIX = "Moderator: Agent "
+ELIMINATION_SUFFIX = " is eliminated."
+
+
+def extract_tag(raw_action: str, tag: str = "message") -> Optional[str]:
+    """
+    Extract the text content of the first tag in a raw action.
+
+    The closing tag may be missing (e.g. generation stopped at it) or cut off, in which case the content
+    runs until the end of the text, without the partial closing tag.
+
+    Args:
+        raw_action (str): A string containing XML tags representing the raw action.
+        tag (str): The tag to be extracted from the raw action.
+
+    Returns:
+        Optional[str]: The stripped text content of the tag, or None if the raw action has no such tag.
+    """
+    pattern = _TAG_PATTERNS.get(tag)
+    if pattern is None:
+        escaped_tag = re.escape(tag)
+        pattern = re.compile(
+            rf"<{escaped_tag}(?:\s[^>]*)?>(.*?)(?:</{escaped_tag}\s*>|$)", re.DOTALL | re.IGNORECASE
+        )
+        _TAG_PATTERNS[tag] = pattern
+
+    match = pattern.search(raw_action)
+    if match is None:
+        return None
+    content = match.group(1)
+    if match.end() == len(raw_action):
+        content = _PARTIAL_CLOSING_TAG.sub("", content)
+    return content.strip()
+
+
+class AliveAgentTracker:
+    """
+    Follows the alive agents of a game from the message history of one agent.
+
+    The other agents are learned from the senders of the messages and dropped once the moderator announces
+    their elimination. Messages are assumed to be appended to the history, as the environment does, so each
+    update only reads the messages not seen yet.
+
+    Attributes:
+        name (str): The name of the agent whose history is read, never counted among the alive agents.
+        alive_agents (List[str]): The other agents seen so far and not eliminated, in order of appearance.
+    """
+    def __init__(self, name: str) -> None:
+        """
+        Initializes an AliveAgentTracker object.
+
+        Args:
+            name (str): The name of the agent whose history is read.
+
+        Returns:
+            None
+        """
+        self.name = name
+        self.alive_agents = []
+        self._known_agents = set()
+        self._num_seen = 0
+
+    def update(self, message_history: List[str]) -> List[str]:
+        """
+        Updates the alive agents with the messages not seen yet.
+
+        Args:
+            message_history (List[str]): The message history of the agent.
+
+        Returns:
+            List[str]: The alive agents.
+        """
+        if len(message_history) < self._num_seen:
+            # A new game started with the same agent
+            self.alive_agents = []
+            self._known_agents = set()
+            self._num_seen = 0
+
+        for message in message_history[self._num_seen:]:
+            sender, _, _ = message.partition(": ")
+            if sender == "Moderator":
+                if message.startswith(ELIMINATION_PREFIX) and message.endswith(ELIMINATION_SUFFIX):
+                    eliminated_agent = message[len(ELIMINATION_PREFIX):-len(ELIMINATION_SUFFIX)]
+                    if eliminated_agent in self.alive_agents:
+                        self.alive_agents.remove(eliminated_agent)
+            elif sender != self.name and sender not in self._known_agents:
+                # Eliminated agents no longer speak, so a set of the agents seen so far is enough
+                self._known_agents.add(sender)
+                self.alive_agents.append(sender)
+        self._num_seen = len(message_history)
+        return self.alive_agents
@@ -0,0 +1,319 @@
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from .constraints import choice_allowed_tokens
+
+
+class _PrefixEntry:
+    """
+    The cached prefix of one agent's prompt.
+
+    Attributes:
+        input_ids (Any): The token ids of the prefix, or None if nothing is encoded.
+        past_key_values (Any): The transformers DynamicCache of the prefix, or None if nothing is encoded.
+    """
+    def __init__(self) -> None:
+        self.input_ids = None
+        self.past_key_values = None
+
+
+class PrefixCachingLLM:
+    """
+    Local transformers backend that keeps the key/value cache of each agent's prompt prefix.
+
+    An agent's prompt is a fixed header followed by its growing message history (the prefix), then a
+    phase-specific note (the tail). Between two turns only new messages are appended to the prefix, so only
+    those are encoded. The tail and the completion extend the cache while generating and are cropped off
+    afterwards, so a change of phase note cannot leave stale state behind and the cache is never copied. A prefix
+    that does not extend the cached one (e.g. after the history is compacted, or in a new game) keeps the tokens
+    it shares with the cached prefix and only encodes the rest.
+
+    Attributes:
+        model (Any): The transformers causal language model.
+        tokenizer (Any): The tokenizer of the model.
+        max_new_tokens (int): The maximum number of generated tokens.
+        max_entries (int): The maximum number of cached prefixes; the least recently used are dropped.
+        generate_kwargs (dict): Extra keyword arguments of model.generate.
+        accepted_kwargs (FrozenSet[str]): The keyword arguments of the generate and complete methods.
+    """
+    accepted_kwargs = frozenset({"stop_at", "max_tokens", "is_in"})
+
+    def __init__(
+        self, model: Any, tokenizer: Any, max_new_tokens: int = 50, max_entries: int = 64, **generate_kwargs: Any
+    ) -> None:
+        """
+        Initializes a PrefixCachingLLM object.
+
+        Args:
+            model (Any): The transformers causal language model.
+            tokenizer (Any): The tokenizer of the model.
+            max_new_tokens (int): The maximum number of generated tokens. Defaults to 50.
+            max_entries (int): The maximum number of cached prefixes. Defaults to 64.
+            **generate_kwargs (Any): Extra keyword arguments of model.generate, e.g. do_sample or temperature.
+
+        Returns:
+            None
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        self.max_entries = max_entries
+        self.generate_kwargs = generate_kwargs
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(
+        self,
+        prompt: str,
+        stop_at: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        is_in: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Generates a completion for the prompt without any prefix reuse.
+
+        Args:
+            prompt (str): The prompt.
+            stop_at (Optional[List[str]]): Stop sequences. Defaults to None.
+            max_tokens (Optional[int]): The maximum number of generated tokens. Defaults to None, which uses max_new_tokens.
+            is_in (Optional[List[str]]): The choices the completion is constrained to. Defaults to None.
+
+        Returns:
+            str: The completion.
+        """
+        return self._generate_prompt(prompt, stop_at, max_tokens, is_in, with_confidence=False)[0]
+
+    def generate_with_confidence(
+        self,
+        prompt: str,
+        stop_at: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        is_in: Optional[List[str]] = None,
+    ) -> Tuple[str, float]:
+        """
+        Generates a completion for the prompt without any prefix reuse, with the confidence of the model in it.
+
+        Args:
+            prompt (str): The prompt.
+            stop_at (Optional[List[str]]): Stop sequences. Defaults to None.
+            max_tokens (Optional[int]): The maximum number of generated tokens. Defaults to None, which uses max_new_tokens.
+            is_in (Optional[List[str]]): The choices the completion is constrained to. Defaults to None.
+
+        Returns:
+            Tuple[str, float]: The completion and the geometric mean of the probabilities of its tokens.
+        """
+        return self._generate_prompt(prompt, stop_at, max_tokens, is_in, with_confidence=True)
+
+    def complete(
+        self,
+        key: Any,
+        prefix: str,
+        tail: str,
+        stop_at: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        is_in: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Generates a completion for prefix + tail, reusing the cached prefix stored under the key.
+
+        Args:
+            key (Any): The key of the cached prefix, e.g. the agent.
+            prefix (str): The append-only part of the prompt.
+            tail (str): The part of the prompt that may change between turns.
+            stop_at (Optional[List[str]]): Stop sequences. Defaults to None.
+            max_tokens (Optional[int]): The maximum number of generated tokens. Defaults to None, which uses max_new_tokens.
+            is_in (Optional[List[str]]): The choices the completion is constrained to. Defaults to None.
+
+        Returns:
+            str: The completion.
+        """
+        return self._complete_prefix(key, prefix, tail, stop_at, max_tokens, is_in, with_confidence=False)[0]
+
+    def complete_with_confidence(
+        self,
+        key: Any,
+        prefix: str,
+        tail: str,
+        stop_at: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        is_in: Optional[List[str]] = None,
+    ) -> Tuple[str, float]:
+        """
+        Generates a completion for prefix + tail like complete, with the confidence of the model in it.
+
+        Args:
+            key (Any): The key of the cached prefix, e.g. the agent.
+            prefix (str): The append-only part of the prompt.
+            tail (str): The part of the prompt that may change between turns.
+            stop_at (Optional[List[str]]): Stop sequences. Defaults to None.
+            max_tokens (Optional[int]): The maximum number of generated tokens. Defaults to None, which uses max_new_tokens.
+            is_in (Optional[List[str]]): The choices the completion is constrained to. Defaults to None.
+
+        Returns:
+            Tuple[str, float]: The completion and the geometric mean of the probabilities of its tokens.
+        """
+        return self._complete_prefix(key, prefix, tail, stop_at, max_tokens, is_in, with_confidence=True)
+
+    def _generate_prompt(
+        self,
+        prompt: str,
+        stop_at: Optional[List[str]],
+        max_tokens: Optional[int],
+        is_in: Optional[List[str]],
+        with_confidence: bool,
+    ) -> Tuple[str, Optional[float]]:
+        """
+        Generates a completion for the prompt without any prefix reuse.
+
+        Args:
+            prompt (str): The prompt.
+            stop_at (Optional[List[str]]): Stop sequences.
+            max_tokens (Optional[int]): The maximum number of generated tokens, or None to use max_new_tokens.
+            is_in (Optional[List[str]]): The choices the completion is constrained to, or None.
+            with_confidence (bool): Whether to compute the confidence of the model.
+
+        Returns:
+            Tuple[str, Optional[float]]: The completion and its confidence, or None without with_confidence.
+        """
+        with self._lock:
+            input_ids = self._encode(prompt, add_special_tokens=True)
+            return self._generate(input_ids, None, stop_at, max_tokens, is_in, with_confidence)
+
+    def _complete_prefix(
+        self,
+        key: Any,
+        prefix: str,
+        tail: str,
+        stop_at: Optional[List[str]],
+        max_tokens: Optional[int],
+        is_in: Optional[List[str]],
+        with_confidence: bool,
+    ) -> Tuple[str, Optional[float]]:
+        """
+        Generates a completion for prefix + tail, reusing the cached prefix stored under the key.
+
+        Args:
+            key (Any): The key of the cached prefix, e.g. the agent.
+            prefix (str): The append-only part of the prompt.
+            tail (str): The part of the prompt that may change between turns.
+            stop_at (Optional[List[str]]): Stop sequences.
+            max_tokens (Optional[int]): The maximum number of generated tokens, or None to use max_new_tokens.
+            is_in (Optional[List[str]]): The choices the completion is constrained to, or None.
+            with_confidence (bool): Whether to compute the confidence of the model.
+
+        Returns:
+            Tuple[str, Optional[float]]: The completion and its confidence, or None without with_confidence.
+        """
+        import torch
+        from transformers import DynamicCache
+
+        with self._lock:
+            entry = self._entries.pop(key, None) or _PrefixEntry()
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            if not prefix:
+                input_ids = self._encode(tail, add_special_tokens=True)
+                return self._generate(input_ids, None, stop_at, max_tokens, is_in, with_confidence)
+            prefix_ids = self._encode(prefix, add_special_tokens=True)
+            num_cached = _common_length(entry.input_ids, prefix_ids) if entry.input_ids is not None else 0
+            if num_cached == 0:
+                entry.past_key_values = DynamicCache()
+            else:
+                entry.past_key_values.crop(num_cached)
+            if num_cached < prefix_ids.shape[1]:
+                with torch.no_grad():
+                    self.model(
+                        input_ids=prefix_ids[:, num_cached:], past_key_values=entry.past_key_values, use_cache=True
+                    )
+            entry.input_ids = prefix_ids
+
+            input_ids = torch.cat([prefix_ids, self._encode(tail, add_special_tokens=False)], dim=1)
+            try:
+                return self._generate(input_ids, entry.past_key_values, stop_at, max_tokens, is_in, with_confidence)
+            finally:
+                # generate extends the cache in place with the tail and the completion, which are not reused
+                entry.past_key_values.crop(prefix_ids.shape[1])
+
+    def _encode(self, text: str, add_special_tokens: bool) -> Any:
+        """
+        Tokenizes a text into a batch of one sequence on the model device.
+
+        Args:
+            text (str): The text.
+            add_special_tokens (bool): Whether to add special tokens, only wanted at the start of a prompt.
+
+        Returns:
+            Any: The token ids.
+        """
+        return self.tokenizer(
+            text, return_tensors="pt", add_special_tokens=add_special_tokens
+        ).input_ids.to(self.model.device)
+
+    def _generate(
+        self,
+        input_ids: Any,
+        past_key_values: Any,
+        stop_at: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+        is_in: Optional[List[str]] = None,
+        with_confidence: bool = False,
+    ) -> Tuple[str, Optional[float]]:
+        """
+        Generates a completion and decodes the new tokens.
+
+        Args:
+            input_ids (Any): The token ids of the whole prompt.
+            past_key_values (Any): The key/value cache of the start of the prompt, or None.
+            stop_at (Optional[List[str]]): Stop sequences. Defaults to None.
+            max_tokens (Optional[int]): The maximum number of generated tokens. Defaults to None, which uses max_new_tokens.
+            is_in (Optional[List[str]]): The choices the completion is constrained to. Defaults to None.
+            with_confidence (bool): Whether to compute the confidence of the model, which needs the scores of every
+                generated token. Defaults to False.
+
+        Returns:
+            Tuple[str, Optional[float]]: The completion and the geometric mean of the probabilities of its tokens,
+                or None without with_confidence.
+        """
+        import torch
+
+        constraint_kwargs = {"stop_strings": stop_at, "tokenizer": self.tokenizer} if stop_at else {}
+        if is_in:
+            constraint_kwargs["prefix_allowed_tokens_fn"] = choice_allowed_tokens(
+                self.tokenizer, is_in, input_ids.shape[1]
+            )
+        outputs = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values,
+            max_new_tokens=max_tokens or self.max_new_tokens,
+            pad_token_id=self.tokenizer.pad_token_id or self.tokenizer.eos_token_id,
+            output_scores=with_confidence,
+            return_dict_in_generate=True,
+            **constraint_kwargs,
+            **self.generate_kwargs,
+        )
+        completion = self.tokenizer.decode(outputs.sequences[0, input_ids.shape[1]:], skip_special_tokens=True)
+        if not with_confidence:
+            return completion, None
+        log_probs = self.model.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True)[0]
+        confidence = float(torch.exp(log_probs.mean())) if log_probs.numel() else 0.0
+        return completion, confidence
+
+
+def _common_length(cached_ids: Any, input_ids: Any) -> int:
+    """
+    Returns the number of leading tokens that two batches of one sequence have in common.
+
+    Args:
+        cached_ids (Any): The token ids of the cached prefix.
+        input_ids (Any): The token ids of the new prefix.
+
+    Returns:
+        int: The number of tokens in common.
+    """
+    length = min(cached_ids.shape[1], input_ids.shape[1])
+    mismatches = (cached_ids[0, :length] != input_ids[0, :length]).nonzero()
+    return int(mismatches[0, 0]) if len(mismatches) else length
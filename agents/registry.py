@@ -0,0 +1,113 @@
+import importlib
+import threading
+from typing import Callable, Dict, List, Union
+
+from .agent import Agent
+
+# Agent backends shipped with the repository, as "module:attribute" paths so that their modules (and heavy
+# dependencies such as outlines) are only imported when the backend is first used
+BUILTIN_BACKENDS = {
+    "outlines": "agents.outlines_agent:OutlinesAgent",
+    "scripted": "agents.scripted_agent:ScriptedAgent",
+    "random_voter": "agents.scripted_agent:RandomVoter",
+    "fixed_describer": "agents.scripted_agent:FixedDescriber",
+    # Created without a keyword, so it always guesses wrong: the wrong-guess baseline
+    "guesser": "agents.scripted_agent:Guesser",
+    "cascade": "agents.cascade_agent:CascadeAgent",
+}
+# Backends created with a model, e.g. create_agent("outlines", name, llm), that a tournament cannot create from a seed
+MODEL_BACKENDS = {"outlines", "cascade"}
+
+_backends: Dict[str, Union[str, Callable[..., Agent]]] = dict(BUILTIN_BACKENDS)
+_loaded: Dict[str, Callable[..., Agent]] = {}
+_lock = threading.Lock()
+
+
+def register_backend(name: str, target: Union[str, Callable[..., Agent]]) -> None:
+    """
+    Registers an agent backend under a name, replacing any backend with the same name.
+
+    Args:
+        name (str): The name of the backend.
+        target (Union[str, Callable[..., Agent]]): The agent class or factory, or its "module:attribute" path
+            to import it on first use.
+
+    Returns:
+        None
+    """
+    with _lock:
+        _backends[name] = target
+        _loaded.pop(name, None)
+
+
+def available_backends() -> List[str]:
+    """
+    Returns the names of the registered backends, without importing them.
+
+    Returns:
+        List[str]: The names.
+    """
+    return sorted(_backends)
+
+
+def load_backend(name: str) -> Callable[..., Agent]:
+    """
+    Returns the agent class or factory of a backend, importing its module on first use.
+
+    Args:
+        name (str): The name of a registered backend, or a "module:attribute" path.
+
+    Returns:
+        Callable[..., Agent]: The agent class or factory, called with the agent name first.
+    """
+    backend = _loaded.get(name)
+    if backend is not None:
+        return backend
+
+    with _lock:
+        target = _backends.get(name)
+        if target is None:
+            if ":" not in name:
+                raise ValueError(f"Unknown agent backend {name!r}, available backends are {sorted(_backends)}")
+            target = name
+        if isinstance(target, str):
+            module_name, _, attribute = target.partition(":")
+            backend = getattr(importlib.import_module(module_name), attribute)
+        else:
+            backend = target
+        _loaded[name] = backend
+    return backend
+
+
+def load_agent_factory(name: str) -> Callable[[str, int], Agent]:
+    """
+    Returns a backend as an agent factory of a tournament, called with the agent name and the seed of the game.
+
+    Args:
+        name (str): The name of a registered backend, or a "module:attribute" path.
+
+    Returns:
+        Callable[[str, int], Agent]: The agent class or factory.
+    """
+    if name in MODEL_BACKENDS:
+        raise ValueError(
+            f"Agent backend {name!r} needs a model and cannot be created from a seed, pass a module level factory "
+            f"function creating it with its model instead."
+        )
+    return load_backend(name)
+
+
+def create_agent(backend: str, name: str, *args, **kwargs) -> Agent:
+    """
+    Creates an agent with a backend.
+
+    Args:
+        backend (str): The name of a registered backend, or a "module:attribute" path.
+        name (str): The name of the agent.
+        *args: Positional arguments of the backend after the name.
+        **kwargs: Keyword arguments of the backend.
+
+    Returns:
+        Agent: The agent.
+    """
+    return load_backend(backend)(name, *args, **kwargs)
@@ -0,0 +1,186 @@
+import random
+from typing import List, Optional
+
+from .agent import Agent
+from .parsing import AliveAgentTracker
+
+
+class ScriptedAgent(Agent):
+    """
+    Deterministic, LLM-free agent for simulations, tests and benchmarks.
+
+    The agent learns the other agents from the senders of the messages it sees and drops them once the
+    moderator announces their elimination. Subclasses choose the description, the vote and the guess.
+
+    Attributes:
+        name (str): The name of the agent.
+        rng (random.Random): The random number generator of the agent.
+        alive_agents (List[str]): The other agents seen so far and not eliminated, in order of appearance.
+    """
+    def __init__(self, name: str, seed: Optional[int] = None) -> None:
+        """
+        Initializes a new ScriptedAgent instance.
+
+        Args:
+            name (str): The name of the agent.
+            seed (Optional[int]): Seed of the random number generator, combined with the name so that agents of
+                the same game draw different numbers. Defaults to None.
+
+        Returns:
+            None
+        """
+        super().__init__(name)
+        self.rng = random.Random(f"{seed}-{name}") if seed is not None else random.Random()
+        self._tracker = AliveAgentTracker(name)
+
+    def act(self, message_history: List[str], phase: str) -> str:
+        """
+        Perform an action based on the given message history and phase.
+
+        Args:
+            message_history (List[str]): A list of previous messages.
+            phase (str): The current phase of the agent.
+
+        Returns:
+            str: The action to be taken by the agent.
+        """
+        self._tracker.update(message_history)
+        if phase == "VOTING":
+            return self.vote()
+        elif phase == "GUESSING":
+            return self.guess()
+        return self.describe()
+
+    @property
+    def alive_agents(self) -> List[str]:
+        return self._tracker.alive_agents
+
+    def describe(self) -> str:
+        """
+        Returns the message of the description and discussion phases.
+
+        Returns:
+            str: The message.
+        """
+        return "It is something we all use every day."
+
+    def vote(self) -> str:
+        """
+        Returns the agent to vote for.
+
+        Returns:
+            str: The name of the agent.
+        """
+        return self.alive_agents[0] if self.alive_agents else self.name
+
+    def guess(self) -> str:
+        """
+        Returns the keyword guessed by Mr. White.
+
+        Returns:
+            str: The keyword.
+        """
+        return "nothing"
+
+
+class RandomVoter(ScriptedAgent):
+    """
+    Scripted agent describing with a random phrase and voting for a random alive agent.
+    """
+    DESCRIPTIONS = [
+        "It is something we all use every day.",
+        "I would say it is quite popular.",
+        "It has been around for a while.",
+        "Many people talk about it.",
+    ]
+
+    def describe(self) -> str:
+        return self.rng.choice(self.DESCRIPTIONS)
+
+    def vote(self) -> str:
+        return self.rng.choice(self.alive_agents) if self.alive_agents else self.name
+
+
+class FixedDescriber(ScriptedAgent):
+    """
+    Scripted agent always giving the same description and voting for the first alive agent it has seen.
+
+    Attributes:
+        description (str): The description of the agent.
+    """
+    def __init__(self, name: str, seed: Optional[int] = None, description: str = "It is something we all use every day.") -> None:
+        """
+        Initializes a new FixedDescriber instance.
+
+        Args:
+            name (str): The name of the agent.
+            seed (Optional[int]): Seed of the random number generator. Defaults to None.
+            description (str): The description of the agent. Defaults to a generic phrase.
+
+        Returns:
+            None
+        """
+        super().__init__(name, seed)
+        self.description = description
+
+    def describe(self) -> str:
+        return self.description
+
+
+class Guesser(RandomVoter):
+    """
+    Random voter that guesses a fixed keyword when it is Mr. White.
+
+    Pass the civilian keyword of the game for a correct guesser, anything else for a wrong guesser. Mr. White is
+    never told the keyword, so the guesser cannot read it from its messages. The "guesser" backend of
+    agents.registry, created from a name and a seed only, is therefore always a wrong guesser: use it as the
+    wrong-guess baseline, and create a Guesser with the keyword of the game for a correct one.
+
+    Attributes:
+        keyword (str): The keyword guessed.
+    """
+    def __init__(self, name: str, seed: Optional[int] = None, keyword: str = "nothing") -> None:
+        """
+        Initializes a new Guesser instance.
+
+        Args:
+            name (str): The name of the agent.
+            seed (Optional[int]): Seed of the random number generator. Defaults to None.
+            keyword (str): The keyword guessed. Defaults to "nothing".
+
+        Returns:
+            None
+        """
+        super().__init__(name, seed)
+        self.keyword = keyword
+
+    def guess(self) -> str:
+        return self.keyword
+
+
+def random_voter_factory(name: str, seed: int) -> RandomVoter:
+    """
+    Agent factory of tournament.run_tournament creating random voters.
+
+    Args:
+        name (str): The name of the agent.
+        seed (int): The seed of the game.
+
+    Returns:
+        RandomVoter: The agent.
+    """
+    return RandomVoter(name, seed)
+
+
+def fixed_describer_factory(name: str, seed: int) -> FixedDescriber:
+    """
+    Agent factory of tournament.run_tournament creating fixed describers.
+
+    Args:
+        name (str): The name of the agent.
+        seed (int): The seed of the game.
+
+    Returns:
+        FixedDescriber: The agent.
+    """
+    return FixedDescriber(name, seed)
@@ -0,0 +1,517 @@
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from game_log import GameLogger, read_records
+from utils import GameRole, Message
+
+# Names of the record tables, each stored in its own directory of Parquet files
+TABLES = ("games", "agents", "votes")
+IMPOSTOR_ROLES = (GameRole.UNDERCOVER.name, GameRole.MRWHITE.name)
+
+Records = Dict[str, List[Dict[str, Any]]]
+
+
+def get_schemas() -> Dict[str, Any]:
+    """
+    Returns the Arrow schemas of the record tables.
+
+    Returns:
+        Dict[str, pyarrow.Schema]: A dictionary mapping table names to schemas.
+    """
+    import pyarrow as pa
+
+    return {
+        "games": pa.schema([
+            ("game", pa.string()),
+            ("config", pa.string()),
+            ("num_agents", pa.int32()),
+            ("civilian_keyword", pa.string()),
+            ("undercover_keyword", pa.string()),
+            ("winners", pa.string()),
+            ("civilian_won", pa.bool_()),
+            ("undercover_won", pa.bool_()),
+            ("mrwhite_won", pa.bool_()),
+            ("finished", pa.bool_()),
+            ("num_rounds", pa.int32()),
+            ("num_messages", pa.int32()),
+        ]),
+        "agents": pa.schema([
+            ("game", pa.string()),
+            ("config", pa.string()),
+            ("agent", pa.string()),
+            ("model", pa.string()),
+            ("role", pa.string()),
+            ("won", pa.bool_()),
+            ("eliminated_round", pa.int32()),
+            ("elimination_index", pa.int32()),
+        ]),
+        "votes": pa.schema([
+            ("game", pa.string()),
+            ("config", pa.string()),
+            ("round", pa.int32()),
+            ("voter", pa.string()),
+            ("voter_model", pa.string()),
+            ("voter_role", pa.string()),
+            ("target", pa.string()),
+            ("target_role", pa.string()),
+            ("counted", pa.bool_()),
+            ("correct", pa.bool_()),
+        ]),
+    }
+
+
+class OutcomeRecorder:
+    """
+    Logger sink turning the structured events of games into per-game, per-agent and per-vote records.
+
+    Pass it as the logger of an Environment. Message events are ignored, so the records hold no message text
+    and recording costs nothing per message. A GameLogger can be chained to also keep the full log. Records
+    of a game are released by its summary event. A game stopped before its end, e.g. by a step limit, is only
+    recorded if a summary without winners is logged for it, as tournament.run_game does.
+
+    Attributes:
+        config (str): The configuration of the games, e.g. the agent factory of a tournament.
+        models (Dict[str, str]): A dictionary mapping agents to the model playing them. Agents default to config.
+        game_id (Optional[str]): Identifier of the next game, or None to number the games.
+        logger (Optional[GameLogger]): Logger receiving every event as well.
+        records (Records): The records of the finished games, by table name.
+    """
+    def __init__(
+        self,
+        config: str = "",
+        models: Optional[Dict[str, str]] = None,
+        game_id: Optional[str] = None,
+        logger: Optional[GameLogger] = None,
+    ) -> None:
+        """
+        Initializes an OutcomeRecorder object.
+
+        Args:
+            config (str): The configuration of the games. Defaults to "".
+            models (Optional[Dict[str, str]]): A dictionary mapping agents to the model playing them, for games
+                between different models. Defaults to None, which labels every agent with config.
+            game_id (Optional[str]): Identifier of the next game. Defaults to None, which numbers the games.
+            logger (Optional[GameLogger]): Logger receiving every event as well. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.config = config
+        self.models = models or {}
+        self.game_id = game_id
+        self.logger = logger
+        self.records = {table: [] for table in TABLES}
+        self._num_games = 0
+        self._game = None
+        self._agent_to_role = {}
+        self._keywords = {}
+        self._eliminations = {}
+        self._votes = []
+
+    def log(self, event: str, **fields: Any) -> None:
+        """
+        Records an event.
+
+        Args:
+            event (str): The type of the event. Only "setting", "vote", "elimination" and "summary" are recorded.
+            **fields (Any): The fields of the event.
+
+        Returns:
+            None
+        """
+        if self.logger is not None:
+            self.logger.log(event, **fields)
+
+        if event == "setting":
+            self._start_game(fields)
+        elif self._game is None:
+            return
+        elif event == "vote":
+            self._add_vote(fields)
+        elif event == "elimination":
+            self._eliminations[fields["agent"]] = (fields["round"], len(self._eliminations))
+        elif event == "summary":
+            self._end_game(fields)
+
+    def log_message(self, message: Message) -> None:
+        """
+        Forwards a message to the chained logger, messages are not recorded.
+
+        Args:
+            message (Message): The message.
+
+        Returns:
+            None
+        """
+        if self.logger is not None:
+            self.logger.log_message(message)
+
+    def flush(self) -> None:
+        """
+        Flushes the chained logger.
+
+        Returns:
+            None
+        """
+        if self.logger is not None:
+            self.logger.flush()
+
+    def close(self) -> None:
+        """
+        Closes the chained logger.
+
+        Returns:
+            None
+        """
+        if self.logger is not None:
+            self.logger.close()
+
+    def pop_records(self) -> Records:
+        """
+        Returns the records of the games finished so far and clears them.
+
+        Returns:
+            Records: The records, by table name.
+        """
+        records = self.records
+        self.records = {table: [] for table in TABLES}
+        return records
+
+    def _start_game(self, setting: Dict[str, Any]) -> None:
+        """
+        Starts recording a game.
+
+        Args:
+            setting (Dict[str, Any]): The fields of the setting event.
+
+        Returns:
+            None
+        """
+        if "game" in setting:
+            self._game = str(setting["game"])
+        elif self.game_id is not None:
+            self._game = self.game_id
+        else:
+            self._game = str(self._num_games)
+        self._num_games += 1
+        self._agent_to_role = {agent: role for role, agents in setting["roles"].items() for agent in agents}
+        self._keywords = setting["keywords"]
+        self._eliminations = {}
+        self._votes = []
+
+    def _add_vote(self, vote: Dict[str, Any]) -> None:
+        """
+        Records a vote of the current game.
+
+        Args:
+            vote (Dict[str, Any]): The fields of the vote event.
+
+        Returns:
+            None
+        """
+        voter_role = self._agent_to_role.get(vote["voter"])
+        target_role = self._agent_to_role.get(vote["target"])
+        # A vote is correct when it targets the other side: impostors for civilians, civilians for impostors
+        correct = (
+            vote["counted"]
+            and target_role is not None
+            and (voter_role in IMPOSTOR_ROLES) != (target_role in IMPOSTOR_ROLES)
+        )
+        self._votes.append({
+            "game": self._game,
+            "config": self.config,
+            "round": vote["round"],
+            "voter": vote["voter"],
+            "voter_model": self.models.get(vote["voter"], self.config),
+            "voter_role": voter_role,
+            "target": vote["target"],
+            "target_role": target_role,
+            "counted": vote["counted"],
+            "correct": correct,
+        })
+
+    def _end_game(self, summary: Dict[str, Any]) -> None:
+        """
+        Releases the records of the current game.
+
+        Args:
+            summary (Dict[str, Any]): The fields of the summary event.
+
+        Returns:
+            None
+        """
+        winners = summary["winners"]
+        self.records["games"].append({
+            "game": self._game,
+            "config": self.config,
+            "num_agents": len(self._agent_to_role),
+            "civilian_keyword": self._keywords.get(GameRole.CIVILIAN.name),
+            "undercover_keyword": self._keywords.get(GameRole.UNDERCOVER.name),
+            "winners": ",".join(sorted(winners)),
+            "civilian_won": GameRole.CIVILIAN.name in winners,
+            "undercover_won": GameRole.UNDERCOVER.name in winners,
+            "mrwhite_won": GameRole.MRWHITE.name in winners,
+            "finished": bool(winners),
+            "num_rounds": summary.get("num_rounds"),
+            "num_messages": summary.get("num_messages"),
+        })
+        for agent, role in self._agent_to_role.items():
+            eliminated_round, elimination_index = self._eliminations.get(agent, (None, None))
+            self.records["agents"].append({
+                "game": self._game,
+                "config": self.config,
+                "agent": agent,
+                "model": self.models.get(agent, self.config),
+                "role": role,
+                "won": role in winners,
+                "eliminated_round": eliminated_round,
+                "elimination_index": elimination_index,
+            })
+        self.records["votes"].extend(self._votes)
+        self._game = None
+        self._votes = []
+
+
+def records_from_log(path: str, config: str = "", models: Optional[Dict[str, str]] = None) -> Records:
+    """
+    Extracts the records of the games of a JSONL game log, e.g. one written by GameLogger.
+
+    Args:
+        path (str): The path of the JSONL file.
+        config (str): The configuration of the games. Defaults to "".
+        models (Optional[Dict[str, str]]): A dictionary mapping agents to the model playing them. Defaults to None.
+
+    Returns:
+        Records: The records, by table name.
+    """
+    recorder = OutcomeRecorder(config, models)
+    for record in read_records(path):
+        if record["event"] != "message":
+            recorder.log(**record)
+    return recorder.records
+
+
+class OutcomeWriter:
+    """
+    Writes records to a directory of Parquet files, one subdirectory per table.
+
+    Records are buffered and written in batches, each batch to a new file, so memory stays bounded for corpora
+    of any size and several runs can be written to the same directory. The files can be read back with
+    load_table, or with datasets.load_dataset("parquet", data_files=...).
+
+    Attributes:
+        directory (str): The directory of the tables.
+        batch_size (int): The number of buffered records of a table that triggers a write.
+    """
+    def __init__(self, directory: str, batch_size: int = 100000) -> None:
+        """
+        Initializes an OutcomeWriter object.
+
+        Args:
+            directory (str): The directory of the tables, created if needed.
+            batch_size (int): The number of buffered records of a table that triggers a write. Defaults to 100000.
+
+        Returns:
+            None
+        """
+        self.directory = directory
+        self.batch_size = batch_size
+        self._buffers = {table: [] for table in TABLES}
+        self._num_files = {}
+        for table in TABLES:
+            table_directory = os.path.join(directory, table)
+            os.makedirs(table_directory, exist_ok=True)
+            self._num_files[table] = len([name for name in os.listdir(table_directory) if name.endswith(".parquet")])
+
+    def write(self, records: Records) -> None:
+        """
+        Adds records, writing the tables whose buffer is full.
+
+        Args:
+            records (Records): The records, by table name, e.g. from OutcomeRecorder.pop_records or GameResult.records.
+
+        Returns:
+            None
+        """
+        for table, rows in records.items():
+            self._buffers[table].extend(rows)
+            if len(self._buffers[table]) >= self.batch_size:
+                self._write_table(table)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered records of every table.
+
+        Returns:
+            None
+        """
+        for table in TABLES:
+            self._write_table(table)
+
+    def close(self) -> None:
+        """
+        Writes the remaining records.
+
+        Returns:
+            None
+        """
+        self.flush()
+
+    def _write_table(self, table: str) -> None:
+        """
+        Writes the buffered records of a table to a new Parquet file.
+
+        Args:
+            table (str): The name of the table.
+
+        Returns:
+            None
+        """
+        if not self._buffers[table]:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.directory, table, f"part-{self._num_files[table]:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._buffers[table], schema=get_schemas()[table]), path)
+        self._num_files[table] += 1
+        self._buffers[table] = []
+
+
+def load_table(directory: str, table: str, columns: Optional[List[str]] = None) -> Any:
+    """
+    Loads a record table written by OutcomeWriter.
+
+    Args:
+        directory (str): The directory of the tables.
+        table (str): The name of the table, one of TABLES.
+        columns (Optional[List[str]]): The columns to load. Defaults to None, which loads every column.
+
+    Returns:
+        pyarrow.Table: The table.
+    """
+    import pyarrow.parquet as pq
+
+    schema = get_schemas()[table]
+    table_directory = os.path.join(directory, table)
+    if not os.path.isdir(table_directory) or not os.listdir(table_directory):
+        return schema.empty_table().select(columns or schema.names)
+    return pq.read_table(table_directory, columns=columns, schema=schema)
+
+
+def to_table(records: Iterable[Dict[str, Any]], table: str) -> Any:
+    """
+    Converts in-memory records to an Arrow table, e.g. to analyze a tournament without writing it.
+
+    Args:
+        records (Iterable[Dict[str, Any]]): The records of a table.
+        table (str): The name of the table, one of TABLES.
+
+    Returns:
+        pyarrow.Table: The table.
+    """
+    import pyarrow as pa
+
+    return pa.Table.from_pylist(list(records), schema=get_schemas()[table])
+
+
+def win_rates(agents: Any, by: Sequence[str] = ("model", "role")) -> Any:
+    """
+    Computes the win rate of the agents, by model and role by default.
+
+    Args:
+        agents (pyarrow.Table): The agents table.
+        by (Sequence[str]): The columns to group by. Defaults to ("model", "role").
+
+    Returns:
+        pyarrow.Table: The groups with their number of agents and win rate.
+    """
+    wins = agents.select(list(by)).append_column("won", agents["won"].cast("float64"))
+    return _aggregate(wins, by, [("won", "count"), ("won", "mean")], ["num_agents", "win_rate"])
+
+
+def vote_accuracy(votes: Any, by: Sequence[str] = ("voter_model", "voter_role")) -> Any:
+    """
+    Computes the share of votes targeting the other side, by model and role of the voter by default.
+
+    Dropped votes (for eliminated or unknown agents) count as incorrect.
+
+    Args:
+        votes (pyarrow.Table): The votes table.
+        by (Sequence[str]): The columns to group by. Defaults to ("voter_model", "voter_role").
+
+    Returns:
+        pyarrow.Table: The groups with their number of votes, share of counted votes and accuracy.
+    """
+    columns = votes.select(list(by))
+    columns = columns.append_column("counted", votes["counted"].cast("float64"))
+    columns = columns.append_column("correct", votes["correct"].cast("float64"))
+    return _aggregate(
+        columns,
+        by,
+        [("correct", "count"), ("counted", "mean"), ("correct", "mean")],
+        ["num_votes", "counted_rate", "accuracy"],
+    )
+
+
+def elimination_order(agents: Any, by: Sequence[str] = ()) -> Any:
+    """
+    Computes the share of each role among the agents eliminated at each position of the elimination order.
+
+    Args:
+        agents (pyarrow.Table): The agents table.
+        by (Sequence[str]): Additional columns to group by, e.g. ("config",). Defaults to ().
+
+    Returns:
+        pyarrow.Table: The groups by elimination index and role, with their number of eliminations and share.
+    """
+    import pyarrow.compute as pc
+
+    keys = list(by) + ["elimination_index"]
+    eliminated = agents.filter(pc.is_valid(agents["elimination_index"]))
+    counts = _aggregate(eliminated, keys + ["role"], [("agent", "count")], ["num_eliminations"])
+    totals = _aggregate(eliminated, keys, [("agent", "count")], ["total"])
+    counts = counts.join(totals, keys)
+    counts = counts.append_column("share", pc.divide(counts["num_eliminations"].cast("float64"), counts["total"]))
+    return counts.drop_columns(["total"]).sort_by([(key, "ascending") for key in keys + ["role"]])
+
+
+def rounds_to_finish(games: Any, by: Sequence[str] = ("config", "winners")) -> Any:
+    """
+    Computes the number of rounds of the finished games, by config and winners by default.
+
+    Args:
+        games (pyarrow.Table): The games table.
+        by (Sequence[str]): The columns to group by. Defaults to ("config", "winners").
+
+    Returns:
+        pyarrow.Table: The groups with their number of games and the mean, min and max number of rounds.
+    """
+    return _aggregate(
+        games.filter(games["finished"]),
+        by,
+        [("num_rounds", "count"), ("num_rounds", "mean"), ("num_rounds", "min"), ("num_rounds", "max")],
+        ["num_games", "mean_rounds", "min_rounds", "max_rounds"],
+    )
+
+
+def _aggregate(table: Any, keys: Sequence[str], aggregations: List[Tuple[str, str]], names: List[str]) -> Any:
+    """
+    Groups a table and aggregates its columns, sorted by the group keys.
+
+    Args:
+        table (pyarrow.Table): The table.
+        keys (Sequence[str]): The columns to group by.
+        aggregations (List[Tuple[str, str]]): The columns and Arrow aggregation functions, e.g. ("won", "mean").
+        names (List[str]): The names of the aggregated columns.
+
+    Returns:
+        pyarrow.Table: The group keys followed by the aggregated columns.
+    """
+    import pyarrow as pa
+
+    grouped = table.group_by(list(keys)).aggregate(aggregations)
+    columns = [grouped[key] for key in keys]
+    columns += [grouped[f"{column}_{function}"] for column, function in aggregations]
+    result = pa.table(columns, names=list(keys) + names)
+    return result.sort_by([(key, "ascending") for key in keys]) if keys else result
@@ -0,0 +1,212 @@
+"""
+Load test of the client pool against a local completion server injecting rate limit and server errors.
+
+Serves an OpenAI compatible /completions endpoint with http.server, answering a share of the requests with
+429 and 503 responses, and sends requests from many threads through a ClientPool wrapping an
+HTTPCompletionClient. Checks that every transient error is retried and every request eventually succeeds,
+that a client error is not retried, that no more than max_in_flight requests reach the server at the same time,
+and that the requests per minute bucket holds the request rate to its limit after the initial burst.
+
+Usage:
+    python benchmarks/client_pool_test.py [--requests 100] [--threads 16] [--max-in-flight 4]
+        [--requests-per-minute 3000] [--burst 20] [--latency 0.01] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.client_pool import ClientPool, HTTPCompletionClient, TokenBucket
+
+# Error responses sent before the request succeeds, by request number modulo their count
+FAILURE_PLANS = [[], [429], [503, 429], [503]]
+# Prompt answered with a client error, which must not be retried
+BAD_PROMPT = "bad request"
+
+
+class StubCompletionServer(ThreadingHTTPServer):
+    """
+    Completion server answering every prompt with its planned errors first, then with a completion.
+
+    Attributes:
+        latency (float): The delay of every response, in seconds.
+        failures (Dict[str, List[int]]): The status codes still to be sent per prompt.
+        num_requests (int): The number of requests received.
+        num_errors (int): The number of error responses sent.
+        max_in_flight (int): The largest number of requests handled at the same time.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency: float) -> None:
+        """
+        Initializes a StubCompletionServer object listening on a free local port.
+
+        Args:
+            latency (float): The delay of every response, in seconds.
+
+        Returns:
+            None
+        """
+        super().__init__(("127.0.0.1", 0), CompletionHandler)
+        self.latency = latency
+        self.failures: Dict[str, List[int]] = {}
+        self.num_requests = 0
+        self.num_errors = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of StubCompletionServer.
+    """
+    def do_POST(self) -> None:
+        server = self.server
+        prompt = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["prompt"]
+        with server._lock:
+            server.num_requests += 1
+            server._in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server._in_flight)
+            planned = server.failures.get(prompt)
+            status = 400 if prompt == BAD_PROMPT else planned.pop(0) if planned else 200
+            if status != 200:
+                server.num_errors += 1
+        time.sleep(server.latency)
+        with server._lock:
+            server._in_flight -= 1
+
+        body = {"choices": [{"text": f"answer to {prompt}"}]} if status == 200 else {"error": {"code": status}}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def load_test(
+    num_requests: int, num_threads: int, max_in_flight: int, requests_per_minute: float, burst: float, latency: float
+) -> Dict[str, Any]:
+    """
+    Sends requests through a client pool to a stub server injecting errors, checks the pool and measures it.
+
+    Args:
+        num_requests (int): The number of prompts sent.
+        num_threads (int): The number of threads sending them, like agents sharing the pool.
+        max_in_flight (int): The maximum number of concurrent requests of the pool.
+        requests_per_minute (float): The requests per minute limit of the pool.
+        burst (float): The capacity of the requests per minute bucket.
+        latency (float): The delay of every response of the server, in seconds.
+
+    Returns:
+        Dict[str, Any]: The metrics.
+    """
+    server = StubCompletionServer(latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    prompts = [f"request {i}" for i in range(num_requests)]
+    for i, prompt in enumerate(prompts):
+        server.failures[prompt] = list(FAILURE_PLANS[i % len(FAILURE_PLANS)])
+    expected_retries = sum(len(failures) for failures in server.failures.values())
+
+    pool = ClientPool(
+        HTTPCompletionClient(server.base_url, "stub", timeout=10.0),
+        requests_per_minute=requests_per_minute,
+        max_in_flight=max_in_flight,
+        max_retries=max(len(plan) for plan in FAILURE_PLANS),
+        base_delay=0.01,
+        max_delay=0.1,
+    )
+    # A smaller burst than the default minute of requests, so that the limit shows within a short run
+    pool.request_bucket = TokenBucket(requests_per_minute, capacity=burst)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(num_threads) as executor:
+            completions = list(executor.map(pool, prompts))
+        elapsed = time.perf_counter() - start
+
+        assert completions == [f"answer to {prompt}" for prompt in prompts], "a request returned a wrong completion"
+        assert pool.num_retries == expected_retries, f"{pool.num_retries} retries, expected {expected_retries}"
+        assert pool.num_requests == num_requests + expected_retries == server.num_requests, (
+            f"{pool.num_requests} requests sent and {server.num_requests} received, "
+            f"expected {num_requests + expected_retries}"
+        )
+        assert server.max_in_flight <= max_in_flight, (
+            f"{server.max_in_flight} requests in flight, the limit is {max_in_flight}"
+        )
+        # Every request beyond the burst waits for a token refilled at the limit
+        min_elapsed = (pool.num_requests - burst) * 60 / requests_per_minute
+        assert elapsed >= min_elapsed * 0.99, f"{pool.num_requests} requests in {elapsed:.2f} s, the limit allows {min_elapsed:.2f} s"
+        num_sent, num_errors = pool.num_requests, server.num_errors
+
+        try:
+            pool(BAD_PROMPT)
+        except urllib.error.HTTPError as e:
+            assert e.code == 400, f"the bad request failed with {e.code}"
+        else:
+            raise AssertionError("the bad request succeeded")
+        assert pool.num_retries == expected_retries, "the bad request was retried"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "requests_per_sec": num_sent / elapsed,
+        "limit_per_sec": requests_per_minute / 60,
+        "prompts_per_sec": num_requests / elapsed,
+        "requests_sent": num_sent,
+        "retries": expected_retries,
+        "errors_injected": num_errors,
+        "max_in_flight": server.max_in_flight,
+        "elapsed_sec": elapsed,
+        "min_elapsed_sec": min_elapsed,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--requests", type=int, default=100, help="number of prompts sent")
+    arg_parser.add_argument("--threads", type=int, default=16, help="threads sending the prompts")
+    arg_parser.add_argument("--max-in-flight", type=int, default=4, help="maximum number of concurrent requests")
+    arg_parser.add_argument("--requests-per-minute", type=float, default=3000, help="requests per minute limit")
+    arg_parser.add_argument("--burst", type=float, default=20, help="requests sent at once before the limit applies")
+    arg_parser.add_argument("--latency", type=float, default=0.01, help="delay of every response, in seconds")
+    arg_parser.add_argument("--output", help="path of the JSON results")
+    args = arg_parser.parse_args()
+
+    metrics = load_test(
+        args.requests, args.threads, args.max_in_flight, args.requests_per_minute, args.burst, args.latency
+    )
+    print(
+        f"{args.requests} prompts, {metrics['requests_sent']} requests with {metrics['retries']} retries of "
+        f"{metrics['errors_injected']} injected errors, at most {metrics['max_in_flight']} in flight"
+    )
+    print(
+        f"{metrics['requests_per_sec']:.1f} requests/s for a limit of {metrics['limit_per_sec']:.1f}/s after a burst "
+        f"of {args.burst:.0f}: {metrics['elapsed_sec']:.2f} s, at least {metrics['min_elapsed_sec']:.2f} s"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), **metrics}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
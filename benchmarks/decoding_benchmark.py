@@ -0,0 +1,334 @@
+"""
+Benchmark of the tokens, requests and wasted votes of OutlinesAgent with and without constrained decoding.
+
+Plays the same games with free text generation, with a "</message>" stop sequence, and with phase-aware
+constrained decoding (votes chosen among the alive agents, bounded guesses, per-phase token limits), and counts
+the requests sent to the model with their prompt tokens as well as the generated tokens. Tokens are counted
+with tiktoken.
+
+By default the llm is simulated: it answers in the format of the prompt, continues the conversation past the
+closing tag, and writes a share of votes that the vote manager cannot match to an agent (e.g. "I vote for
+Bob."). That share is an assumption given by --invalid-vote-rate, not a measurement. Constrained votes are
+served like the outlines OpenAI models serve is_in: one request of one token per token of the choice, each
+sending the whole prompt again with the tokens chosen so far, so a constrained vote costs several prompts.
+
+With --model, the games are played against a local transformers model through PrefixCachingLLM instead, whose
+is_in masks the tokens that do not continue a choice within a single request, and invalid votes are those of
+the model.
+
+Usage:
+    python benchmarks/decoding_benchmark.py [--games 100] [--invalid-vote-rate 0.2] [--model gpt2]
+        [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiktoken
+
+import metrics
+from agents.outlines_agent import OutlinesAgent
+from environment import Environment
+from tournament import play_game
+
+ENCODING = tiktoken.get_encoding("cl100k_base")
+AGENT_NAMES = ["Alice", "Bob", "Charlie", "David", "Eve"]
+DESCRIPTIONS = [
+    "It is something many people use at work and at home, and it keeps getting better every year.",
+    "I would say it is quite popular these days, especially among students and programmers.",
+    "It helps you find answers quickly, although you should double check what it tells you.",
+]
+# Agent sending a message in the history, e.g. "Bob: ..."
+_SENDER = re.compile(r"^\s*(\w+): ", re.MULTILINE)
+# Configurations compared, as keyword arguments of OutlinesAgent
+CONFIGS = {
+    "free": {},
+    "stop": {"stop_at": ["</message>"]},
+    "constrained": {"stop_at": ["</message>"], "constrained": True, "phase_max_tokens": {"VOTING": 5, "GUESSING": 10}},
+}
+
+
+class PhaseAgent(OutlinesAgent):
+    """
+    OutlinesAgent telling its llm the phase of every call, so that the requests of the llm are counted per phase.
+    """
+    def act(self, message_history: List[str], phase: str) -> str:
+        self.llm.phase = phase
+        return super().act(message_history, phase)
+
+
+class CountingLLM:
+    """
+    Wrapper of a real llm counting one request per call.
+
+    Attributes:
+        llm (Callable): The wrapped llm.
+        phase (str): The phase of the current call, set by PhaseAgent.
+        accepted_kwargs (Optional[FrozenSet[str]]): The keyword arguments accepted by the wrapped llm.
+    """
+    def __init__(self, llm: Callable) -> None:
+        self.llm = llm
+        self.accepted_kwargs = getattr(llm, "accepted_kwargs", None)
+        self.phase = ""
+
+    def __call__(self, prompt: str, **kwargs: Any) -> str:
+        _record_request(self.phase, prompt)
+        return self.llm(prompt, **kwargs)
+
+
+class SimulatedLLM:
+    """
+    Stand-in for a completion model, answering prompts built by OutlinesAgent.
+
+    Attributes:
+        rng (random.Random): The random number generator.
+        invalid_vote_rate (float): The share of free text votes that do not name an agent as the vote manager expects.
+        max_tokens (int): The default maximum number of generated tokens.
+        phase (str): The phase of the current call, set by PhaseAgent.
+        accepted_kwargs (FrozenSet[str]): The keyword arguments of a call.
+    """
+    accepted_kwargs = frozenset({"stop_at", "is_in", "max_tokens"})
+
+    def __init__(self, seed: int, invalid_vote_rate: float, max_tokens: int = 50) -> None:
+        """
+        Initializes a SimulatedLLM object.
+
+        Args:
+            seed (int): Seed of the random number generator.
+            invalid_vote_rate (float): The share of free text votes that do not name an agent as expected.
+            max_tokens (int): The default maximum number of generated tokens. Defaults to 50.
+
+        Returns:
+            None
+        """
+        self.rng = random.Random(seed)
+        self.invalid_vote_rate = invalid_vote_rate
+        self.max_tokens = max_tokens
+        self.phase = ""
+
+    def __call__(
+        self,
+        prompt: str,
+        stop_at: Optional[List[str]] = None,
+        is_in: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Generates a completion.
+
+        Args:
+            prompt (str): The prompt.
+            stop_at (Optional[List[str]]): Stop sequences. Defaults to None.
+            is_in (Optional[List[str]]): The choices the completion is constrained to. Defaults to None.
+            max_tokens (Optional[int]): The maximum number of generated tokens. Defaults to None.
+
+        Returns:
+            str: The completion.
+        """
+        if is_in:
+            return self._choose(prompt, is_in)
+
+        _record_request(self.phase, prompt)
+        name = prompt.split(" who ", 1)[0].rsplit(" ", 1)[-1]
+        others = sorted({sender for sender in _SENDER.findall(prompt) if sender not in (name, "Moderator", "Note")})
+        target = self.rng.choice(others) if others else name
+        if "agent you want to vote for" in prompt:
+            if self.rng.random() < self.invalid_vote_rate:
+                message = self.rng.choice([f"I vote for {target}.", f"Agent {target}", f"{target}, because they were vague"])
+            else:
+                message = target
+        elif "keyword you want to guess" in prompt:
+            message = "chatgpt"
+        else:
+            message = self.rng.choice(DESCRIPTIONS)
+        # Free text models go on with the conversation once their message is closed
+        completion = f" <message>{message}</message>\n{target}: <message>{self.rng.choice(DESCRIPTIONS)}</message>"
+
+        for stop in stop_at or []:
+            if stop in completion:
+                completion = completion[:completion.index(stop)]
+        return _truncate(completion, max_tokens or self.max_tokens)
+
+    def _choose(self, prompt: str, choices: List[str]) -> str:
+        """
+        Chooses among choices like the outlines OpenAI models, with one request per token of the choice.
+
+        Every request generates one token, with a logit bias on the tokens that continue a choice, and sends the
+        prompt followed by the tokens chosen so far.
+
+        Args:
+            prompt (str): The prompt.
+            choices (List[str]): The choices.
+
+        Returns:
+            str: The choice.
+        """
+        choice = self.rng.choice(choices)
+        decoded = ""
+        for token in ENCODING.encode(choice):
+            _record_request(self.phase, prompt + decoded)
+            decoded += ENCODING.decode([token])
+        return decoded
+
+
+def _record_request(phase: str, prompt: str) -> None:
+    """
+    Counts a request sent to the model and its prompt tokens.
+
+    Args:
+        phase (str): The phase of the request.
+        prompt (str): The prompt sent.
+
+    Returns:
+        None
+    """
+    registry = metrics.registry
+    if registry is not None:
+        registry.inc("llm_requests_total", phase=phase)
+        registry.inc("request_prompt_tokens_total", len(ENCODING.encode(prompt)), phase=phase)
+
+
+def load_model(model_name: str) -> Callable:
+    """
+    Loads a local transformers model as the llm of the agents.
+
+    Args:
+        model_name (str): The name or path of the model, e.g. "gpt2".
+
+    Returns:
+        Callable: The llm, counting its requests.
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from agents.prefix_cache import PrefixCachingLLM
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    return CountingLLM(PrefixCachingLLM(model, tokenizer, max_new_tokens=50, do_sample=True))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """
+    Truncates a text to a number of tokens.
+
+    Args:
+        text (str): The text.
+        max_tokens (int): The maximum number of tokens.
+
+    Returns:
+        str: The truncated text.
+    """
+    return ENCODING.decode(ENCODING.encode(text)[:max_tokens])
+
+
+def _total(registry: metrics.MetricsRegistry, name: str, phase: Optional[str] = None) -> float:
+    """
+    Sums a counter over its labels, or over the labels of one phase.
+
+    Args:
+        registry (metrics.MetricsRegistry): The registry.
+        name (str): The name of the counter.
+        phase (Optional[str]): The phase. Defaults to None, which sums every phase.
+
+    Returns:
+        float: The sum.
+    """
+    return sum(
+        value
+        for (counter_name, labels), value in registry.counters.items()
+        if counter_name == name and (phase is None or dict(labels).get("phase") == phase)
+    )
+
+
+def bench_config(agent_kwargs: Dict[str, Any], num_games: int, create_llm: Callable[[int], Callable]) -> Dict[str, float]:
+    """
+    Plays games between OutlinesAgents with a configuration and measures their tokens, requests and invalid votes.
+
+    Args:
+        agent_kwargs (Dict[str, Any]): The keyword arguments of the agents.
+        num_games (int): The number of games.
+        create_llm (Callable[[int], Callable]): Returns the llm of the game with the given seed.
+
+    Returns:
+        Dict[str, float]: The metrics.
+    """
+    registry = metrics.enable()
+    try:
+        for seed in range(num_games):
+            llm = create_llm(seed)
+            env = Environment(agents=list(AGENT_NAMES), keyword_pair=("openai", "chatgpt"), seed=seed)
+            play_game(env, {name: PhaseAgent(name, llm, **agent_kwargs) for name in AGENT_NAMES})
+        num_votes = sum(
+            histogram.count
+            for (name, labels), histogram in registry.histograms.items()
+            if name == "llm_call_seconds" and dict(labels).get("phase") == "VOTING"
+        )
+        return {
+            "requests_per_game": _total(registry, "llm_requests_total") / num_games,
+            "prompt_tokens_per_game": _total(registry, "request_prompt_tokens_total") / num_games,
+            "requests_per_vote": _total(registry, "llm_requests_total", "VOTING") / num_votes if num_votes else 0.0,
+            "prompt_tokens_per_vote": (
+                _total(registry, "request_prompt_tokens_total", "VOTING") / num_votes if num_votes else 0.0
+            ),
+            "completion_tokens_per_game": _total(registry, "completion_tokens_total") / num_games,
+            "vote_tokens_per_game": _total(registry, "completion_tokens_total", "VOTING") / num_games,
+            "guess_tokens_per_game": _total(registry, "completion_tokens_total", "GUESSING") / num_games,
+            "invalid_vote_rate": _total(registry, "invalid_votes_total") / num_votes if num_votes else 0.0,
+            "parse_failures_per_game": _total(registry, "parse_failures_total") / num_games,
+        }
+    finally:
+        metrics.disable()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--games", type=int, default=100, help="number of games per configuration")
+    arg_parser.add_argument(
+        "--invalid-vote-rate",
+        type=float,
+        default=0.2,
+        help="share of free text votes of the simulated model not naming an agent as expected",
+    )
+    arg_parser.add_argument("--model", help="local transformers model to play against instead of the simulated one")
+    arg_parser.add_argument("--output", help="path of the JSON results")
+    args = arg_parser.parse_args()
+
+    if args.model:
+        import transformers
+
+        llm = load_model(args.model)
+
+        def create_llm(seed: int) -> Callable:
+            transformers.set_seed(seed)
+            return llm
+    else:
+        def create_llm(seed: int) -> Callable:
+            return SimulatedLLM(seed, args.invalid_vote_rate)
+
+    results = {}
+    for config, agent_kwargs in CONFIGS.items():
+        results[config] = bench_config(agent_kwargs, args.games, create_llm)
+        print(
+            f"{config}: {results[config]['requests_per_game']:.0f} requests/game "
+            f"({results[config]['requests_per_vote']:.1f} requests and {results[config]['prompt_tokens_per_vote']:.0f} "
+            f"prompt tokens per vote), {results[config]['prompt_tokens_per_game']:.0f} prompt tokens/game, "
+            f"{results[config]['completion_tokens_per_game']:.0f} completion tokens/game "
+            f"({results[config]['vote_tokens_per_game']:.0f} voting, {results[config]['guess_tokens_per_game']:.0f} guessing), "
+            f"{results[config]['invalid_vote_rate']:.1%} invalid votes, "
+            f"{results[config]['parse_failures_per_game']:.2f} parse failures/game"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), **results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
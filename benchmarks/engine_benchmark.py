@@ -0,0 +1,274 @@
+"""
+Throughput benchmark of the game engine with scripted agents, without any LLM calls.
+
+Measures steps/sec, games/sec and peak memory of whole games per player count, the time to build an
+observation from message pools of growing length, and startup costs: the import time of the main modules in
+a fresh interpreter and the time for a pool of spawned workers to play their first game. Results are written
+as JSON so that runs can be compared.
+
+Usage:
+    python benchmarks/engine_benchmark.py [--games 200] [--players 3 4 5 6 7 100] [--output results.json]
+        [--workers 4] [--compare previous.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.scripted_agent import RandomVoter
+from environment import NUM_TO_ROLES, Environment
+from tournament import _run_game_task, play_game
+from utils import MessagePool
+
+AGENT_NAMES = ["Alice", "Bob", "Charlie", "David", "Eve", "Frank", "Grace"]
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Modules whose import time is measured, from the game engine alone to the LLM agents
+STARTUP_MODULES = ["environment", "tournament", "agents.registry", "agents.scripted_agent", "agents.outlines_agent"]
+
+
+def get_agent_names(num_agents: int) -> List[str]:
+    """
+    Returns the names of the agents of a game.
+
+    Args:
+        num_agents (int): The number of agents.
+
+    Returns:
+        List[str]: The names, generated for games larger than AGENT_NAMES.
+    """
+    if num_agents <= len(AGENT_NAMES):
+        return AGENT_NAMES[:num_agents]
+    return [f"Agent{i}" for i in range(num_agents)]
+
+
+def bench_games(num_agents: int, num_games: int) -> Dict[str, float]:
+    """
+    Plays games between random voters and measures their throughput.
+
+    Args:
+        num_agents (int): The number of agents per game.
+        num_games (int): The number of games.
+
+    Returns:
+        Dict[str, float]: The throughput metrics.
+    """
+    agent_names = get_agent_names(num_agents)
+    # Rounds last three steps per alive agent and eliminate one agent, so large games need more steps
+    max_steps = max(200, 4 * num_agents * num_agents)
+    num_steps = 0
+    start = time.perf_counter()
+    for seed in range(num_games):
+        env = Environment(agents=list(agent_names), keyword_pair=("openai", "chatgpt"), seed=seed)
+        num_steps += play_game(env, {name: RandomVoter(name, seed) for name in agent_names}, max_steps)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    env = Environment(agents=list(agent_names), keyword_pair=("openai", "chatgpt"), seed=0)
+    play_game(env, {name: RandomVoter(name, 0) for name in agent_names}, max_steps)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "steps_per_sec": num_steps / elapsed,
+        "games_per_sec": num_games / elapsed,
+        "steps_per_game": num_steps / num_games,
+        "peak_memory_kib": peak_memory / 1024,
+    }
+
+
+def bench_observation(num_messages: int, num_agents: int = 5, repeat: int = 200) -> Dict[str, float]:
+    """
+    Measures the time to build an agent's observation from a message pool.
+
+    Args:
+        num_messages (int): The number of messages in the pool.
+        num_agents (int): The number of agents. Defaults to 5.
+        repeat (int): The number of observations built. Defaults to 200.
+
+    Returns:
+        Dict[str, float]: The mean time of a full and of an incremental observation, in microseconds.
+    """
+    agent_names = AGENT_NAMES[:num_agents]
+    message_pool = MessagePool()
+    for i in range(num_messages):
+        sender = agent_names[i % num_agents]
+        # Alternate public messages and private votes, as in a game
+        receiver = agent_names if i % 3 else [sender]
+        message_pool.add_message(sender, f"message {i}", receiver)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        [str(message) for message in message_pool.get_message(agent_names[0])]
+    full_us = (time.perf_counter() - start) / repeat * 1e6
+
+    offset = message_pool.count_message(agent_names[0]) - num_agents
+    start = time.perf_counter()
+    for _ in range(repeat):
+        [str(message) for message in message_pool.get_message(agent_names[0], offset=offset)]
+    incremental_us = (time.perf_counter() - start) / repeat * 1e6
+
+    return {"full_observation_us": full_us, "incremental_observation_us": incremental_us}
+
+
+def bench_import(module: str, repeat: int = 5) -> Optional[Dict[str, float]]:
+    """
+    Measures the time to import a module in a fresh interpreter.
+
+    Args:
+        module (str): The name of the module.
+        repeat (int): The number of interpreters started. Defaults to 5.
+
+    Returns:
+        Optional[Dict[str, float]]: The median import time and interpreter lifetime in milliseconds, or None if
+            the module cannot be imported, e.g. because an optional dependency is missing.
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    import_times = []
+    process_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True)
+        process_times.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            return None
+        import_times.append(float(process.stdout))
+    return {"import_ms": median(import_times) * 1e3, "process_ms": median(process_times) * 1e3}
+
+
+def bench_pool_startup(num_workers: int) -> Dict[str, float]:
+    """
+    Measures the time for a pool of spawned worker processes to play one game each with scripted agents.
+
+    Spawned workers start from a fresh interpreter, as on macOS and Windows, so this is dominated by imports.
+
+    Args:
+        num_workers (int): The number of worker processes.
+
+    Returns:
+        Dict[str, float]: The time until every worker played its game, in milliseconds.
+    """
+    tasks = [
+        ("random_voter", "random_voter", AGENT_NAMES[:5], ("openai", "chatgpt"), seed, 200)
+        for seed in range(num_workers)
+    ]
+    start = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(num_workers) as pool:
+        pool.map(_run_game_task, tasks, chunksize=1)
+    return {"first_games_ms": (time.perf_counter() - start) * 1e3}
+
+
+def git_revision() -> str:
+    """
+    Returns the current git revision, or "unknown" outside a git checkout.
+
+    Returns:
+        str: The revision.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    """
+    Prints the ratio of every metric to the one of a previous run.
+
+    Args:
+        results (Dict[str, Any]): The results of this run.
+        previous (Dict[str, Any]): The results of a previous run.
+
+    Returns:
+        None
+    """
+    print(f"\nCompared to {previous['revision']} ({previous['timestamp']}):")
+    for group in ["games", "observation", "startup"]:
+        for key, metrics in results[group].items():
+            previous_metrics = previous.get(group, {}).get(key)
+            if not previous_metrics:
+                continue
+            ratios = ", ".join(
+                f"{metric} x{value / previous_metrics[metric]:.2f}"
+                for metric, value in metrics.items()
+                if previous_metrics.get(metric)
+            )
+            print(f"  {group}[{key}]: {ratios}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--games", type=int, default=200, help="number of games per player count")
+    arg_parser.add_argument(
+        "--players", type=int, nargs="+", default=sorted(NUM_TO_ROLES), help="player counts of the game benchmark"
+    )
+    arg_parser.add_argument(
+        "--history", type=int, nargs="+", default=[100, 1000, 10000], help="message pool sizes of the observation benchmark"
+    )
+    arg_parser.add_argument("--workers", type=int, default=4, help="number of spawned workers of the startup benchmark")
+    arg_parser.add_argument("--output", help="path of the JSON results, defaults to benchmarks/results/engine-<time>.json")
+    arg_parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    args = arg_parser.parse_args()
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "games": {},
+        "observation": {},
+        "startup": {},
+    }
+
+    for num_agents in args.players:
+        metrics = bench_games(num_agents, args.games)
+        results["games"][str(num_agents)] = metrics
+        print(
+            f"{num_agents} agents: {metrics['steps_per_sec']:.0f} steps/s, {metrics['games_per_sec']:.1f} games/s, "
+            f"{metrics['steps_per_game']:.1f} steps/game, {metrics['peak_memory_kib']:.0f} KiB peak"
+        )
+
+    for num_messages in args.history:
+        metrics = bench_observation(num_messages)
+        results["observation"][str(num_messages)] = metrics
+        print(
+            f"{num_messages} messages: {metrics['full_observation_us']:.1f} us full, "
+            f"{metrics['incremental_observation_us']:.1f} us incremental observation"
+        )
+
+    for module in STARTUP_MODULES:
+        metrics = bench_import(module)
+        if metrics is None:
+            print(f"import {module}: skipped, the module cannot be imported")
+            continue
+        results["startup"][module] = metrics
+        print(f"import {module}: {metrics['import_ms']:.1f} ms, {metrics['process_ms']:.1f} ms with the interpreter")
+
+    metrics = bench_pool_startup(args.workers)
+    results["startup"][f"pool-{args.workers}"] = metrics
+    print(f"{args.workers} spawned workers: {metrics['first_games_ms']:.0f} ms to play their first game")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"engine-{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
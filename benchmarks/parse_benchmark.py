@@ -0,0 +1,140 @@
+"""
+Benchmark of the action parser over recorded raw outputs.
+
+Compares the BeautifulSoup parse previously used by OutlinesAgent with agents.parsing.extract_tag, and
+measures the output tokens a "</message>" stop sequence would have saved.
+
+Usage:
+    python benchmarks/parse_benchmark.py [--raw-actions raw_actions.jsonl] [--repeat 200]
+
+The raw actions file has one JSON object per line with a "raw" field. Without it, raw actions are
+synthesized from the messages of logs/example.txt, closed, unclosed, cut off and followed by extra text.
+
+BeautifulSoup is only needed by this benchmark, install it with `pip install bs4`.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bs4
+import tiktoken
+
+from agents.parsing import extract_tag
+
+EXAMPLE_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "example.txt")
+
+
+def load_raw_actions(path: str) -> List[str]:
+    """
+    Loads recorded raw actions from a JSONL file.
+
+    Args:
+        path (str): The path of the JSONL file.
+
+    Returns:
+        List[str]: The raw actions.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["raw"] for line in f if line.strip()]
+
+
+def synthesize_raw_actions(path: str = EXAMPLE_LOG) -> List[str]:
+    """
+    Synthesizes raw actions from the agent messages of a text game log.
+
+    Args:
+        path (str): The path of the text game log. Defaults to logs/example.txt.
+
+    Returns:
+        List[str]: The raw actions.
+    """
+    raw_actions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if " -> " not in line or line.startswith("Moderator"):
+                continue
+            content = line.split(": ", 1)[1].rstrip("\n")
+            raw_actions.extend([
+                f"<message>{content}</message>",
+                f"<message>{content}</message>\nAlice: <message>Let me add something.</message>",
+                f"<message>{content}",
+                f"<message>{content}</",
+                f"Sure. {content}",
+            ])
+    return raw_actions
+
+
+def parse_bs4(raw_action: str) -> Optional[str]:
+    """
+    Parses a raw action with BeautifulSoup, as OutlinesAgent did before extract_tag.
+
+    Args:
+        raw_action (str): The raw action.
+
+    Returns:
+        Optional[str]: The text content of the message tag, or None if it is missing.
+    """
+    parsed_result = bs4.BeautifulSoup(raw_action, "html.parser").find("message")
+    return parsed_result.text if parsed_result else None
+
+
+def time_parser(parser: Callable[[str], Optional[str]], raw_actions: List[str], repeat: int) -> float:
+    """
+    Times a parser over the raw actions.
+
+    Args:
+        parser (Callable[[str], Optional[str]]): The parser.
+        raw_actions (List[str]): The raw actions.
+        repeat (int): The number of passes over the raw actions.
+
+    Returns:
+        float: The mean time per parse in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for raw_action in raw_actions:
+            parser(raw_action)
+    return (time.perf_counter() - start) / (repeat * len(raw_actions)) * 1e6
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--raw-actions", help="JSONL file of recorded raw actions")
+    arg_parser.add_argument("--repeat", type=int, default=200, help="number of passes over the raw actions")
+    args = arg_parser.parse_args()
+
+    raw_actions = load_raw_actions(args.raw_actions) if args.raw_actions else synthesize_raw_actions()
+
+    bs4_us = time_parser(parse_bs4, raw_actions, args.repeat)
+    extract_us = time_parser(extract_tag, raw_actions, args.repeat)
+
+    agreements = sum(
+        (parse_bs4(raw_action) or "").strip() == (extract_tag(raw_action) or "")
+        for raw_action in raw_actions
+    )
+
+    encoding = tiktoken.get_encoding("cl100k_base")
+    total_tokens = 0
+    saved_tokens = 0
+    for raw_action in raw_actions:
+        num_tokens = len(encoding.encode(raw_action))
+        total_tokens += num_tokens
+        end = raw_action.find("</message>")
+        if end != -1:
+            saved_tokens += num_tokens - len(encoding.encode(raw_action[:end]))
+
+    print(f"raw actions:                 {len(raw_actions)}")
+    print(f"bs4 parse:                   {bs4_us:.1f} us/action")
+    print(f"extract_tag:                 {extract_us:.1f} us/action ({bs4_us / extract_us:.1f}x faster)")
+    print(f"same content as bs4:         {agreements / len(raw_actions):.1%}")
+    print(f"output tokens:               {total_tokens}")
+    print(f"saved by </message> stop:    {saved_tokens} ({saved_tokens / total_tokens:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Load test of the game server with stub agents simulating the latency of an LLM call.
+
+Plays many concurrent sessions in one process and reports the session throughput, the CPU time per session,
+the number of sessions one core sustains, and the tail latency of a step (from the request of an action to
+the publication of its messages to the clients). Every session can be watched by spectators draining their
+event stream, to include the cost of streaming. Results can be written as JSON so that runs can be compared.
+
+Usage:
+    python benchmarks/server_load_test.py [--sessions 1000] [--max-sessions 200] [--latency 0.05]
+        [--agents 5] [--spectators 1] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from statistics import quantiles
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.scripted_agent import RandomVoter
+from server import GameServer, Subscription
+
+AGENT_NAMES = ["Alice", "Bob", "Charlie", "David", "Eve", "Frank", "Grace"]
+
+
+class StubAgent(RandomVoter):
+    """
+    Random voter answering after a fixed delay, standing in for an agent calling a remote LLM.
+
+    Attributes:
+        latency (float): The delay of every action, in seconds.
+    """
+    def __init__(self, name: str, seed: int, latency: float) -> None:
+        """
+        Initializes a new StubAgent instance.
+
+        Args:
+            name (str): The name of the agent.
+            seed (int): Seed of the random number generator.
+            latency (float): The delay of every action, in seconds.
+
+        Returns:
+            None
+        """
+        super().__init__(name, seed)
+        self.latency = latency
+
+    async def aact(self, message_history: List[str], phase: str) -> str:
+        await asyncio.sleep(self.latency)
+        return self.act(message_history, phase)
+
+
+async def drain(subscription: Subscription) -> int:
+    """
+    Reads the events of a subscription until it ends, like a client keeping up with the game.
+
+    Args:
+        subscription (Subscription): The subscription.
+
+    Returns:
+        int: The number of events read.
+    """
+    num_events = 0
+    async for _ in subscription:
+        num_events += 1
+    return num_events
+
+
+async def load_test(
+    num_sessions: int, max_sessions: int, latency: float, num_agents: int, num_spectators: int
+) -> Dict[str, Any]:
+    """
+    Plays sessions between stub agents on a server and measures its throughput and latency.
+
+    Args:
+        num_sessions (int): The number of sessions played.
+        max_sessions (int): The number of sessions played at the same time.
+        latency (float): The delay of every agent action, in seconds.
+        num_agents (int): The number of agents per session.
+        num_spectators (int): The number of spectators of every session.
+
+    Returns:
+        Dict[str, Any]: The metrics.
+    """
+    server = GameServer(max_sessions=max_sessions, max_concurrent_actions=max_sessions * num_agents)
+    agent_names = AGENT_NAMES[:num_agents]
+    tasks = []
+    for seed in range(num_sessions):
+        session_id = f"session-{seed}"
+        session = server.create_session(
+            session_id,
+            {name: StubAgent(name, seed, latency) for name in agent_names},
+            ("openai", "chatgpt"),
+            seed=seed,
+        )
+        tasks.extend(asyncio.create_task(drain(session.subscribe())) for _ in range(num_spectators))
+        tasks.append(asyncio.create_task(server.run_session(session_id)))
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    results = await asyncio.gather(*tasks)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    server.close()
+
+    sessions = [result for result in results if not isinstance(result, int)]
+    step_seconds = [elapsed for session in sessions for elapsed in session.step_seconds]
+    num_steps = len(step_seconds)
+    p50, p95, p99 = (quantiles(step_seconds, n=100)[i] for i in (49, 94, 98))
+    return {
+        "sessions_per_sec": num_sessions / wall,
+        "steps_per_sec": num_steps / wall,
+        "cpu_ms_per_session": cpu / num_sessions * 1e3,
+        # Sessions that one fully busy core hosts at the same time: the CPU time per session spread over its duration
+        "sessions_per_core": sum(step_seconds) / cpu if cpu else float("inf"),
+        "events_streamed": sum(result for result in results if isinstance(result, int)),
+        "step_p50_ms": p50 * 1e3,
+        "step_p95_ms": p95 * 1e3,
+        "step_p99_ms": p99 * 1e3,
+        "cpu_utilization": cpu / wall,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sessions", type=int, default=1000, help="number of sessions played")
+    arg_parser.add_argument("--max-sessions", type=int, default=200, help="number of sessions played at the same time")
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="delay of every agent action, in seconds")
+    arg_parser.add_argument("--agents", type=int, default=5, choices=range(3, len(AGENT_NAMES) + 1), help="agents per session")
+    arg_parser.add_argument("--spectators", type=int, default=1, help="spectators streaming every session")
+    arg_parser.add_argument("--output", help="path of the JSON results")
+    args = arg_parser.parse_args()
+
+    metrics = asyncio.run(load_test(args.sessions, args.max_sessions, args.latency, args.agents, args.spectators))
+    print(
+        f"{args.sessions} sessions, {args.max_sessions} at a time, {args.latency * 1e3:.0f} ms per action: "
+        f"{metrics['sessions_per_sec']:.1f} sessions/s, {metrics['steps_per_sec']:.0f} steps/s, "
+        f"{metrics['cpu_ms_per_session']:.2f} CPU ms/session, {metrics['sessions_per_core']:.0f} sessions/core"
+    )
+    print(
+        f"step latency: p50 {metrics['step_p50_ms']:.1f} ms, p95 {metrics['step_p95_ms']:.1f} ms, "
+        f"p99 {metrics['step_p99_ms']:.1f} ms ({metrics['events_streamed']} events streamed)"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), **metrics}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import os
+from typing import Any, Dict, Iterator
+
+
+class CheckpointLog:
+    """
+    Append-only JSONL file written through after every record, so that a run killed at any point can resume.
+
+    Each record is flushed to the operating system as soon as it is appended, which survives the death of the
+    process. Pass fsync=True to also survive a power loss, at the cost of a disk sync per record. A record cut
+    short by a crash is dropped when the file is opened again.
+
+    Attributes:
+        path (str): The path of the JSONL file.
+        fsync (bool): Whether every record is synced to disk.
+    """
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        """
+        Initializes a CheckpointLog object.
+
+        Args:
+            path (str): The path of the JSONL file. Records are appended if the file already exists.
+            fsync (bool): Whether every record is synced to disk. Defaults to False.
+
+        Returns:
+            None
+        """
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """
+        Appends a record and writes it through.
+
+        Args:
+            record (Dict[str, Any]): The JSON serializable record.
+
+        Returns:
+            None
+        """
+        if self._file is None:
+            self._open()
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """
+        Closes the file.
+
+        Returns:
+            None
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self) -> None:
+        """
+        Opens the file for appending, after dropping a last record cut short by a crash.
+
+        Only the end of the file is read, back to the last complete record, so opening costs the same however long
+        the log is.
+
+        Returns:
+            None
+        """
+        if os.path.exists(self.path):
+            with open(self.path, "rb+") as f:
+                end = f.seek(0, os.SEEK_END)
+                if end > 0:
+                    f.seek(end - 1)
+                    if f.read(1) != b"\n":
+                        f.truncate(_last_line_end(f, end - 1))
+        self._file = open(self.path, "a", encoding="utf-8")
+
+
+def _last_line_end(f: Any, end: int, chunk_size: int = 4096) -> int:
+    """
+    Finds the end of the last complete line of a binary file, reading backwards from a position.
+
+    Args:
+        f (Any): The file, opened in binary mode.
+        end (int): The position to read backwards from.
+        chunk_size (int): The number of bytes read at once. Defaults to 4096.
+
+    Returns:
+        int: The position after the last newline before end, or 0 if there is none.
+    """
+    while end > 0:
+        start = max(0, end - chunk_size)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        end = start
+    return 0
+
+
+def read_checkpoint_log(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the complete records of a checkpoint log, skipping a last record cut short by a crash.
+
+    Args:
+        path (str): The path of the JSONL file.
+
+    Returns:
+        Iterator[Dict[str, Any]]: The records in the order they were appended.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                return
+            yield json.loads(line)
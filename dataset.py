@@ -0,0 +1,332 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from environment import Environment
+
+# Compact trajectory of a game, as returned by get_trajectory
+Trajectory = Dict[str, Any]
+
+
+def get_schema() -> Any:
+    """
+    Returns the Arrow schema of the turn records.
+
+    Returns:
+        pyarrow.Schema: The schema.
+    """
+    import pyarrow as pa
+
+    return pa.schema([
+        ("trajectory_id", pa.string()),
+        ("game", pa.string()),
+        ("config", pa.string()),
+        ("turn", pa.int32()),
+        ("agent", pa.string()),
+        ("role", pa.string()),
+        ("phase", pa.string()),
+        ("observation", pa.list_(pa.string())),
+        ("action", pa.string()),
+        ("won", pa.bool_()),
+        ("winners", pa.list_(pa.string())),
+        ("finished", pa.bool_()),
+    ])
+
+
+def get_trajectory(env: Environment) -> Trajectory:
+    """
+    Returns the trajectory of a game played with record_trajectory=True, in a compact form.
+
+    Every message is kept once, with the indices of the messages visible to each agent, and each step only refers
+    to the prefix the agent saw, so the trajectory is cheap to send between processes. iter_turn_records expands
+    it into records.
+
+    Args:
+        env (Environment): The environment of the game.
+
+    Returns:
+        Trajectory: The messages, the messages visible to every agent, the steps, the roles and the winners of the game.
+    """
+    if env.trajectory is None:
+        raise ValueError("The game was played without record_trajectory=True.")
+    messages = env.message_pool.get_message()
+    message_to_index = {id(message): index for index, message in enumerate(messages)}
+    return {
+        "messages": [str(message) for message in messages],
+        "visible": {
+            agent: [message_to_index[id(message)] for message in env.message_pool.get_message(agent)]
+            for agent in env.initial_agents
+        },
+        "steps": [list(step) for step in env.trajectory],
+        "roles": {agent: role.name for agent, role in env.agent_to_role.items()},
+        "winners": [role.name for role in env.winners],
+    }
+
+
+def get_trajectory_id(trajectory: Trajectory) -> str:
+    """
+    Returns an identifier of the content of a trajectory, equal for games played identically.
+
+    Games with the same roles, observations and actions are identical, whatever their seed or config.
+
+    Args:
+        trajectory (Trajectory): The trajectory.
+
+    Returns:
+        str: The identifier.
+    """
+    payload = json.dumps(
+        [trajectory["messages"], trajectory["visible"], trajectory["steps"], trajectory["roles"]], sort_keys=True
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def iter_turn_records(
+    trajectory: Trajectory, config: str = "", game_id: str = "", trajectory_id: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Expands a trajectory into one record per step.
+
+    Args:
+        trajectory (Trajectory): The trajectory.
+        config (str): The name of the agent factory that played the game. Defaults to "".
+        game_id (str): The identifier of the game. Defaults to "".
+        trajectory_id (Optional[str]): The identifier of the trajectory. Defaults to None, which computes it.
+
+    Returns:
+        Iterator[Dict[str, Any]]: The records, in the order of the steps.
+    """
+    if trajectory_id is None:
+        trajectory_id = get_trajectory_id(trajectory)
+    messages = trajectory["messages"]
+    visible = trajectory["visible"]
+    roles = trajectory["roles"]
+    winners = trajectory["winners"]
+    for turn, (agent, phase, num_visible, action) in enumerate(trajectory["steps"]):
+        yield {
+            "trajectory_id": trajectory_id,
+            "game": game_id,
+            "config": config,
+            "turn": turn,
+            "agent": agent,
+            "role": roles[agent],
+            "phase": phase,
+            "observation": [messages[index] for index in visible[agent][:num_visible]],
+            "action": action,
+            "won": roles[agent] in winners,
+            "winners": winners,
+            "finished": bool(winners),
+        }
+
+
+class DatasetWriter:
+    """
+    Writes turn records to a directory of sharded Arrow files, skipping games identical to one already written.
+
+    Each record is one step of an agent in a self-play game: the messages visible to it before acting (its
+    observation), the phase, its action, and the outcome of the game for its role. The shards can be memory
+    mapped by datasets, see load_dataset.
+
+    Records are buffered and written in batches to the current shard, which is closed once it holds shard_size
+    records, so memory stays bounded by a batch. Shards are Arrow streams, the format of datasets, and a directory
+    can be written to again after a crash: new shards are numbered after the existing ones, and the trajectories of
+    the existing shards count as written. A shard cut short by a crash should be deleted before.
+
+    The identifiers of the written games are kept in a temporary SQLite index on disk rather than in memory, so
+    deduplicating does not grow the memory of long runs. The index is rebuilt from the shards on every run.
+
+    Attributes:
+        directory (str): The directory of the shards.
+        shard_size (int): The number of records per shard.
+        batch_size (int): The number of buffered records that triggers a write.
+        dedup (bool): Whether games identical to one already written are skipped.
+        num_games (int): The number of games written.
+        num_duplicates (int): The number of games skipped as duplicates.
+        num_records (int): The number of records written.
+    """
+    def __init__(self, directory: str, shard_size: int = 100000, batch_size: int = 1000, dedup: bool = True) -> None:
+        """
+        Initializes a DatasetWriter object.
+
+        Args:
+            directory (str): The directory of the shards, created if needed.
+            shard_size (int): The number of records per shard. Defaults to 100000.
+            batch_size (int): The number of buffered records that triggers a write. Defaults to 1000.
+            dedup (bool): Whether games identical to one already written are skipped. Defaults to True.
+
+        Returns:
+            None
+        """
+        self.directory = directory
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.dedup = dedup
+        self.num_games = 0
+        self.num_duplicates = 0
+        self.num_records = 0
+        self._buffer = []
+        self._shard = None
+        self._shard_records = 0
+        self._index = None
+        os.makedirs(directory, exist_ok=True)
+        shards = list_shards(directory)
+        self._num_shards = len(shards)
+        if dedup:
+            import pyarrow as pa
+
+            # An empty path is a private database on disk, deleted when it is closed
+            self._index = sqlite3.connect("", isolation_level=None)
+            self._index.execute("CREATE TABLE written (trajectory_id BLOB PRIMARY KEY)")
+            for path in shards:
+                with pa.memory_map(path) as source:
+                    for batch in pa.ipc.open_stream(source):
+                        self._index.executemany(
+                            "INSERT OR IGNORE INTO written VALUES (?)",
+                            [(bytes.fromhex(value),) for value in batch.column("trajectory_id").to_pylist()],
+                        )
+
+    def write(self, trajectory: Trajectory, config: str = "", game_id: str = "") -> bool:
+        """
+        Adds the records of a game, writing the buffer if it is full.
+
+        Args:
+            trajectory (Trajectory): The trajectory of the game, e.g. GameResult.trajectory.
+            config (str): The name of the agent factory that played the game. Defaults to "".
+            game_id (str): The identifier of the game. Defaults to "".
+
+        Returns:
+            bool: True if the game was added, False if it is a duplicate.
+        """
+        trajectory_id = get_trajectory_id(trajectory)
+        if self._index is not None:
+            cursor = self._index.execute("INSERT OR IGNORE INTO written VALUES (?)", (bytes.fromhex(trajectory_id),))
+            if not cursor.rowcount:
+                self.num_duplicates += 1
+                return False
+
+        self.num_games += 1
+        for record in iter_turn_records(trajectory, config, game_id, trajectory_id):
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+        return True
+
+    def flush(self) -> None:
+        """
+        Writes the buffered records.
+
+        Returns:
+            None
+        """
+        import pyarrow as pa
+
+        schema = get_schema()
+        start = 0
+        while start < len(self._buffer):
+            if self._shard is None:
+                path = os.path.join(self.directory, f"shard-{self._num_shards:05d}.arrow")
+                self._shard = pa.ipc.new_stream(pa.OSFile(path, "wb"), schema)
+                self._num_shards += 1
+            # Never write more records than the shard has room for
+            end = min(len(self._buffer), start + self.shard_size - self._shard_records)
+            self._shard.write_batch(pa.RecordBatch.from_pylist(self._buffer[start:end], schema=schema))
+            self._shard_records += end - start
+            self.num_records += end - start
+            start = end
+            if self._shard_records >= self.shard_size:
+                self._close_shard()
+        self._buffer = []
+
+    def close(self) -> None:
+        """
+        Writes the remaining records, closes the current shard and deletes the index of the written games.
+
+        Returns:
+            None
+        """
+        self.flush()
+        self._close_shard()
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def _close_shard(self) -> None:
+        """
+        Closes the current shard, if any.
+
+        Returns:
+            None
+        """
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+            self._shard_records = 0
+
+
+def export_dataset(results: Iterable[Any], directory: str, **writer_kwargs: Any) -> Iterator[Any]:
+    """
+    Writes the turn records of games as their results stream in, and passes the results on.
+
+    Games are recorded with Environment(record_trajectory=True), and exported while the tournament runs:
+
+        results = iter_tournament(..., record_trajectories=True)
+        for result in export_dataset(results, "data/selfplay"):
+            ...
+
+    Results without a trajectory, e.g. from a tournament without record_trajectories=True, are passed on without
+    being written.
+
+    Args:
+        results (Iterable[GameResult]): The results, e.g. from tournament.iter_tournament.
+        directory (str): The directory of the shards.
+        **writer_kwargs (Any): Keyword arguments of the DatasetWriter, e.g. shard_size or dedup.
+
+    Returns:
+        Iterator[GameResult]: The results.
+    """
+    writer = DatasetWriter(directory, **writer_kwargs)
+    try:
+        for result in results:
+            if result.trajectory is not None:
+                writer.write(result.trajectory, result.config, str(result.seed))
+            yield result
+    finally:
+        writer.close()
+
+
+def list_shards(directory: str) -> List[str]:
+    """
+    Returns the paths of the shards of a directory, in order.
+
+    Args:
+        directory (str): The directory of the shards.
+
+    Returns:
+        List[str]: The paths.
+    """
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if name.startswith("shard-") and name.endswith(".arrow")
+    ]
+
+
+def load_dataset(directory: str) -> Any:
+    """
+    Loads the turn records of a directory as a memory mapped datasets.Dataset.
+
+    Args:
+        directory (str): The directory of the shards.
+
+    Returns:
+        datasets.Dataset: The records.
+    """
+    import datasets
+
+    shards = list_shards(directory)
+    if not shards:
+        return datasets.Dataset.from_list([], features=datasets.Features.from_arrow_schema(get_schema()))
+    return datasets.concatenate_datasets([datasets.Dataset.from_file(path) for path in shards])
@@ -1,6 +1,9 @@
 import random
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
 
+import metrics
+from checkpoint import CheckpointLog, read_checkpoint_log
+from game_log import GameLogger
 from utils import GamePhase, GameRole, MessagePool, VoteManager
 
 NUM_TO_ROLES = {
@@ -12,6 +15,45 @@ NUM_TO_ROLES = {
     7: [4, 2, 1],
 }
 
+# Share of the agents playing each impostor role in games whose size is not in NUM_TO_ROLES, the others are civilians
+DEFAULT_ROLE_RATIOS = {
+    GameRole.UNDERCOVER: 0.2,
+    GameRole.MRWHITE: 0.1,
+}
+
+# Phases in which no agent can see the others' actions, so all agents may act at the same time
+SIMULTANEOUS_PHASES = [GamePhase.VOTING]
+
+
+def get_role_counts(num_agents: int, role_ratios: Optional[Dict[GameRole, float]] = None) -> List[int]:
+    """
+    Computes the number of agents of each role.
+
+    Args:
+        num_agents (int): The number of agents in the game.
+        role_ratios (Optional[Dict[GameRole, float]]): The share of the agents playing the undercover and Mr. White
+            roles, rounded to the nearest number of agents, the other agents are civilians. Defaults to None, which
+            uses NUM_TO_ROLES for games of 3 to 7 agents and DEFAULT_ROLE_RATIOS for larger games.
+
+    Returns:
+        List[int]: The number of civilians, undercovers and Mr. Whites.
+    """
+    if role_ratios is None:
+        if num_agents in NUM_TO_ROLES:
+            return list(NUM_TO_ROLES[num_agents])
+        role_ratios = DEFAULT_ROLE_RATIOS
+
+    num_undercover = round(num_agents * role_ratios.get(GameRole.UNDERCOVER, 0))
+    num_mrwhite = round(num_agents * role_ratios.get(GameRole.MRWHITE, 0))
+    num_civilian = num_agents - num_undercover - num_mrwhite
+    if num_undercover + num_mrwhite == 0 or num_civilian < 2:
+        raise ValueError(
+            f"Role ratios {role_ratios} give {num_civilian} civilians, {num_undercover} undercovers and "
+            f"{num_mrwhite} Mr. Whites for {num_agents} agents, a game needs at least 2 civilians and 1 impostor."
+        )
+    return [num_civilian, num_undercover, num_mrwhite]
+
+
 class Environment:
     """
     Environment for the game Undercover.
@@ -19,6 +61,12 @@ class Environment:
     Args:
         agents (List[str]): A list of agents participating in the game.
         keyword_pair (Tuple[str]): A tuple containing the two keywords for the game.
+        logger (Optional[GameLogger]): Optional sink that receives the game events as they happen.
+        seed (Optional[int]): Seed of the random number generator used to assign roles.
+        roles (Optional[Dict[GameRole, List[str]]]): Fixed roles of the agents instead of random ones, e.g. to replay a game.
+        role_ratios (Optional[Dict[GameRole, float]]): Share of the agents playing the undercover and Mr. White roles.
+        checkpoint (Optional[CheckpointLog]): Optional log receiving the setting and every action, to resume the game.
+        record_trajectory (bool): Whether to record the agent, phase, visible messages and action of every step.
 
     Attributes:
         initial_agents (List[str]): A list of agents participating in the game.
@@ -30,21 +78,56 @@ class Environment:
         vote_manager (VoteManager): The vote manager managing the votes in the game.
         terminal (bool): True if the game is in a terminal state, False otherwise.
         role_to_agents (Dict[GameRole, List[str]]): A dictionary mapping game roles to agents.
+        agent_to_role (Dict[str, GameRole]): A dictionary mapping agents to their game role.
+        alive_role_counts (Dict[GameRole, int]): The number of alive agents of each role.
+        alive_mask (int): The alive agents encoded with the registry of the message pool.
+        guessing_agent (Optional[str]): The eliminated Mr. White guessing the keyword in the guessing phase.
+        logger (Optional[GameLogger]): Sink that receives the game events, or None if the game is not logged.
+        rng (random.Random): The random number generator of the game.
+        fixed_roles (Optional[Dict[GameRole, List[str]]]): Fixed roles of the agents, or None to assign random roles.
+        role_ratios (Optional[Dict[GameRole, float]]): Share of the agents playing the impostor roles, or None for the default.
+        winners (List[GameRole]): The roles that won the game, empty until the game is in a terminal state.
+        num_rounds (int): The number of completed voting phases.
+        num_steps (int): The number of steps taken since the game started.
+        checkpoint (Optional[CheckpointLog]): Log receiving the setting and every action, or None without checkpoints.
+        trajectory (Optional[List[Tuple[str, str, int, str]]]): The agent, phase name, number of messages visible to
+            the agent and action of every step, or None if the trajectory is not recorded.
     """
 
-    def __init__(self, agents: List[str], keyword_pair: Tuple[str]) -> None:
+    def __init__(
+        self,
+        agents: List[str],
+        keyword_pair: Tuple[str],
+        logger: Optional[GameLogger] = None,
+        seed: Optional[int] = None,
+        roles: Optional[Dict[GameRole, List[str]]] = None,
+        role_ratios: Optional[Dict[GameRole, float]] = None,
+        checkpoint: Optional[CheckpointLog] = None,
+        record_trajectory: bool = False,
+    ) -> None:
         """
         Initializes the environment with the given list of agents and keyword pair.
 
         Args:
             agents (List[str]): A list of agents participating in the game.
             keyword_pair (Tuple[str]): A tuple containing the two keywords for the game.
+            logger (Optional[GameLogger]): Optional sink that receives the game events as they happen. Defaults to None.
+            seed (Optional[int]): Seed of the random number generator used to assign roles. Games with the same seed
+                are reproducible. Defaults to None, which seeds from system entropy.
+            roles (Optional[Dict[GameRole, List[str]]]): Fixed roles of the agents instead of random ones, e.g. to
+                replay a recorded game. Defaults to None.
+            role_ratios (Optional[Dict[GameRole, float]]): Share of the agents playing the undercover and Mr. White
+                roles, e.g. for games with hundreds of agents. Defaults to None, see get_role_counts.
+            checkpoint (Optional[CheckpointLog]): Optional log receiving the setting and every action as they
+                happen, so that a game interrupted by a crash can continue with Environment.resume. Defaults to None.
+            record_trajectory (bool): Whether to record the agent, phase, number of visible messages and action of
+                every step in trajectory, e.g. to export training data. Defaults to False.
 
         Returns:
             None
         """
-        # Check if the number of agents is between 3 and 7
-        assert 3 <= len(agents) <= 7, "Number of agents must be between 3 and 7."
+        # Check if there are enough agents for a game
+        assert len(agents) >= 3, "Number of agents must be at least 3."
 
         # Set the initial agents and create a copy as the alive agents
         self.initial_agents = agents
@@ -63,6 +146,22 @@ class Environment:
         self.vote_manager = None
         self.terminal = None
         self.role_to_agents = None
+        self.agent_to_role = None
+        self.alive_role_counts = None
+        self.alive_mask = None
+        self.guessing_agent = None
+        self.winners = None
+        self.num_rounds = None
+        self.num_steps = None
+        self.logger = logger
+        self.checkpoint = checkpoint
+        self.trajectory = [] if record_trajectory else None
+        self.rng = random.Random(seed)
+        self.fixed_roles = roles
+        self.role_ratios = role_ratios
+        if roles is None:
+            # Fail early on ratios that cannot make a game
+            get_role_counts(len(agents), role_ratios)
 
         # Call the reset method to reset the environment to its initial state
         self.reset()
@@ -76,11 +175,40 @@ class Environment:
         """
         self.agents = self.initial_agents.copy()
         self.current_agent_index = 0
-        self.message_pool = MessagePool()
+        self.message_pool = MessagePool(
+            on_message=self.logger.log_message if self.logger else None,
+            agent_names=self.initial_agents,
+        )
+        self.alive_mask = self.message_pool.registry.to_mask(self.agents)
         self.vote_manager = VoteManager(self.agents)
         self.terminal = False
+        self.guessing_agent = None
+        self.winners = []
+        self.num_rounds = 0
+        self.num_steps = 0
+        if self.trajectory is not None:
+            self.trajectory = []
         self._assign_roles()
 
+        if self.checkpoint is not None:
+            self.checkpoint.append({
+                "event": "setting",
+                "agents": self.initial_agents,
+                "keyword_pair": [self.role_to_keyword[GameRole.CIVILIAN], self.role_to_keyword[GameRole.UNDERCOVER]],
+                "roles": {role.name: agents for role, agents in self.role_to_agents.items()},
+                "fixed_roles": self.fixed_roles is not None,
+                "role_ratios": {role.name: ratio for role, ratio in self.role_ratios.items()} if self.role_ratios else None,
+                "rng_state": self.rng.getstate(),
+            })
+
+        if self.logger:
+            self.logger.log(
+                "setting",
+                agents=self.initial_agents,
+                roles={role.name: agents for role, agents in self.role_to_agents.items()},
+                keywords={role.name: keyword for role, keyword in self.role_to_keyword.items()},
+            )
+
         self._moderator_announce("The game Undercover starts!")
 
         civilians = self.role_to_agents[GameRole.CIVILIAN]
@@ -103,6 +231,7 @@ class Environment:
 
         self._update_phase(GamePhase.DESCRIPTION)
 
+    @metrics.timed("step_seconds", lambda self, agent, action: {"phase": self.phase.name})
     def step(self, agent: str, action: str) -> None:
         """
         Takes a step in the environment, updating the game state.
@@ -114,32 +243,47 @@ class Environment:
         Returns:
             None
         """
+        # Steps are deterministic, so journaling the action before applying it is enough to replay the step
+        if self.checkpoint is not None:
+            self.checkpoint.append({"event": "step", "agent": agent, "action": action})
+        if self.trajectory is not None:
+            # The observation of the step is the prefix of the agent's visible messages, so its length is enough
+            self.trajectory.append((agent, self.phase.name, self.message_pool.count_message(agent), action))
+        self.num_steps += 1
+
         if self.phase in [GamePhase.DESCRIPTION, GamePhase.DISCUSSION]:
             # description and discussion message is public
-            self.message_pool.add_message(agent, action, self.agents)
+            self.message_pool.add_message(agent, action, self.agents, self.alive_mask)
             if self.current_agent_index % len(self.agents) == 0:
                 self._update_phase(GamePhase(self.phase.value + 1))
 
         elif self.phase == GamePhase.VOTING:
             # voting message is private, only themselves can see
             self.message_pool.add_message(agent, action, [agent])
-            self.vote_manager.add_vote(action)
+            counted = self.vote_manager.add_vote(action)
+            if not counted and metrics.registry is not None:
+                metrics.registry.inc("invalid_votes_total")
+            if self.logger:
+                self.logger.log(
+                    "vote", round=self.num_rounds + 1, voter=agent, target=action.strip().capitalize(), counted=counted
+                )
 
             if self.current_agent_index % len(self.agents) == 0:
+                self.num_rounds += 1
                 eliminated_agent = self.vote_manager.get_eliminated_agent()
 
-                if eliminated_agent in self.role_to_agents[GameRole.MRWHITE]:
+                if self.agent_to_role.get(eliminated_agent) == GameRole.MRWHITE:
+                    self.guessing_agent = eliminated_agent
                     self._update_phase(GamePhase.GUESSING)
                 else:
                     self._moderator_announce(f"Agent {eliminated_agent} is eliminated.")
-                    self.agents.remove(eliminated_agent)
+                    self._eliminate(eliminated_agent)
 
                     terminal_status = self._check_terminal()
                     self.terminal = any(terminal_status.values())
                     if not self.terminal:
                         self._moderator_announce("Game continues.")
                         self._update_phase(GamePhase.DESCRIPTION)
-                        self.vote_manager = VoteManager(self.agents)
                     else:
                         self._anncounce_winner(terminal_status)
                         return
@@ -153,23 +297,76 @@ class Environment:
                     f"Agent {agent} guessed the keyword correctly! Mr. White wins!"
                 )
                 self.terminal = True
+                self._finish([GameRole.MRWHITE])
             else:
                 self._moderator_announce(
                     f"Agent {agent} is Mr. White, but guessed the keyword incorrectly."
                 )
                 self._moderator_announce(f"Agent {agent} is eliminated.")
-                self.agents.remove(agent)
+                self._eliminate(agent)
+                self.guessing_agent = None
 
                 terminal_status = self._check_terminal()
                 self.terminal = any(terminal_status.values())
                 if not self.terminal:
                     self._moderator_announce("Game continues.")
                     self._update_phase(GamePhase.DESCRIPTION)
-                    self.vote_manager = VoteManager(self.agents)
                 else:
                     self._anncounce_winner(terminal_status)
                     return
 
+    def get_simultaneous_agents(self) -> List[str]:
+        """
+        Returns the agents that can act at the same time in the current phase.
+
+        Returns:
+            List[str]: The agents yet to act in the current round, or an empty list if the phase is played in turns.
+        """
+        if self.phase not in SIMULTANEOUS_PHASES:
+            return []
+        return self.agents[self.current_agent_index:]
+
+    def step_batch(self, actions: Dict[str, str]) -> None:
+        """
+        Takes a step for each of the simultaneous agents, updating the game state.
+
+        The actions are applied in turn order, so the result does not depend on the order in which they were collected.
+
+        Args:
+            actions (Dict[str, str]): A dictionary mapping each agent returned by get_simultaneous_agents to its action.
+
+        Returns:
+            None
+        """
+        agents = self.get_simultaneous_agents()
+        if not agents:
+            raise ValueError(f"Agents cannot act simultaneously in phase {self.phase}")
+        if set(actions) != set(agents):
+            raise ValueError(f"Expected actions from {agents}, got actions from {list(actions)}")
+
+        for _ in agents:
+            agent = self.get_current_agent()
+            self.step(agent, actions[agent])
+
+    async def astep_batch(self, pending_actions: Dict[str, Awaitable[str]]) -> None:
+        """
+        Awaits the actions of the simultaneous agents concurrently and takes a step for each of them.
+
+        Args:
+            pending_actions (Dict[str, Awaitable[str]]): A dictionary mapping each agent returned by
+                get_simultaneous_agents to its pending action, e.g. the coroutine returned by Agent.aact.
+
+        Returns:
+            None
+        """
+        # Imported here like in Agent.aact, to keep asyncio out of the startup of synchronous simulations
+        import asyncio
+
+        agents = list(pending_actions)
+        actions = await asyncio.gather(*pending_actions.values())
+        self.step_batch(dict(zip(agents, actions)))
+
+    @metrics.timed("get_current_agent_seconds", lambda self: {"phase": self.phase.name})
     def get_current_agent(self) -> str:
         """
         Returns the current agent.
@@ -182,12 +379,147 @@ class Environment:
             next_agent = self.agents[self.current_agent_index]
             self.current_agent_index = (self.current_agent_index + 1) % len(self.agents)
         else:
-            # If in the guessing phase, the next agent is Mr. White
-            next_agent = self.role_to_agents[GameRole.MRWHITE][0]
+            # If in the guessing phase, the next agent is the eliminated Mr. White
+            next_agent = self.guessing_agent
 
 
         return next_agent
 
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Captures the state of the game, to be restored later with restore.
+
+        The message history is shared with the snapshot rather than copied, so taking a snapshot costs the same
+        regardless of the length of the game. Only the small mutable state is copied.
+
+        Returns:
+            Dict[str, Any]: The state of the game.
+        """
+        return {
+            "message_pool": self.message_pool.fork(),
+            "agents": self.agents.copy(),
+            "current_agent_index": self.current_agent_index,
+            "phase": self.phase,
+            "vote_manager": self.vote_manager.copy(),
+            "alive_role_counts": self.alive_role_counts.copy(),
+            "alive_mask": self.alive_mask,
+            "guessing_agent": self.guessing_agent,
+            "num_rounds": self.num_rounds,
+            "num_steps": self.num_steps,
+            "trajectory_length": len(self.trajectory) if self.trajectory is not None else 0,
+            "terminal": self.terminal,
+            "winners": self.winners.copy(),
+            "rng_state": self.rng.getstate(),
+        }
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Restores the state of the game captured by snapshot.
+
+        The snapshot is not modified, so it can be restored any number of times.
+
+        Args:
+            snapshot (Dict[str, Any]): The state of the game returned by snapshot.
+
+        Returns:
+            None
+        """
+        self.message_pool = snapshot["message_pool"].fork(on_message=self.message_pool.on_message)
+        self.agents = snapshot["agents"].copy()
+        self.current_agent_index = snapshot["current_agent_index"]
+        self.phase = snapshot["phase"]
+        self.vote_manager = snapshot["vote_manager"].copy()
+        self.alive_role_counts = snapshot["alive_role_counts"].copy()
+        self.alive_mask = snapshot["alive_mask"]
+        self.guessing_agent = snapshot["guessing_agent"]
+        self.num_rounds = snapshot["num_rounds"]
+        if self.checkpoint is not None and self.num_steps != snapshot["num_steps"]:
+            # The log is append-only, so it records that the steps after the snapshot were undone
+            self.checkpoint.append({"event": "rewind", "num_steps": snapshot["num_steps"]})
+        self.num_steps = snapshot["num_steps"]
+        if self.trajectory is not None:
+            del self.trajectory[snapshot["trajectory_length"]:]
+        self.terminal = snapshot["terminal"]
+        self.winners = snapshot["winners"].copy()
+        self.rng.setstate(snapshot["rng_state"])
+
+    def fork(self) -> "Environment":
+        """
+        Creates an independent copy of the game, e.g. for planning agents exploring possible continuations.
+
+        The fork shares the message history with this game structurally, so forking costs the same regardless of
+        the length of the game. The fork is not logged.
+
+        Returns:
+            Environment: The fork.
+        """
+        env = Environment.__new__(Environment)
+        env.initial_agents = self.initial_agents
+        env.role_to_keyword = self.role_to_keyword
+        env.role_to_agents = self.role_to_agents
+        env.agent_to_role = self.agent_to_role
+        env.fixed_roles = self.fixed_roles
+        env.role_ratios = self.role_ratios
+        env.logger = None
+        env.checkpoint = None
+        env.trajectory = None
+        env.rng = random.Random()
+        env.message_pool = MessagePool()
+        env.restore(self.snapshot())
+        return env
+
+    @classmethod
+    def resume(
+        cls, path: str, logger: Optional[GameLogger] = None, fsync: bool = False, record_trajectory: bool = False
+    ) -> Tuple["Environment", int]:
+        """
+        Resumes the last game of a checkpoint log written by an environment created with checkpoint.
+
+        The recorded actions are replayed without calling the agents, and the environment keeps appending to the
+        log, so it can be resumed again after another crash. The logger receives the events of the replayed steps
+        as well, since they are indistinguishable from the original ones.
+
+        Args:
+            path (str): The path of the checkpoint log.
+            logger (Optional[GameLogger]): Optional sink that receives the game events. Defaults to None.
+            fsync (bool): Whether every record appended from now on is synced to disk. Defaults to False.
+            record_trajectory (bool): Whether to record the trajectory, including the replayed steps. Defaults to False.
+
+        Returns:
+            Tuple[Environment, int]: The environment after the last recorded action, and the number of steps replayed.
+        """
+        setting = None
+        actions = []
+        for record in read_checkpoint_log(path):
+            if record["event"] == "setting":
+                setting = record
+                actions = []
+            elif record["event"] == "step":
+                actions.append((record["agent"], record["action"]))
+            elif record["event"] == "rewind":
+                del actions[record["num_steps"]:]
+        if setting is None:
+            raise ValueError(f"No game to resume in checkpoint {path}")
+
+        roles = {GameRole[role]: agents for role, agents in setting["roles"].items()}
+        env = cls(
+            setting["agents"], tuple(setting["keyword_pair"]), logger=logger, roles=roles, record_trajectory=record_trajectory
+        )
+        env.fixed_roles = roles if setting["fixed_roles"] else None
+        if setting["role_ratios"]:
+            env.role_ratios = {GameRole[role]: ratio for role, ratio in setting["role_ratios"].items()}
+        version, internal_state, gauss_next = setting["rng_state"]
+        env.rng.setstate((version, tuple(internal_state), gauss_next))
+
+        for step, (agent, action) in enumerate(actions):
+            current_agent = env.get_current_agent()
+            if env.terminal or current_agent != agent:
+                raise ValueError(f"Checkpoint {path} does not match the game at step {step}: expected {current_agent}, got {agent}")
+            env.step(agent, action)
+
+        env.checkpoint = CheckpointLog(path, fsync)
+        return env, len(actions)
+
     def export(self, path: str) -> None:
         """
         Exports the environment to a file at the specified path, including the game setting and game conversation.
@@ -219,15 +551,9 @@ class Environment:
         Returns:
             List[bool]: A list of booleans indicating if each role wins.
         """
-        alive_agents = {role: 0 for role in GameRole}
-        for agent in self.agents:
-            for role, agents in self.role_to_agents.items():
-                if agent in agents:
-                    alive_agents[role] += 1
-
-        num_alive_civilian = alive_agents[GameRole.CIVILIAN]
-        num_alive_undercover = alive_agents[GameRole.UNDERCOVER]
-        num_alive_mrwhite = alive_agents[GameRole.MRWHITE]
+        num_alive_civilian = self.alive_role_counts[GameRole.CIVILIAN]
+        num_alive_undercover = self.alive_role_counts[GameRole.UNDERCOVER]
+        num_alive_mrwhite = self.alive_role_counts[GameRole.MRWHITE]
 
         role_to_terminal = {role: False for role in GameRole}
         if num_alive_undercover + num_alive_mrwhite == 0:
@@ -265,6 +591,10 @@ class Environment:
     
         self._moderator_announce(phase_messages[new_phase])
         self.phase = new_phase
+        if new_phase == GamePhase.VOTING:
+            self.vote_manager.new_round()
+        if self.logger:
+            self.logger.log("phase", phase=new_phase.name)
     
     def _assign_roles(self) -> None:
         """
@@ -273,16 +603,41 @@ class Environment:
         Returns:
             None
         """
-        num_agents = len(self.initial_agents)
-        num_civilian, num_undercover, num_mrwhite = NUM_TO_ROLES[num_agents]
-    
-        roles = [GameRole.CIVILIAN] * num_civilian + [GameRole.UNDERCOVER] * num_undercover + [GameRole.MRWHITE] * num_mrwhite
-        random.shuffle(roles)
-    
-        self.role_to_agents = {role: [] for role in [GameRole.CIVILIAN, GameRole.UNDERCOVER, GameRole.MRWHITE]}
-    
-        for agent, role in zip(self.agents, roles):
-            self.role_to_agents[role].append(agent)
+        if self.fixed_roles is not None:
+            self.role_to_agents = {role: list(self.fixed_roles.get(role, [])) for role in GameRole}
+        else:
+            num_agents = len(self.initial_agents)
+            num_civilian, num_undercover, num_mrwhite = get_role_counts(num_agents, self.role_ratios)
+
+            roles = [GameRole.CIVILIAN] * num_civilian + [GameRole.UNDERCOVER] * num_undercover + [GameRole.MRWHITE] * num_mrwhite
+            self.rng.shuffle(roles)
+
+            self.role_to_agents = {role: [] for role in [GameRole.CIVILIAN, GameRole.UNDERCOVER, GameRole.MRWHITE]}
+
+            for agent, role in zip(self.agents, roles):
+                self.role_to_agents[role].append(agent)
+
+        self.agent_to_role = {agent: role for role, agents in self.role_to_agents.items() for agent in agents}
+        self.alive_role_counts = {role: len(agents) for role, agents in self.role_to_agents.items()}
+
+    def _eliminate(self, agent: str) -> None:
+        """
+        Removes an agent from the alive agents and updates the alive role counts and the votes.
+
+        Args:
+            agent (str): The agent to be eliminated.
+
+        Returns:
+            None
+        """
+        # Eliminations happen once per round of at least one step per alive agent, so removing the agent from
+        # the turn order is constant time per step
+        self.agents.remove(agent)
+        self.alive_role_counts[self.agent_to_role[agent]] -= 1
+        self.alive_mask &= ~(1 << self.message_pool.registry.get_id(agent))
+        self.vote_manager.remove_agent(agent)
+        if self.logger:
+            self.logger.log("elimination", round=self.num_rounds, agent=agent, role=self.agent_to_role[agent].name)
 
     def _moderator_announce(self, message: str, receiver: Optional[List[str]] = None) -> None:
         """
@@ -295,14 +650,16 @@ class Environment:
         Returns:
             None
         """
+        receiver_mask = None
         if receiver is None:
             receiver = self.agents
+            receiver_mask = self.alive_mask
         elif len(receiver) == 0:
             return
         else:
             pass
 
-        self.message_pool.add_message("Moderator", message, receiver)
+        self.message_pool.add_message("Moderator", message, receiver, receiver_mask)
 
     def _check_guessing(self, guessing: str) -> bool:
         """
@@ -335,4 +692,28 @@ class Environment:
         elif terminal_status[GameRole.MRWHITE]:
             self._moderator_announce("All civilians are eliminated. Mr. White wins!")
         else:
-            raise ValueError("Invalid terminal status.")
\ No newline at end of file
+            raise ValueError("Invalid terminal status.")
+
+        self._finish([role for role, win in terminal_status.items() if win])
+
+    def _finish(self, winners: List[GameRole]) -> None:
+        """
+        Records the winners of the game and writes the final summary record to the logger.
+
+        Args:
+            winners (List[GameRole]): The roles that win the game.
+
+        Returns:
+            None
+        """
+        self.winners = winners
+        if not self.logger:
+            return
+        self.logger.log(
+            "summary",
+            winners=[role.name for role in winners],
+            survivors=self.agents,
+            num_messages=self.message_pool.count_message(),
+            num_rounds=self.num_rounds,
+        )
+        self.logger.flush()
@@ -3,63 +3,63 @@ from datetime import datetime
 import time
 import outlines.models as models
 
+from agents.client_pool import ClientPool
 from agents.outlines_agent import OutlinesAgent
 from environment import Environment
+from game_log import GameLogger, render_file
+
+# One rate limited client shared by all agents, instead of a client per agent and fixed sleeps between steps
+llm = ClientPool(
+    models.text_completion.openai(
+        model_name="gpt-4",
+        max_tokens=50,
+        temperature=1),
+    requests_per_minute=200,
+    tokens_per_minute=40000,
+    max_output_tokens=50,
+)
 
 agents = [
-    OutlinesAgent(name="Alice", llm=models.text_completion.openai(
-            model_name="gpt-4",
-            max_tokens=50,
-            temperature=1)
-    ),
-    OutlinesAgent(name="Bob", llm=models.text_completion.openai(
-            model_name="gpt-4",
-            max_tokens=50,
-            temperature=1)
-    ),
-    OutlinesAgent(name="Charlie", llm=models.text_completion.openai(
-            model_name="gpt-4",
-            max_tokens=50,
-            temperature=1)
-    ),
-    OutlinesAgent(name="David", llm=models.text_completion.openai(
-            model_name="gpt-4",
-            max_tokens=50,
-            temperature=1)
-    ),
-    OutlinesAgent(name="Eve", llm=models.text_completion.openai(
-            model_name="gpt-4",
-            max_tokens=50,
-            temperature=1)
-    ),
+    OutlinesAgent(name="Alice", llm=llm, stop_at=["</message>"]),
+    OutlinesAgent(name="Bob", llm=llm, stop_at=["</message>"]),
+    OutlinesAgent(name="Charlie", llm=llm, stop_at=["</message>"]),
+    OutlinesAgent(name="David", llm=llm, stop_at=["</message>"]),
+    OutlinesAgent(name="Eve", llm=llm, stop_at=["</message>"]),
 ]
 name_to_agent = {agent.name: agent for agent in agents}
+# Observations are kept per agent and only extended with messages they have not seen yet
+name_to_observation = {agent.name: [] for agent in agents}
 
 
+now = datetime.now().strftime("%Y%m%d%H%M%S")
+os.makedirs("logs", exist_ok=True)
+logger = GameLogger(f"logs/{now}.jsonl")
+
 # Initialize environment
 env = Environment(
     agents=[agent.name for agent in agents],
     keyword_pair=["openai", "chatgpt"],
+    logger=logger,
 )
 
-now = datetime.now().strftime("%Y%m%d%H%M%S")
-os.makedirs("logs", exist_ok=True)
-
 start = time.time()
 # Start the game
 for _ in range(65):
     agent_name = env.get_current_agent()
     agent = name_to_agent[agent_name]
-    observation = [str(message) for message in env.message_pool.get_message(agent_name)]
+    observation = name_to_observation[agent_name]
+    observation.extend(
+        str(message) for message in env.message_pool.get_message(agent_name, offset=len(observation))
+    )
 
     action = agent.act(observation, env.phase.name)
     env.step(agent_name, action)
 
-    env.export(f"logs/{now}.txt")
     if env.terminal:
         break
-    time.sleep(3)
 
+logger.close()
+render_file(f"logs/{now}.jsonl", f"logs/{now}.txt")
 
 end = time.time()
 print(f"Time elapsed: {end - start}s")
\ No newline at end of file
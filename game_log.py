@@ -0,0 +1,150 @@
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from utils import GameRole, Message
+
+
+class GameLogger:
+    """
+    Append-only JSONL sink for game events.
+
+    Records are buffered in memory and appended to the file once the buffer is full,
+    so logging a game costs O(1) I/O per event instead of rewriting the whole log.
+
+    Attributes:
+        path (str): The path of the JSONL file.
+        buffer_size (int): The number of records buffered before they are written.
+        game_id (Optional[str]): Optional identifier added to every record, useful when several games share a file.
+    """
+    def __init__(self, path: str, buffer_size: int = 64, game_id: Optional[str] = None) -> None:
+        """
+        Initializes a GameLogger object.
+
+        Args:
+            path (str): The path of the JSONL file. Records are appended if the file already exists.
+            buffer_size (int): The number of records buffered before they are written. Defaults to 64.
+            game_id (Optional[str]): Optional identifier added to every record. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.game_id = game_id
+        self._buffer = []
+        self._file = None
+
+    def log(self, event: str, **fields: Any) -> None:
+        """
+        Records an event.
+
+        Args:
+            event (str): The type of the event, e.g. "message" or "phase".
+            **fields (Any): JSON serializable fields of the event.
+
+        Returns:
+            None
+        """
+        record = {"event": event}
+        if self.game_id is not None:
+            record["game"] = self.game_id
+        record.update(fields)
+        self._buffer.append(json.dumps(record, ensure_ascii=False))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def log_message(self, message: Message) -> None:
+        """
+        Records a message added to the message pool.
+
+        Args:
+            message (Message): The message.
+
+        Returns:
+            None
+        """
+        self.log("message", sender=message.sender, receiver=message.receiver, content=message.content)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered records to the file.
+
+        Returns:
+            None
+        """
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("\n".join(self._buffer) + "\n")
+        self._file.flush()
+        self._buffer = []
+
+    def close(self) -> None:
+        """
+        Flushes the remaining records and closes the file.
+
+        Returns:
+            None
+        """
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the records of a JSONL game log one by one.
+
+    Args:
+        path (str): The path of the JSONL file.
+
+    Returns:
+        Iterator[Dict[str, Any]]: The records in the order they were written.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def render_text(records: Iterable[Dict[str, Any]]) -> str:
+    """
+    Renders game records in the text format of Environment.export.
+
+    Args:
+        records (Iterable[Dict[str, Any]]): The records of a single game.
+
+    Returns:
+        str: The game setting and game conversation.
+    """
+    export_string = ""
+    for record in records:
+        if record["event"] == "setting":
+            roles = {GameRole[role]: agents for role, agents in record["roles"].items()}
+            export_string += "----------Game Setting----------\n"
+            export_string += f"Agents: {record['agents']}\n"
+            export_string += f"Roles: {roles}\n"
+            export_string += f"Civilian keyword: {record['keywords'][GameRole.CIVILIAN.name]}\n"
+            export_string += f"Undercover keyword: {record['keywords'][GameRole.UNDERCOVER.name]}\n"
+            export_string += "\n\n"
+            export_string += "----------Conversation----------\n"
+        elif record["event"] == "message":
+            export_string += f"{record['sender']} -> {record['receiver']}: {record['content']}\n"
+    return export_string
+
+
+def render_file(path: str, output_path: str) -> None:
+    """
+    Renders a JSONL game log to a text file in the format of Environment.export.
+
+    Args:
+        path (str): The path of the JSONL file.
+        output_path (str): The path of the text file.
+
+    Returns:
+        None
+    """
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(render_text(read_records(path)))
@@ -0,0 +1,298 @@
+import csv
+import json
+import queue
+import random
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+KeywordPair = Tuple[str, str]
+
+# Put in the prefetch queue once the stream is exhausted
+_END = object()
+
+
+class KeywordPairSource:
+    """
+    Lazy stream of (civilian keyword, undercover keyword) pairs, e.g. for tournament.iter_tournament.
+
+    Pairs are read one at a time, so memory stays flat however large the corpus is. The stream is split into
+    num_shards deterministic shards (pair i belongs to shard i % num_shards), so separate tournaments, e.g. on
+    different machines, can each take a disjoint part of the corpus. Every shard reads the whole stream to find
+    its pairs, so a corpus split in num_shards costs num_shards full reads, unless read_pairs only yields the
+    pairs of the shard (presharded=True), like from_files with at least as many files as shards. Within one
+    tournament the pairs are read by the main process, which sends the games to its workers. Pairs are drawn in
+    order, shuffled within a bounded buffer, or sampled with replacement from that buffer, and can be prefetched
+    by a background thread ahead of game creation.
+
+    Attributes:
+        read_pairs (Callable[[], Iterator[KeywordPair]]): Opens a new stream over the whole corpus, or over the shard
+            if presharded.
+        shard_id (int): The shard of this source.
+        num_shards (int): The number of shards.
+        presharded (bool): Whether read_pairs only yields the pairs of this shard.
+        shuffle_buffer_size (int): The size of the shuffle buffer, 0 to keep the corpus order.
+        replacement (bool): Whether pairs are sampled with replacement.
+        refill_rate (float): The probability that a slot of the buffer is refilled once sampled with replacement.
+        num_samples (Optional[int]): The number of pairs to draw, or None for a single pass without replacement.
+        seed (Optional[int]): Seed of the shuffling and sampling.
+        prefetch (int): The number of pairs read ahead by a background thread, 0 to read on demand.
+    """
+    def __init__(
+        self,
+        read_pairs: Callable[[], Iterator[KeywordPair]],
+        shard_id: int = 0,
+        num_shards: int = 1,
+        presharded: bool = False,
+        shuffle_buffer_size: int = 0,
+        replacement: bool = False,
+        refill_rate: float = 1.0,
+        num_samples: Optional[int] = None,
+        seed: Optional[int] = None,
+        prefetch: int = 0,
+    ) -> None:
+        """
+        Initializes a KeywordPairSource object.
+
+        Args:
+            read_pairs (Callable[[], Iterator[KeywordPair]]): Opens a new stream over the whole corpus.
+            shard_id (int): The shard of this source. Defaults to 0.
+            num_shards (int): The number of shards. Defaults to 1.
+            presharded (bool): Whether read_pairs only yields the pairs of this shard, which are then all kept.
+                Defaults to False, which keeps every num_shards-th pair of the stream.
+            shuffle_buffer_size (int): The size of the shuffle buffer. Defaults to 0, which keeps the corpus order.
+            replacement (bool): Whether pairs are sampled with replacement, uniformly from the shuffle buffer whose
+                slots are refilled from the stream. Defaults to False.
+            refill_rate (float): The probability that a slot is refilled from the stream once sampled with
+                replacement. Lower rates sample pairs again more often and read less of the stream, but with a small
+                buffer they favour the pairs at the start of the stream. Defaults to 1.0, which refills every
+                sampled slot.
+            num_samples (Optional[int]): The number of pairs to draw. Required with replacement. Defaults to None,
+                which draws every pair of the shard once.
+            seed (Optional[int]): Seed of the shuffling and sampling. Defaults to None.
+            prefetch (int): The number of pairs read ahead by a background thread. Defaults to 0.
+
+        Returns:
+            None
+        """
+        assert 0 <= shard_id < num_shards, "shard_id must be between 0 and num_shards - 1."
+        assert not replacement or num_samples is not None, "num_samples is required when sampling with replacement."
+        assert 0 <= refill_rate <= 1, "refill_rate must be between 0 and 1."
+        self.read_pairs = read_pairs
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        self.presharded = presharded
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.replacement = replacement
+        self.refill_rate = refill_rate
+        self.num_samples = num_samples
+        self.seed = seed
+        self.prefetch = prefetch
+
+    @classmethod
+    def from_files(cls, paths: List[str], **kwargs: Any) -> "KeywordPairSource":
+        """
+        Creates a source over keyword pair files.
+
+        Files ending in .jsonl hold one {"civilian": ..., "undercover": ...} object per line, other files
+        hold one "civilian,undercover" pair per line. With at least as many files as shards, the files are
+        sharded rather than the pairs (file j belongs to shard j % num_shards), so each shard only reads its own
+        files. The shards then have the sizes of their files.
+
+        Args:
+            paths (List[str]): The paths of the files, read in order.
+            **kwargs (Any): Keyword arguments of KeywordPairSource.
+
+        Returns:
+            KeywordPairSource: The source.
+        """
+        num_shards = kwargs.get("num_shards", 1)
+        if num_shards > 1 and len(paths) >= num_shards:
+            paths = paths[kwargs.get("shard_id", 0)::num_shards]
+            kwargs["presharded"] = True
+
+        def read_pairs() -> Iterator[KeywordPair]:
+            for path in paths:
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    if path.endswith(".jsonl"):
+                        for line in f:
+                            if line.strip():
+                                record = json.loads(line)
+                                yield record["civilian"], record["undercover"]
+                    else:
+                        for row in csv.reader(f):
+                            if len(row) >= 2:
+                                yield row[0].strip(), row[1].strip()
+
+        return cls(read_pairs, **kwargs)
+
+    @classmethod
+    def from_dataset(
+        cls,
+        path: str,
+        split: str = "train",
+        civilian_column: str = "civilian",
+        undercover_column: str = "undercover",
+        load_kwargs: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> "KeywordPairSource":
+        """
+        Creates a source over a Hugging Face dataset, loaded in streaming mode.
+
+        The rows are sharded one by one, so every shard streams the whole dataset.
+
+        Args:
+            path (str): The path or name of the dataset, as passed to datasets.load_dataset.
+            split (str): The split of the dataset. Defaults to "train".
+            civilian_column (str): The column of the civilian keywords. Defaults to "civilian".
+            undercover_column (str): The column of the undercover keywords. Defaults to "undercover".
+            load_kwargs (Optional[dict]): Extra keyword arguments of datasets.load_dataset. Defaults to None.
+            **kwargs (Any): Keyword arguments of KeywordPairSource.
+
+        Returns:
+            KeywordPairSource: The source.
+        """
+        def read_pairs() -> Iterator[KeywordPair]:
+            import datasets
+
+            dataset = datasets.load_dataset(path, split=split, streaming=True, **(load_kwargs or {}))
+            for row in dataset:
+                yield row[civilian_column], row[undercover_column]
+
+        return cls(read_pairs, **kwargs)
+
+    def __iter__(self) -> Iterator[KeywordPair]:
+        if self.prefetch <= 0:
+            return self._iter_pairs()
+        return _prefetch(self._iter_pairs(), self.prefetch)
+
+    def _iter_shard(self) -> Iterator[KeywordPair]:
+        """
+        Streams the pairs of this shard once.
+
+        Returns:
+            Iterator[KeywordPair]: The pairs.
+        """
+        if self.presharded or self.num_shards == 1:
+            yield from self.read_pairs()
+            return
+        for i, pair in enumerate(self.read_pairs()):
+            if i % self.num_shards == self.shard_id:
+                yield pair
+
+    def _iter_pairs(self) -> Iterator[KeywordPair]:
+        """
+        Draws pairs from the shard, in order, shuffled or with replacement.
+
+        Returns:
+            Iterator[KeywordPair]: The pairs.
+        """
+        rng = random.Random(self.seed)
+        if self.replacement:
+            yield from self._sample_with_replacement(rng)
+            return
+
+        pairs = self._iter_shard() if self.shuffle_buffer_size <= 0 else self._shuffle(self._iter_shard(), rng)
+        for i, pair in enumerate(pairs):
+            if self.num_samples is not None and i >= self.num_samples:
+                return
+            yield pair
+
+    def _shuffle(self, pairs: Iterable[KeywordPair], rng: random.Random) -> Iterator[KeywordPair]:
+        """
+        Shuffles a stream within a bounded buffer.
+
+        Args:
+            pairs (Iterable[KeywordPair]): The pairs.
+            rng (random.Random): The random number generator.
+
+        Returns:
+            Iterator[KeywordPair]: The shuffled pairs.
+        """
+        buffer = []
+        for pair in pairs:
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(pair)
+                continue
+            i = rng.randrange(len(buffer))
+            yield buffer[i]
+            buffer[i] = pair
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def _sample_with_replacement(self, rng: random.Random) -> Iterator[KeywordPair]:
+        """
+        Samples pairs with replacement from a buffer refilled from the stream, restarting it when exhausted.
+
+        Args:
+            rng (random.Random): The random number generator.
+
+        Returns:
+            Iterator[KeywordPair]: The pairs.
+        """
+        buffer_size = max(1, self.shuffle_buffer_size)
+        stream = self._iter_shard()
+        buffer = []
+        for pair in stream:
+            buffer.append(pair)
+            if len(buffer) == buffer_size:
+                break
+        if not buffer:
+            return
+
+        for _ in range(self.num_samples):
+            i = rng.randrange(len(buffer))
+            yield buffer[i]
+            # Slots are refilled from the stream so that the whole shard gets sampled over time
+            if self.refill_rate >= 1 or rng.random() < self.refill_rate:
+                pair = next(stream, None)
+                if pair is None:
+                    stream = self._iter_shard()
+                    pair = next(stream)
+                buffer[i] = pair
+
+
+def _prefetch(pairs: Iterator[KeywordPair], size: int) -> Iterator[KeywordPair]:
+    """
+    Reads pairs ahead in a background thread, which stops once the returned iterator is closed or discarded.
+
+    Args:
+        pairs (Iterator[KeywordPair]): The pairs.
+        size (int): The maximum number of pairs read ahead.
+
+    Returns:
+        Iterator[KeywordPair]: The same pairs.
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        # A full buffer is waited on in short steps, so the thread notices when nobody reads it anymore
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for pair in pairs:
+                if not put(pair):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(_END)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,243 @@
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "undercover_"
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values, in the style of Prometheus.
+
+    Attributes:
+        buckets (Tuple[float, ...]): The upper bounds of the buckets.
+        counts (List[int]): The number of observations in each bucket, plus one for values above the last bound.
+        sum (float): The sum of the observations.
+        count (int): The number of observations.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value.
+
+        Returns:
+            None
+        """
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms of a run, identified by name and labels.
+
+    Attributes:
+        counters (Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]): The counters.
+        histograms (Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram]): The histograms.
+    """
+    def __init__(self) -> None:
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (float): The increment. Defaults to 1.
+            **labels (str): The labels of the counter.
+
+        Returns:
+            None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Records an observation in a histogram.
+
+        Args:
+            name (str): The name of the histogram.
+            value (float): The observed value.
+            **labels (str): The labels of the histogram.
+
+        Returns:
+            None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def to_json(self) -> str:
+        """
+        Exports the metrics as JSON.
+
+        Returns:
+            str: The metrics.
+        """
+        with self._lock:
+            data = {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": list(histogram.buckets),
+                        "counts": histogram.counts,
+                        "sum": histogram.sum,
+                        "count": histogram.count,
+                    }
+                    for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])
+                ],
+            }
+        return json.dumps(data, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Exports the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} counter")
+                    typed.add(name)
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """
+    Formats labels as a Prometheus label set, e.g. {phase="VOTING"}.
+
+    Args:
+        labels (Tuple[Tuple[str, str], ...]): The label names and values.
+
+    Returns:
+        str: The label set, or an empty string without labels.
+    """
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+# The active registry, None while metrics are disabled. Instrumented code checks it before measuring anything,
+# so disabled metrics cost a single attribute lookup.
+registry: Optional[MetricsRegistry] = None
+
+_encoding = None
+
+
+def enable() -> MetricsRegistry:
+    """
+    Enables metrics collection with a new registry.
+
+    Returns:
+        MetricsRegistry: The registry receiving the metrics.
+    """
+    global registry
+    registry = MetricsRegistry()
+    return registry
+
+
+def disable() -> None:
+    """
+    Disables metrics collection.
+
+    Returns:
+        None
+    """
+    global registry
+    registry = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with tiktoken, for the prompt and completion token metrics.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The number of tokens.
+    """
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text))
+
+
+def timed(name: str, labels: Optional[Callable[..., Dict[str, str]]] = None) -> Callable:
+    """
+    Decorator recording the latency of each call of a function in a histogram while metrics are enabled.
+
+    Args:
+        name (str): The name of the histogram.
+        labels (Optional[Callable[..., Dict[str, str]]]): Computes the labels from the arguments of the call,
+            before the call is made. Defaults to None.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if registry is None:
+                return function(*args, **kwargs)
+            call_labels = labels(*args, **kwargs) if labels else {}
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if registry is not None:
+                    registry.observe(name, time.perf_counter() - start, **call_labels)
+        return wrapper
+    return decorator
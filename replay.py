@@ -0,0 +1,364 @@
+import json
+import mmap
+import os
+import pickle
+import sqlite3
+import zlib
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from environment import Environment
+from utils import GameRole, MessagePool
+
+
+class ReplayLog:
+    """
+    Random access over a JSONL game log written by GameLogger, possibly holding many games.
+
+    An SQLite index records, for each game, where its setting record and each of its actions start in the file,
+    and snapshots of the game every snapshot_interval steps (see Environment.snapshot). The index is built with one
+    pass over the file and one replay of every game, and persisted next to it. Later runs only read the rows and
+    records of the games they access, through a memory map, and replay a game from the snapshot nearest to the
+    requested step. The index is rebuilt when the size or the modification time of the log changes. Games are
+    identified by the game id of their records, or by their position in the file for records without a game id.
+
+    Every message that is not sent by the moderator is one Environment.step, so a game is replayed by feeding
+    its recorded messages back to an Environment with the recorded roles, without any LLM call. Snapshots follow
+    the game rules at the time the index was built, so after a rules change replay with use_snapshots=False, as
+    rescore does, or delete the index.
+
+    Attributes:
+        path (str): The path of the JSONL game log.
+        index_path (str): The path of the persisted index.
+        snapshot_interval (int): The number of steps between two snapshots of a game, 0 for no snapshots.
+    """
+    def __init__(self, path: str, index_path: Optional[str] = None, snapshot_interval: int = 64) -> None:
+        """
+        Initializes a ReplayLog object, loading the persisted index or building it if it is missing or stale.
+
+        Args:
+            path (str): The path of the JSONL game log.
+            index_path (Optional[str]): The path of the persisted index. Defaults to None, which uses path + ".idx".
+            snapshot_interval (int): The number of steps between two snapshots of a game. Defaults to 64.
+
+        Returns:
+            None
+        """
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.snapshot_interval = snapshot_interval
+        self._file = open(path, "rb")
+        stat = os.fstat(self._file.fileno())
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        version = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "snapshot_interval": snapshot_interval}
+        self._index = self._open_index()
+        if self._read_version() != version:
+            self._build_index(version)
+
+    @property
+    def games(self) -> List[str]:
+        """
+        The ids of the games in the log, in order of appearance.
+        """
+        return [row[0] for row in self._index.execute("SELECT game FROM games ORDER BY position")]
+
+    def num_steps(self, game: str) -> int:
+        """
+        Returns the number of recorded steps of a game.
+
+        Args:
+            game (str): The id of the game.
+
+        Returns:
+            int: The number of steps.
+        """
+        return len(self._action_offsets(game))
+
+    def setting(self, game: str) -> Dict[str, Any]:
+        """
+        Returns the setting record of a game.
+
+        Args:
+            game (str): The id of the game.
+
+        Returns:
+            Dict[str, Any]: The setting record, with the agents, roles and keywords.
+        """
+        return self._read(self._game_row(game)[0])
+
+    def actions(self, game: str, num_steps: Optional[int] = None, start: int = 0) -> List[Tuple[str, str]]:
+        """
+        Returns the recorded actions of a game.
+
+        Args:
+            game (str): The id of the game.
+            num_steps (Optional[int]): The number of actions from the start of the game. Defaults to None, which returns all.
+            start (int): The index of the first action returned. Defaults to 0.
+
+        Returns:
+            List[Tuple[str, str]]: The (agent, action) pairs in order.
+        """
+        offsets = self._action_offsets(game)[start:num_steps]
+        actions = []
+        for offset in offsets:
+            record = self._read(offset)
+            actions.append((record["sender"], record["content"]))
+        return actions
+
+    def replay(
+        self, game: str, num_steps: Optional[int] = None, use_snapshots: bool = True
+    ) -> Tuple[Environment, Optional[int]]:
+        """
+        Replays a game up to the given step with the current game rules.
+
+        The replay starts from the last snapshot of the index before the step, and stops early if the game ends,
+        or if the recorded agent is not the one whose turn it is (e.g. after a rules change), in which case the
+        step is reported as diverged.
+
+        Args:
+            game (str): The id of the game.
+            num_steps (Optional[int]): The number of steps to replay. Defaults to None, which replays the whole game.
+            use_snapshots (bool): Whether to start from a snapshot rather than from the first step. Defaults to True.
+
+        Returns:
+            Tuple[Environment, Optional[int]]: The environment after the replayed steps, and the index of the first
+                step that could not be replayed, or None if all steps were replayed.
+        """
+        env = self._new_environment(game)
+        start = 0
+        if use_snapshots:
+            last_step = self.num_steps(game) if num_steps is None else num_steps
+            rows = self._index.execute(
+                "SELECT step, state FROM snapshots WHERE game = ? AND step <= ? ORDER BY step", (game, last_step)
+            ).fetchall()
+            if rows:
+                # Snapshots only hold the messages added since the previous one, the pool is rebuilt from all of them
+                message_pool = MessagePool(agent_names=env.initial_agents)
+                for start, state in rows:
+                    snapshot = pickle.loads(zlib.decompress(state))
+                    for sender, content, receiver_mask in snapshot.pop("messages"):
+                        message_pool.add_message(sender, content, [], receiver_mask)
+                snapshot["message_pool"] = message_pool
+                env.restore(snapshot)
+        return env, self._step(env, self.actions(game, num_steps, start), start)
+
+    def rescore(self, games: Optional[List[str]] = None) -> Iterator[Tuple[str, List[GameRole], Optional[int]]]:
+        """
+        Replays whole games from their first step with the current game rules and reports their winners.
+
+        Args:
+            games (Optional[List[str]]): The ids of the games. Defaults to None, which rescores every game.
+
+        Returns:
+            Iterator[Tuple[str, List[GameRole], Optional[int]]]: The game id, the winners and the diverged step of each game.
+        """
+        for game in games if games is not None else self.games:
+            env, diverged_step = self.replay(game, use_snapshots=False)
+            yield game, env.winners, diverged_step
+
+    def close(self) -> None:
+        """
+        Closes the log file and the index.
+
+        Returns:
+            None
+        """
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+        self._index.close()
+
+    def _new_environment(self, game: str) -> Environment:
+        """
+        Creates the environment of a game at its first step, with the recorded agents, roles and keywords.
+
+        Args:
+            game (str): The id of the game.
+
+        Returns:
+            Environment: The environment.
+        """
+        setting = self.setting(game)
+        return Environment(
+            agents=setting["agents"],
+            keyword_pair=(setting["keywords"][GameRole.CIVILIAN.name], setting["keywords"][GameRole.UNDERCOVER.name]),
+            roles={GameRole[role]: agents for role, agents in setting["roles"].items()},
+        )
+
+    def _step(
+        self, env: Environment, actions: List[Tuple[str, str]], start: int, on_step: Optional[Callable[[int], None]] = None
+    ) -> Optional[int]:
+        """
+        Feeds recorded actions to an environment.
+
+        Args:
+            env (Environment): The environment, at step start.
+            actions (List[Tuple[str, str]]): The (agent, action) pairs from step start.
+            start (int): The index of the first step.
+            on_step (Optional[Callable[[int], None]]): Called with the number of steps taken after every step.
+                Defaults to None.
+
+        Returns:
+            Optional[int]: The index of the first step that could not be replayed, or None if all steps were replayed.
+        """
+        for step, (agent, action) in enumerate(actions, start):
+            if env.terminal or env.get_current_agent() != agent:
+                return step
+            env.step(agent, action)
+            if on_step is not None:
+                on_step(step + 1)
+        return None
+
+    def _read(self, offset: int) -> Dict[str, Any]:
+        """
+        Reads the record starting at an offset.
+
+        Args:
+            offset (int): The offset of the record.
+
+        Returns:
+            Dict[str, Any]: The record.
+        """
+        end = self._mmap.find(b"\n", offset)
+        return json.loads(self._mmap[offset:end if end != -1 else len(self._mmap)])
+
+    def _game_row(self, game: str) -> Tuple[int, bytes]:
+        """
+        Reads the offsets of a game from the index.
+
+        Args:
+            game (str): The id of the game.
+
+        Returns:
+            Tuple[int, bytes]: The offset of the setting record and the packed offsets of the actions.
+        """
+        row = self._index.execute("SELECT setting, actions FROM games WHERE game = ?", (game,)).fetchone()
+        if row is None:
+            raise KeyError(game)
+        return row
+
+    def _action_offsets(self, game: str) -> array:
+        """
+        Returns the offsets of the actions of a game.
+
+        Args:
+            game (str): The id of the game.
+
+        Returns:
+            array: The offsets.
+        """
+        offsets = array("q")
+        offsets.frombytes(self._game_row(game)[1])
+        return offsets
+
+    def _open_index(self) -> sqlite3.Connection:
+        """
+        Opens the persisted index, replacing a file that is not an index, e.g. from an older version.
+
+        Returns:
+            sqlite3.Connection: The connection to the index.
+        """
+        index = sqlite3.connect(self.index_path)
+        try:
+            index.execute("SELECT name FROM sqlite_master").fetchall()
+        except sqlite3.DatabaseError:
+            index.close()
+            os.remove(self.index_path)
+            index = sqlite3.connect(self.index_path)
+        return index
+
+    def _read_version(self) -> Optional[Dict[str, int]]:
+        """
+        Reads the size and modification time of the log, and the snapshot interval, that the index was built for.
+
+        Returns:
+            Optional[Dict[str, int]]: The version of the index, or None if there is no index.
+        """
+        try:
+            return dict(self._index.execute("SELECT key, value FROM version").fetchall())
+        except sqlite3.OperationalError:
+            return None
+
+    def _build_index(self, version: Dict[str, int]) -> None:
+        """
+        Scans the log for the offsets of the setting and actions of every game, replays every game to snapshot it,
+        and writes the index.
+
+        Args:
+            version (Dict[str, int]): The size and modification time of the log, and the snapshot interval.
+
+        Returns:
+            None
+        """
+        index = {}
+        num_unnamed_games = 0
+        unnamed_game = None
+        offset = 0
+        while offset < len(self._mmap):
+            end = self._mmap.find(b"\n", offset)
+            end = end if end != -1 else len(self._mmap)
+            line = self._mmap[offset:end]
+            if line.strip():
+                record = json.loads(line)
+                if "game" in record:
+                    game = str(record["game"])
+                else:
+                    if record["event"] == "setting":
+                        unnamed_game = str(num_unnamed_games)
+                        num_unnamed_games += 1
+                    game = unnamed_game
+
+                if record["event"] == "setting":
+                    index[game] = (offset, array("q"))
+                elif game in index and record["event"] == "message" and record["sender"] != "Moderator":
+                    index[game][1].append(offset)
+            offset = end + 1
+
+        with self._index:
+            self._index.execute("DROP TABLE IF EXISTS version")
+            self._index.execute("DROP TABLE IF EXISTS games")
+            self._index.execute("DROP TABLE IF EXISTS snapshots")
+            self._index.execute("CREATE TABLE version (key TEXT PRIMARY KEY, value INTEGER)")
+            self._index.execute(
+                "CREATE TABLE games (position INTEGER PRIMARY KEY, game TEXT UNIQUE, setting INTEGER, actions BLOB)"
+            )
+            self._index.execute("CREATE TABLE snapshots (game TEXT, step INTEGER, state BLOB, PRIMARY KEY (game, step))")
+            self._index.executemany(
+                "INSERT INTO games VALUES (?, ?, ?, ?)",
+                [(position, game, setting, actions.tobytes()) for position, (game, (setting, actions)) in enumerate(index.items())],
+            )
+            if self.snapshot_interval > 0:
+                for game, (_, actions) in index.items():
+                    if len(actions) >= self.snapshot_interval:
+                        self._snapshot_game(game)
+            # Written last, so that an index cut short is rebuilt
+            self._index.executemany("INSERT INTO version VALUES (?, ?)", list(version.items()))
+
+    def _snapshot_game(self, game: str) -> None:
+        """
+        Replays a game and writes a snapshot to the index every snapshot_interval steps.
+
+        A snapshot holds the messages added since the previous snapshot in place of the message pool, so that the
+        index grows with the number of messages rather than with the number of snapshots times the length of the game.
+
+        Args:
+            game (str): The id of the game.
+
+        Returns:
+            None
+        """
+        env = self._new_environment(game)
+        num_saved_messages = 0
+
+        def on_step(num_steps: int) -> None:
+            nonlocal num_saved_messages
+            if num_steps % self.snapshot_interval == 0:
+                snapshot = env.snapshot()
+                messages = snapshot.pop("message_pool").get_message(offset=num_saved_messages)
+                snapshot["messages"] = [(message.sender, message.content, message.receiver_mask) for message in messages]
+                num_saved_messages += len(messages)
+                self._index.execute(
+                    "INSERT INTO snapshots VALUES (?, ?, ?)", (game, num_steps, zlib.compress(pickle.dumps(snapshot)))
+                )
+
+        self._step(env, self.actions(game), 0, on_step)
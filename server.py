@@ -0,0 +1,707 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+from agents.agent import Agent
+from environment import Environment
+from tournament import record_outcomes
+
+# Sentinel closing a subscription
+_CLOSED = None
+
+
+class HumanSeat(Agent):
+    """
+    Seat of a player whose actions are submitted to the server, e.g. a human connected with a client.
+
+    Attributes:
+        name (str): The name of the agent.
+        timeout (Optional[float]): The time the player has to act, in seconds, or None to wait for ever.
+        default_action (str): The action played when the player does not act in time or has left.
+        connected (bool): False once the player has left, e.g. because their client disconnected.
+        on_turn (Optional[Callable[[str], Awaitable[None]]]): Coroutine function awaited with the phase when the
+            player is expected to act.
+    """
+    def __init__(self, name: str, timeout: Optional[float] = 120.0, default_action: str = "I have nothing to say.") -> None:
+        """
+        Initializes a new HumanSeat instance.
+
+        Args:
+            name (str): The name of the agent.
+            timeout (Optional[float]): The time the player has to act, in seconds. Defaults to 120.0.
+            default_action (str): The action played when the player does not act in time or has left.
+                Defaults to "I have nothing to say.", which counts as an invalid vote.
+
+        Returns:
+            None
+        """
+        super().__init__(name)
+        self.timeout = timeout
+        self.default_action = default_action
+        self.connected = True
+        self.on_turn = None
+        self._pending = None
+
+    def act(self, message_history: List[str], phase: str) -> str:
+        raise RuntimeError(f"{self.name} is played through GameServer.submit_action and cannot act synchronously.")
+
+    async def aact(self, message_history: List[str], phase: str) -> str:
+        """
+        Waits for the action of the player, up to the timeout of the seat.
+
+        Args:
+            message_history (List[str]): A list of previous messages.
+            phase (str): The current phase of the agent.
+
+        Returns:
+            str: The action submitted by the player, or the default action if they did not act in time or have left.
+        """
+        if not self.connected:
+            return self.default_action
+        self._pending = asyncio.get_running_loop().create_future()
+        try:
+            if self.on_turn is not None:
+                await self.on_turn(phase)
+            return await asyncio.wait_for(self._pending, self.timeout)
+        except asyncio.TimeoutError:
+            if metrics.registry is not None:
+                metrics.registry.inc("human_timeouts_total", phase=phase)
+            return self.default_action
+        finally:
+            self._pending = None
+
+    def submit(self, action: str) -> None:
+        """
+        Submits the action of the player.
+
+        Args:
+            action (str): The action.
+
+        Returns:
+            None
+        """
+        if self._pending is None or self._pending.done():
+            raise ValueError(f"It is not the turn of {self.name}.")
+        self._pending.set_result(action)
+
+    def leave(self) -> None:
+        """
+        Plays the default action for the player from now on, including the turn they are expected to play.
+
+        Returns:
+            None
+        """
+        self.connected = False
+        if self._pending is not None and not self._pending.done():
+            self._pending.set_result(self.default_action)
+
+
+class Subscription:
+    """
+    Bounded stream of the events of a session visible to an agent, or to a spectator.
+
+    Iterate over it with `async for` until the game ends or the subscription is closed.
+
+    Attributes:
+        agent_name (Optional[str]): The agent whose visible messages are streamed, or None for every message.
+        closed (bool): True once the subscription is closed, e.g. because the client was too slow.
+    """
+    def __init__(self, agent_name: Optional[str], max_queue_size: int) -> None:
+        """
+        Initializes a Subscription object.
+
+        Args:
+            agent_name (Optional[str]): The agent whose visible messages are streamed, or None for every message.
+            max_queue_size (int): The number of events buffered for the client.
+
+        Returns:
+            None
+        """
+        self.agent_name = agent_name
+        self.closed = False
+        self._queue = asyncio.Queue(max_queue_size)
+        self._num_seen = 0
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        event = await self._queue.get()
+        if event is _CLOSED:
+            raise StopAsyncIteration
+        return event
+
+    def _put_nowait(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Buffers the events that fit in the buffer without waiting.
+
+        Args:
+            events (List[Dict[str, Any]]): The events.
+
+        Returns:
+            List[Dict[str, Any]]: The events that did not fit, to be put with _put_all.
+        """
+        if self.closed:
+            return []
+        for i, event in enumerate(events):
+            try:
+                self._queue.put_nowait(event)
+            except asyncio.QueueFull:
+                return events[i:]
+        return []
+
+    async def _put_all(self, events: List[Dict[str, Any]], timeout: float) -> None:
+        """
+        Buffers events in order, closing the subscription if the client does not keep up.
+
+        Args:
+            events (List[Dict[str, Any]]): The events.
+            timeout (float): The time to wait for room in a full buffer, in seconds, per event.
+
+        Returns:
+            None
+        """
+        for event in events:
+            await self._put(event, timeout)
+
+    async def _put(self, event: Optional[Dict[str, Any]], timeout: float) -> None:
+        """
+        Buffers an event for the client, closing the subscription if the client does not keep up.
+
+        Args:
+            event (Optional[Dict[str, Any]]): The event, or _CLOSED to end the stream.
+            timeout (float): The time to wait for room in a full buffer, in seconds.
+
+        Returns:
+            None
+        """
+        if self.closed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(event), timeout)
+            except asyncio.TimeoutError:
+                # Drop the slow client rather than stalling the game
+                self._close()
+                return
+        if event is _CLOSED:
+            self.closed = True
+
+    def _close(self) -> None:
+        """
+        Ends the stream at once, discarding the buffered events to make room for the closing sentinel.
+
+        Returns:
+            None
+        """
+        if self.closed:
+            return
+        self.closed = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_CLOSED)
+
+
+class GameSession:
+    """
+    A live game hosted by a GameServer.
+
+    Attributes:
+        session_id (str): The identifier of the session.
+        env (Environment): The environment of the game.
+        name_to_agent (Dict[str, Agent]): A dictionary mapping agent names to agents, including human seats.
+        max_steps (int): The maximum number of steps.
+        num_steps (int): The number of steps played.
+        step_seconds (List[float]): The latency of every step, from the request of the action to its publication.
+        finished (asyncio.Event): Set once the game is over.
+    """
+    def __init__(
+        self,
+        session_id: str,
+        env: Environment,
+        name_to_agent: Dict[str, Agent],
+        max_steps: int,
+        max_concurrent_actions: int,
+        client_timeout: float,
+    ) -> None:
+        """
+        Initializes a GameSession object.
+
+        Args:
+            session_id (str): The identifier of the session.
+            env (Environment): The environment of the game.
+            name_to_agent (Dict[str, Agent]): A dictionary mapping agent names to agents.
+            max_steps (int): The maximum number of steps.
+            max_concurrent_actions (int): The number of agents of the session acting at the same time.
+            client_timeout (float): The time a client may keep its buffer full, in seconds.
+
+        Returns:
+            None
+        """
+        self.session_id = session_id
+        self.env = env
+        self.name_to_agent = name_to_agent
+        self.max_steps = max_steps
+        self.num_steps = 0
+        self.step_seconds = []
+        self.finished = asyncio.Event()
+        self.client_timeout = client_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent_actions)
+        self._subscriptions = []
+        self._seat_subscriptions = {}
+        self._turn_tasks = set()
+        self._observations = {name: [] for name in name_to_agent}
+
+    def subscribe(self, agent_name: Optional[str] = None, max_queue_size: int = 256) -> Subscription:
+        """
+        Subscribes to the events of the session, starting with the messages already sent.
+
+        Subscribing to a human seat makes its player connected again, and tells them at once if their turn
+        has already begun.
+
+        Args:
+            agent_name (Optional[str]): The agent whose visible messages are streamed. Defaults to None, which
+                streams every message, e.g. for a spectator or a moderator view.
+            max_queue_size (int): The number of events buffered for the client. Defaults to 256.
+
+        Returns:
+            Subscription: The subscription.
+        """
+        subscription = Subscription(agent_name, max_queue_size)
+        self._subscriptions.append(subscription)
+        agent = self.name_to_agent.get(agent_name)
+        if isinstance(agent, HumanSeat):
+            self._seat_subscriptions[agent_name] = subscription
+            agent.connected = True
+            agent.on_turn = lambda phase: self._notify_turn(subscription, phase)
+            if agent._pending is not None and not agent._pending.done():
+                task = asyncio.get_running_loop().create_task(self._notify_turn(subscription, self.env.phase.name))
+                self._turn_tasks.add(task)
+                task.add_done_callback(self._turn_tasks.discard)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Ends a subscription, e.g. when its client disconnects. The player of a human seat leaves with it.
+
+        Args:
+            subscription (Subscription): The subscription.
+
+        Returns:
+            None
+        """
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+        subscription._close()
+        agent_name = subscription.agent_name
+        if self._seat_subscriptions.get(agent_name) is subscription:
+            del self._seat_subscriptions[agent_name]
+            agent = self.name_to_agent[agent_name]
+            agent.on_turn = None
+            agent.leave()
+
+    def submit_action(self, agent_name: str, action: str) -> None:
+        """
+        Submits the action of a human player.
+
+        Args:
+            agent_name (str): The name of the agent.
+            action (str): The action.
+
+        Returns:
+            None
+        """
+        agent = self.name_to_agent.get(agent_name)
+        if not isinstance(agent, HumanSeat):
+            raise ValueError(f"{agent_name} is not a human seat of session {self.session_id}.")
+        agent.submit(action)
+
+    def _observe(self, agent_name: str) -> List[str]:
+        """
+        Returns the message history of an agent, fetching only the messages added since its last turn.
+
+        Args:
+            agent_name (str): The name of the agent.
+
+        Returns:
+            List[str]: A copy of the message history, safe to hand to an agent running in another thread.
+        """
+        observation = self._observations[agent_name]
+        observation.extend(
+            str(message) for message in self.env.message_pool.get_message(agent_name, offset=len(observation))
+        )
+        return list(observation)
+
+    async def _publish(self, timeout: float) -> None:
+        """
+        Streams the messages added since the last publication to the subscriptions that can see them.
+
+        Events are buffered at once where there is room, and the clients with a full buffer are waited on
+        concurrently, so slow clients stall the step for about one timeout however many they are.
+
+        Args:
+            timeout (float): The time to wait for a full client buffer, in seconds.
+
+        Returns:
+            None
+        """
+        stalled = []
+        for subscription in list(self._subscriptions):
+            events = subscription._put_nowait(self._new_events(subscription))
+            if events:
+                stalled.append(subscription._put_all(events, timeout))
+        if stalled:
+            await asyncio.gather(*stalled)
+
+    async def _publish_to(self, subscription: Subscription, timeout: float) -> None:
+        """
+        Streams the messages added since the last publication to a subscription.
+
+        Args:
+            subscription (Subscription): The subscription.
+            timeout (float): The time to wait for a full client buffer, in seconds.
+
+        Returns:
+            None
+        """
+        await subscription._put_all(self._new_events(subscription), timeout)
+
+    def _new_events(self, subscription: Subscription) -> List[Dict[str, Any]]:
+        """
+        Returns the message events added since the last publication to a subscription, and marks them as published.
+
+        Args:
+            subscription (Subscription): The subscription.
+
+        Returns:
+            List[Dict[str, Any]]: The events, empty for a closed subscription.
+        """
+        if subscription.closed:
+            return []
+        messages = self.env.message_pool.get_message(subscription.agent_name, offset=subscription._num_seen)
+        subscription._num_seen += len(messages)
+        return [{"event": "message", "sender": message.sender, "content": message.content} for message in messages]
+
+    async def _notify_turn(self, subscription: Subscription, phase: str) -> None:
+        """
+        Tells a human player that it is their turn, after the messages they have not received yet.
+
+        Like every event, the turn waits for room in a full buffer and closes the subscription of a client
+        that does not make any. A player who cannot be told leaves their seat.
+
+        Args:
+            subscription (Subscription): The subscription of the player.
+            phase (str): The current phase.
+
+        Returns:
+            None
+        """
+        await self._publish_to(subscription, self.client_timeout)
+        await subscription._put({"event": "turn", "phase": phase}, self.client_timeout)
+        if subscription.closed:
+            self.unsubscribe(subscription)
+
+
+class GameServer:
+    """
+    Hosts many live game sessions in one event loop, with global and per-session limits on concurrent actions.
+
+    LLM agents and human players can be mixed in a session: human players take a HumanSeat and act through
+    submit_action, e.g. from a client connected with the JSON lines protocol of serve. A human player who does
+    not act within action_timeout, or whose client disconnects, plays the default action of their seat.
+
+    Backpressure applies at three levels: sessions beyond max_sessions wait for a running session to end
+    before starting, agent actions beyond max_concurrent_actions wait for a slot (human players waiting for
+    input do not hold one, and play a default action when they run out of time), and clients are given a
+    bounded buffer of events and are disconnected when they fall behind for longer than client_timeout, so
+    that a slow client cannot stall its game.
+
+    Synchronous agents run in the server's thread pool, agents overriding Agent.aact run in the event loop.
+
+    Attributes:
+        sessions (Dict[str, GameSession]): The sessions created and not yet finished, by identifier.
+        max_sessions (int): The number of sessions played at the same time.
+        max_concurrent_actions (int): The number of agent actions in flight at the same time, over all sessions.
+        max_session_actions (int): The number of agent actions in flight at the same time in one session.
+        client_timeout (float): The time a client may keep its buffer full, in seconds.
+        action_timeout (Optional[float]): The time human players have to act, in seconds.
+    """
+    def __init__(
+        self,
+        max_sessions: int = 100,
+        max_concurrent_actions: int = 64,
+        max_session_actions: int = 8,
+        client_timeout: float = 5.0,
+        action_timeout: Optional[float] = 120.0,
+    ) -> None:
+        """
+        Initializes a GameServer object.
+
+        Args:
+            max_sessions (int): The number of sessions played at the same time. Defaults to 100.
+            max_concurrent_actions (int): The number of agent actions in flight at the same time, over all
+                sessions. Also the number of threads running synchronous agents. Defaults to 64.
+            max_session_actions (int): The number of agent actions in flight at the same time in one session,
+                e.g. votes. Defaults to 8.
+            client_timeout (float): The time a client may keep its buffer full before it is disconnected, in
+                seconds. Defaults to 5.0.
+            action_timeout (Optional[float]): The time human players have to act, in seconds, or None to wait for
+                ever. Defaults to 120.0.
+
+        Returns:
+            None
+        """
+        self.sessions = {}
+        self.max_sessions = max_sessions
+        self.max_concurrent_actions = max_concurrent_actions
+        self.max_session_actions = max_session_actions
+        self.client_timeout = client_timeout
+        self.action_timeout = action_timeout
+        self._session_slots = None
+        self._action_slots = None
+        self._executor = ThreadPoolExecutor(max_concurrent_actions, thread_name_prefix="agent")
+
+    def create_session(
+        self,
+        session_id: str,
+        name_to_agent: Dict[str, Optional[Agent]],
+        keyword_pair: tuple,
+        max_steps: int = 200,
+        **env_kwargs: Any,
+    ) -> GameSession:
+        """
+        Creates a session, to be played with run_session.
+
+        Args:
+            session_id (str): The identifier of the session.
+            name_to_agent (Dict[str, Optional[Agent]]): A dictionary mapping agent names to agents, in turn order.
+                Agents set to None are played by humans through submit_action, within the action timeout.
+            keyword_pair (tuple): The keyword pair of the game.
+            max_steps (int): The maximum number of steps. Defaults to 200.
+            **env_kwargs (Any): Keyword arguments of the Environment, e.g. seed or logger.
+
+        Returns:
+            GameSession: The session.
+        """
+        if session_id in self.sessions:
+            raise ValueError(f"Session {session_id} already exists.")
+        name_to_agent = {
+            name: agent if agent is not None else HumanSeat(name, self.action_timeout)
+            for name, agent in name_to_agent.items()
+        }
+        env = Environment(agents=list(name_to_agent), keyword_pair=keyword_pair, **env_kwargs)
+        session = GameSession(
+            session_id, env, name_to_agent, max_steps, self.max_session_actions, self.client_timeout
+        )
+        self.sessions[session_id] = session
+        return session
+
+    def submit_action(self, session_id: str, agent_name: str, action: str) -> None:
+        """
+        Submits the action of a human player.
+
+        Args:
+            session_id (str): The identifier of the session.
+            agent_name (str): The name of the agent.
+            action (str): The action.
+
+        Returns:
+            None
+        """
+        self._get_session(session_id).submit_action(agent_name, action)
+
+    async def run_session(self, session_id: str) -> GameSession:
+        """
+        Plays a session until it ends, waiting for a free slot if max_sessions sessions are already running.
+
+        Args:
+            session_id (str): The identifier of the session.
+
+        Returns:
+            GameSession: The finished session.
+        """
+        session = self._get_session(session_id)
+        if self._session_slots is None:
+            self._session_slots = asyncio.Semaphore(self.max_sessions)
+            self._action_slots = asyncio.Semaphore(self.max_concurrent_actions)
+
+        async with self._session_slots:
+            try:
+                await self._play(session)
+            finally:
+                for subscription in list(session._subscriptions):
+                    await subscription._put(
+                        {"event": "end", "winners": [role.name for role in session.env.winners]}, self.client_timeout
+                    )
+                    await subscription._put(_CLOSED, self.client_timeout)
+                session.finished.set()
+                del self.sessions[session_id]
+        return session
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        """
+        Starts accepting clients speaking a JSON lines protocol.
+
+        A client joins a session as an agent, or with a null agent to spectate, then receives the events of
+        the game and sends the actions of its agent:
+
+            client -> {"op": "join", "session": "<session id>", "agent": "<agent name, or null to spectate>"}
+            server -> {"event": "message", "sender": "...", "content": "..."}   for every message visible to the agent
+            server -> {"event": "turn", "phase": "VOTING"}                      when a human player is expected to act
+            client -> {"op": "act", "action": "..."}
+            server -> {"event": "end", "winners": ["CIVILIAN"]}                 when the game is over
+            server -> {"event": "error", "error": "..."}                       for a malformed or rejected request
+
+        Args:
+            host (str): The host to listen on. Defaults to "127.0.0.1".
+            port (int): The port to listen on. Defaults to 8765.
+
+        Returns:
+            asyncio.AbstractServer: The listening server.
+        """
+        return await asyncio.start_server(self._handle_client, host, port)
+
+    def close(self) -> None:
+        """
+        Stops the thread pool of the synchronous agents.
+
+        Returns:
+            None
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _play(self, session: GameSession) -> None:
+        """
+        Plays a session like tournament.aplay_game, publishing new messages after every step.
+
+        Args:
+            session (GameSession): The session.
+
+        Returns:
+            None
+        """
+        env = session.env
+        await session._publish(self.client_timeout)
+        while session.num_steps < session.max_steps and not env.terminal:
+            start = time.perf_counter()
+            simultaneous_agents = env.get_simultaneous_agents()
+            if simultaneous_agents and session.num_steps + len(simultaneous_agents) <= session.max_steps:
+                await env.astep_batch({name: self._act(session, name) for name in simultaneous_agents})
+                num_steps = len(simultaneous_agents)
+            else:
+                agent_name = env.get_current_agent()
+                env.step(agent_name, await self._act(session, agent_name))
+                num_steps = 1
+            session.num_steps += num_steps
+            await session._publish(self.client_timeout)
+
+            elapsed = (time.perf_counter() - start) / num_steps
+            session.step_seconds.extend([elapsed] * num_steps)
+            if metrics.registry is not None:
+                metrics.registry.observe("server_step_seconds", elapsed)
+        if env.terminal:
+            record_outcomes(env, session.name_to_agent)
+
+    async def _act(self, session: GameSession, agent_name: str) -> str:
+        """
+        Requests the action of an agent within the concurrency limits.
+
+        Args:
+            session (GameSession): The session.
+            agent_name (str): The name of the agent.
+
+        Returns:
+            str: The action.
+        """
+        agent = session.name_to_agent[agent_name]
+        phase = session.env.phase.name
+        message_history = session._observe(agent_name)
+        if isinstance(agent, HumanSeat):
+            # Waiting for a human does not use the agents' resources
+            return await agent.aact(message_history, phase)
+
+        async with session._semaphore, self._action_slots:
+            if type(agent).aact is Agent.aact:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor, agent.act, message_history, phase
+                )
+            return await agent.aact(message_history, phase)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves a client: streams the events of the session it joins and forwards its actions.
+
+        Args:
+            reader (asyncio.StreamReader): The stream of the client requests.
+            writer (asyncio.StreamWriter): The stream of the server events.
+
+        Returns:
+            None
+        """
+        async def send(event: Dict[str, Any]) -> None:
+            writer.write((json.dumps(event, ensure_ascii=False) + "\n").encode())
+            await writer.drain()
+
+        session = subscription = None
+        try:
+            request = json.loads(await reader.readline() or "{}")
+            session = self.sessions.get(request.get("session"))
+            if request.get("op") != "join" or session is None:
+                await send({"event": "error", "error": f"Unknown session {request.get('session')!r}."})
+                return
+            agent_name = request.get("agent")
+            subscription = session.subscribe(agent_name)
+
+            async def forward_actions() -> None:
+                while line := await reader.readline():
+                    try:
+                        request = json.loads(line)
+                        if not isinstance(request, dict):
+                            raise json.JSONDecodeError("Expected a JSON object", line.decode(errors="replace"), 0)
+                        if request.get("op") == "act":
+                            session.submit_action(agent_name, request["action"])
+                    except json.JSONDecodeError:
+                        await send({"event": "error", "error": "Malformed request, expected a JSON object per line."})
+                    except KeyError:
+                        await send({"event": "error", "error": 'An "act" request needs an "action".'})
+                    except ValueError as e:
+                        await send({"event": "error", "error": str(e)})
+
+            async def stream_events() -> None:
+                async for event in subscription:
+                    await send(event)
+
+            # The connection ends when the game is over or when the client goes away, whichever comes first
+            tasks = [asyncio.create_task(forward_actions()), asyncio.create_task(stream_events())]
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                task.cancel()
+            for task in done:
+                task.result()
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            if subscription is not None:
+                # A player who disconnects leaves their seat, so that the game does not wait for them
+                session.unsubscribe(subscription)
+            writer.close()
+
+    def _get_session(self, session_id: str) -> GameSession:
+        """
+        Returns a session that has not finished.
+
+        Args:
+            session_id (str): The identifier of the session.
+
+        Returns:
+            GameSession: The session.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ValueError(f"Unknown session {session_id}.")
+        return session
@@ -0,0 +1,64 @@
+from agents.cascade_agent import CascadeAgent, CascadeStats, PhasePolicy, Tier
+
+
+class LocalLLM:
+    """
+    Stand-in for a local PrefixCachingLLM, with prefix reuse and confidence.
+    """
+    accepted_kwargs = frozenset({"stop_at", "max_tokens", "is_in"})
+
+    def __init__(self, confidence):
+        self.confidence = confidence
+        self.keys = []
+
+    def complete(self, key, prefix, tail, **kwargs):
+        return self.complete_with_confidence(key, prefix, tail, **kwargs)[0]
+
+    def complete_with_confidence(self, key, prefix, tail, **kwargs):
+        self.keys.append(key)
+        return "<message>It is a tool.</message>", self.confidence
+
+
+class HostedLLM:
+    """
+    Stand-in for a hosted completion model, without prefix reuse.
+    """
+    accepted_kwargs = frozenset({"stop_at", "max_tokens"})
+
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return "<message>People use it every day.</message>"
+
+
+def make_agent(local, hosted, stats):
+    tiers = [Tier("local", local, reuse_prefix=True), Tier("hosted", hosted, 0.03, 0.06)]
+    return CascadeAgent("Alice", tiers, default_policy=PhasePolicy(min_confidence=0.5), stats=stats)
+
+
+def test_mixed_cascade_accepts_confident_local_action():
+    local, hosted, stats = LocalLLM(confidence=0.9), HostedLLM(), CascadeStats()
+    agent = make_agent(local, hosted, stats)
+
+    action = agent.act(["Moderator: Describe your keyword."], "DESCRIPTION")
+
+    assert action == "It is a tool."
+    assert local.keys == [agent]
+    assert hosted.prompts == []
+    assert stats.summary()["local"]["accepted"] == 1
+
+
+def test_mixed_cascade_escalates_to_hosted_tier():
+    local, hosted, stats = LocalLLM(confidence=0.1), HostedLLM(), CascadeStats()
+    agent = make_agent(local, hosted, stats)
+
+    action = agent.act(["Moderator: Describe your keyword."], "DESCRIPTION")
+
+    assert action == "People use it every day."
+    assert local.keys == [agent]
+    assert len(hosted.prompts) == 1 and hosted.prompts[0].endswith("Alice:")
+    summary = stats.summary()
+    assert summary["local"]["low_confidence"] == 1
+    assert summary["hosted"]["accepted"] == 1
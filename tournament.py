@@ -0,0 +1,465 @@
+import collections
+import itertools
+import multiprocessing
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from agents.agent import Agent
+from analytics import OutcomeRecorder, Records
+from agents.registry import load_agent_factory
+from checkpoint import CheckpointLog, read_checkpoint_log
+from dataset import Trajectory, get_trajectory
+import metrics
+from environment import Environment
+from utils import GameRole
+
+# Creates the agent with the given name for the game with the given seed. Tournaments also accept the name of
+# an agents.registry backend called the same way, which workers import on first use, except the backends that
+# need a model (agents.registry.MODEL_BACKENDS).
+AgentFactory = Callable[[str, int], Agent]
+
+
+class GameResult:
+    """
+    The outcome of a single tournament game.
+
+    Attributes:
+        config (str): The name of the agent factory that played the game.
+        keyword_pair (Tuple[str, str]): The keyword pair of the game.
+        seed (int): The seed of the game.
+        role_to_agents (Dict[GameRole, List[str]]): A dictionary mapping game roles to agents.
+        winners (List[GameRole]): The roles that won the game, empty if the game did not finish.
+        num_steps (int): The number of steps played.
+        records (Optional[Records]): The analytics records of the game, by table name, see analytics.OutcomeWriter.
+        trajectory (Optional[Trajectory]): The trajectory of the game, see dataset.get_trajectory, or None if it
+            was not recorded.
+    """
+    def __init__(
+        self,
+        config: str,
+        keyword_pair: Tuple[str, str],
+        seed: int,
+        role_to_agents: Dict[GameRole, List[str]],
+        winners: List[GameRole],
+        num_steps: int,
+        records: Optional[Records] = None,
+        trajectory: Optional[Trajectory] = None,
+    ) -> None:
+        self.config = config
+        self.keyword_pair = keyword_pair
+        self.seed = seed
+        self.role_to_agents = role_to_agents
+        self.winners = winners
+        self.num_steps = num_steps
+        self.records = records
+        self.trajectory = trajectory
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converts the result to a JSON serializable dictionary.
+
+        Returns:
+            Dict[str, Any]: The result.
+        """
+        return {
+            "config": self.config,
+            "keyword_pair": list(self.keyword_pair),
+            "seed": self.seed,
+            "role_to_agents": {role.name: agents for role, agents in self.role_to_agents.items()},
+            "winners": [role.name for role in self.winners],
+            "num_steps": self.num_steps,
+            "records": self.records,
+            "trajectory": self.trajectory,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GameResult":
+        """
+        Creates a result from a dictionary returned by to_dict.
+
+        Args:
+            data (Dict[str, Any]): The result.
+
+        Returns:
+            GameResult: The result.
+        """
+        return cls(
+            data["config"],
+            tuple(data["keyword_pair"]),
+            data["seed"],
+            {GameRole[role]: agents for role, agents in data["role_to_agents"].items()},
+            [GameRole[role] for role in data["winners"]],
+            data["num_steps"],
+            data["records"],
+            data.get("trajectory"),
+        )
+
+    def __repr__(self) -> str:
+        return f"GameResult(config={self.config!r}, seed={self.seed}, winners={[role.name for role in self.winners]})"
+
+
+def record_outcomes(env: Environment, name_to_agent: Dict[str, Agent]) -> None:
+    """
+    Tells the agents keeping statistics across games, i.e. with a record_outcome method like CascadeAgent,
+    whether they won a finished game.
+
+    Args:
+        env (Environment): The environment of the finished game.
+        name_to_agent (Dict[str, Agent]): A dictionary mapping agent names to agents.
+
+    Returns:
+        None
+    """
+    for agent_name, agent in name_to_agent.items():
+        record_outcome = getattr(agent, "record_outcome", None)
+        if record_outcome is not None:
+            record_outcome(env.agent_to_role[agent_name] in env.winners)
+
+
+def play_game(env: Environment, name_to_agent: Dict[str, Agent], max_steps: int = 200) -> int:
+    """
+    Plays a game until it reaches a terminal state or the step limit.
+
+    Once the game reaches a terminal state, its outcome is passed on to the agents with record_outcomes.
+
+    Args:
+        env (Environment): The environment of the game.
+        name_to_agent (Dict[str, Agent]): A dictionary mapping agent names to agents.
+        max_steps (int): The maximum number of steps. Defaults to 200.
+
+    Returns:
+        int: The number of steps played.
+    """
+    name_to_observation = {name: [] for name in name_to_agent}
+    for num_steps in range(1, max_steps + 1):
+        agent_name = env.get_current_agent()
+        observation = name_to_observation[agent_name]
+        observation.extend(
+            str(message) for message in env.message_pool.get_message(agent_name, offset=len(observation))
+        )
+
+        start = time.perf_counter()
+        action = name_to_agent[agent_name].act(observation, env.phase.name)
+        if metrics.registry is not None:
+            metrics.registry.observe("agent_act_seconds", time.perf_counter() - start, phase=env.phase.name)
+        env.step(agent_name, action)
+        if env.terminal:
+            record_outcomes(env, name_to_agent)
+            return num_steps
+    return max_steps
+
+
+async def aplay_game(env: Environment, name_to_agent: Dict[str, Agent], max_steps: int = 200) -> int:
+    """
+    Plays a game like play_game, but requests the actions of simultaneous phases (e.g. voting) from all agents at once.
+
+    Once the game reaches a terminal state, its outcome is passed on to the agents with record_outcomes.
+
+    Args:
+        env (Environment): The environment of the game.
+        name_to_agent (Dict[str, Agent]): A dictionary mapping agent names to agents.
+        max_steps (int): The maximum number of steps. Defaults to 200.
+
+    Returns:
+        int: The number of steps played.
+    """
+    name_to_observation = {name: [] for name in name_to_agent}
+
+    def observe(agent_name: str) -> List[str]:
+        observation = name_to_observation[agent_name]
+        observation.extend(
+            str(message) for message in env.message_pool.get_message(agent_name, offset=len(observation))
+        )
+        return observation
+
+    async def act(agent_name: str) -> str:
+        start = time.perf_counter()
+        action = await name_to_agent[agent_name].aact(list(observe(agent_name)), env.phase.name)
+        if metrics.registry is not None:
+            metrics.registry.observe("agent_act_seconds", time.perf_counter() - start, phase=env.phase.name)
+        return action
+
+    num_steps = 0
+    while num_steps < max_steps:
+        simultaneous_agents = env.get_simultaneous_agents()
+        if simultaneous_agents and num_steps + len(simultaneous_agents) <= max_steps:
+            await env.astep_batch({agent_name: act(agent_name) for agent_name in simultaneous_agents})
+            num_steps += len(simultaneous_agents)
+        else:
+            agent_name = env.get_current_agent()
+            action = await act(agent_name)
+            env.step(agent_name, action)
+            num_steps += 1
+        if env.terminal:
+            record_outcomes(env, name_to_agent)
+            break
+    return num_steps
+
+
+def run_game(
+    config: str,
+    agent_factory: Union[AgentFactory, str],
+    agent_names: List[str],
+    keyword_pair: Tuple[str, str],
+    seed: int,
+    max_steps: int = 200,
+    checkpoint_path: Optional[str] = None,
+    record_trajectory: bool = False,
+) -> GameResult:
+    """
+    Creates the agents and environment of a game and plays it.
+
+    With a checkpoint path, every action is recorded as it happens, and a game already started in the
+    checkpoint is resumed from its last recorded action instead of being played again.
+
+    Args:
+        config (str): The name of the agent factory.
+        agent_factory (Union[AgentFactory, str]): The factory creating the agents, or the name of an agent backend.
+        agent_names (List[str]): The names of the agents.
+        keyword_pair (Tuple[str, str]): The keyword pair of the game.
+        seed (int): The seed of the game.
+        max_steps (int): The maximum number of steps. Defaults to 200.
+        checkpoint_path (Optional[str]): The path of the checkpoint log of the game. Defaults to None.
+        record_trajectory (bool): Whether to record the trajectory of the game, e.g. to export it with
+            dataset.export_dataset. Defaults to False.
+
+    Returns:
+        GameResult: The outcome of the game.
+    """
+    if isinstance(agent_factory, str):
+        agent_factory = load_agent_factory(agent_factory)
+    name_to_agent = {name: agent_factory(name, seed) for name in agent_names}
+    recorder = OutcomeRecorder(config, game_id=str(seed))
+    if checkpoint_path is not None and os.path.exists(checkpoint_path) and not _has_setting(checkpoint_path):
+        # A crash while the setting was written leaves nothing to resume, so the game starts again
+        os.remove(checkpoint_path)
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        env, num_steps = Environment.resume(checkpoint_path, logger=recorder, record_trajectory=record_trajectory)
+    else:
+        checkpoint = CheckpointLog(checkpoint_path) if checkpoint_path is not None else None
+        env = Environment(
+            agents=list(agent_names),
+            keyword_pair=keyword_pair,
+            logger=recorder,
+            seed=seed,
+            checkpoint=checkpoint,
+            record_trajectory=record_trajectory,
+        )
+        num_steps = 0
+    if not env.terminal:
+        num_steps += play_game(env, name_to_agent, max_steps - num_steps)
+    if env.checkpoint is not None:
+        env.checkpoint.close()
+    if not env.terminal:
+        # Record games stopped by the step limit as finished without winners
+        recorder.log(
+            "summary",
+            winners=[],
+            survivors=env.agents,
+            num_messages=env.message_pool.count_message(),
+            num_rounds=env.num_rounds,
+        )
+    return GameResult(
+        config,
+        tuple(keyword_pair),
+        seed,
+        env.role_to_agents,
+        env.winners,
+        num_steps,
+        recorder.pop_records(),
+        get_trajectory(env) if record_trajectory else None,
+    )
+
+
+def _has_setting(checkpoint_path: str) -> bool:
+    return any(record["event"] == "setting" for record in read_checkpoint_log(checkpoint_path))
+
+
+def _run_game_task(task: tuple) -> GameResult:
+    return run_game(*task)
+
+
+def _game_checkpoint_path(checkpoint_dir: str, seed: int) -> str:
+    return os.path.join(checkpoint_dir, f"game-{seed}.jsonl")
+
+
+def iter_tournament(
+    agent_factories: Dict[str, Union[AgentFactory, str]],
+    keyword_pairs: Iterable[Tuple[str, str]],
+    agent_names: List[str],
+    games_per_pair: int = 1,
+    base_seed: int = 0,
+    max_steps: int = 200,
+    num_workers: Optional[int] = None,
+    chunksize: int = 8,
+    checkpoint_dir: Optional[str] = None,
+    record_trajectories: bool = False,
+) -> Iterator[GameResult]:
+    """
+    Plays every agent factory against every keyword pair, spreading the games over a process pool.
+
+    Games are scheduled lazily, keyword pair by keyword pair, so keyword_pairs can be a stream such as a
+    keyword_pairs.KeywordPairSource, and results are yielded as soon as they are ready.
+
+    Game i of the tournament is seeded with base_seed + i, so a tournament with the same arguments
+    is reproducible as long as the agents only draw randomness from their seed.
+    Agent factories are sent to the worker processes, so they must be picklable (e.g. module level functions).
+    Backend names such as "random_voter" are cheaper: workers only import the modules of the backends they play.
+
+    With a checkpoint directory, the tournament can be run again with the same arguments after a crash. Finished
+    games are appended to results.jsonl and are not played again: their results are read back from it when their
+    turn comes. Every game in progress keeps a checkpoint log of its actions, so it resumes from its last action
+    without repeating any call to the agents.
+
+    Args:
+        agent_factories (Dict[str, Union[AgentFactory, str]]): A dictionary mapping config names to agent
+            factories or agent backend names.
+        keyword_pairs (Iterable[Tuple[str, str]]): The keyword pairs to play.
+        agent_names (List[str]): The names of the agents in every game.
+        games_per_pair (int): The number of games per config and keyword pair. Defaults to 1.
+        base_seed (int): The seed of the first game. Defaults to 0.
+        max_steps (int): The maximum number of steps per game. Defaults to 200.
+        num_workers (Optional[int]): The number of worker processes. Defaults to None, which uses all cores.
+            With 1 worker the games are played in the current process.
+        chunksize (int): The number of games sent to a worker at once, to amortize the inter-process
+            overhead of cheap games. Defaults to 8.
+        checkpoint_dir (Optional[str]): The directory of the checkpoints of the tournament, created if needed.
+            Defaults to None, which does not checkpoint.
+        record_trajectories (bool): Whether to record the trajectory of every game, e.g. to export the games as
+            training data with dataset.export_dataset. Defaults to False.
+
+    Returns:
+        Iterator[GameResult]: The outcomes of the games, in the order they were scheduled.
+    """
+    finished = set()
+    finished_records = iter(())
+    results_log = None
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        results_path = os.path.join(checkpoint_dir, "results.jsonl")
+        if os.path.exists(results_path):
+            for record in read_checkpoint_log(results_path):
+                finished.add((record["config"], record["seed"]))
+            # Finished results are read again when their turn comes rather than kept in memory
+            finished_records = itertools.islice(read_checkpoint_log(results_path), len(finished))
+        results_log = CheckpointLog(results_path)
+
+    # Keys of the finished games in scheduled order, with None in place of every game sent to the pool
+    schedule = collections.deque()
+    read_ahead = {}
+
+    def tasks() -> Iterator[tuple]:
+        seed = base_seed
+        for keyword_pair in keyword_pairs:
+            for config, agent_factory in agent_factories.items():
+                for _ in range(games_per_pair):
+                    if (config, seed) in finished:
+                        schedule.append((config, seed))
+                    else:
+                        schedule.append(None)
+                        checkpoint_path = _game_checkpoint_path(checkpoint_dir, seed) if checkpoint_dir else None
+                        yield (
+                            config, agent_factory, agent_names, tuple(keyword_pair), seed, max_steps, checkpoint_path,
+                            record_trajectories,
+                        )
+                    seed += 1
+
+    def finished_results() -> Iterator[GameResult]:
+        # Yields the finished games scheduled before the next game of the pool
+        while schedule and schedule[0] is not None:
+            key = schedule.popleft()
+            # The results file is in scheduled order, unless the arguments of the tournament changed
+            while key not in read_ahead:
+                record = next(finished_records)
+                read_ahead[(record["config"], record["seed"])] = record
+            yield GameResult.from_dict(read_ahead.pop(key))
+
+    def in_order(results: Iterator[GameResult]) -> Iterator[GameResult]:
+        # A game is scheduled before its task is sent to the pool, so its place is known when its result arrives
+        for result in results:
+            yield from finished_results()
+            schedule.popleft()
+            if results_log is not None:
+                results_log.append(result.to_dict())
+                # The game is safe in the results, its actions are no longer needed
+                checkpoint_path = _game_checkpoint_path(checkpoint_dir, result.seed)
+                if os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+            yield result
+        yield from finished_results()
+
+    try:
+        num_workers = num_workers or os.cpu_count() or 1
+        if num_workers == 1:
+            yield from in_order(_run_game_task(task) for task in tasks())
+            return
+
+        with multiprocessing.Pool(num_workers) as pool:
+            yield from in_order(pool.imap(_run_game_task, tasks(), chunksize=chunksize))
+    finally:
+        if results_log is not None:
+            results_log.close()
+
+
+def run_tournament(
+    agent_factories: Dict[str, Union[AgentFactory, str]],
+    keyword_pairs: Iterable[Tuple[str, str]],
+    agent_names: List[str],
+    games_per_pair: int = 1,
+    base_seed: int = 0,
+    max_steps: int = 200,
+    num_workers: Optional[int] = None,
+    chunksize: int = 8,
+    checkpoint_dir: Optional[str] = None,
+    record_trajectories: bool = False,
+) -> List[GameResult]:
+    """
+    Plays a whole tournament with iter_tournament and collects the outcomes.
+
+    Args:
+        agent_factories (Dict[str, Union[AgentFactory, str]]): A dictionary mapping config names to agent
+            factories or agent backend names.
+        keyword_pairs (Iterable[Tuple[str, str]]): The keyword pairs to play.
+        agent_names (List[str]): The names of the agents in every game.
+        games_per_pair (int): The number of games per config and keyword pair. Defaults to 1.
+        base_seed (int): The seed of the first game. Defaults to 0.
+        max_steps (int): The maximum number of steps per game. Defaults to 200.
+        num_workers (Optional[int]): The number of worker processes. Defaults to None, which uses all cores.
+        chunksize (int): The number of games sent to a worker at once. Defaults to 8.
+        checkpoint_dir (Optional[str]): The directory of the checkpoints of the tournament. Defaults to None.
+        record_trajectories (bool): Whether to record the trajectory of every game. Defaults to False.
+
+    Returns:
+        List[GameResult]: The outcomes of the games, in the order they were scheduled.
+    """
+    return list(iter_tournament(
+        agent_factories, keyword_pairs, agent_names, games_per_pair, base_seed, max_steps, num_workers, chunksize,
+        checkpoint_dir, record_trajectories,
+    ))
+
+
+def aggregate_win_rates(results: List[GameResult]) -> Dict[str, Dict[GameRole, float]]:
+    """
+    Computes the win rate of each role per config.
+
+    Games that did not finish count as a loss for every role.
+
+    Args:
+        results (List[GameResult]): The outcomes of the games.
+
+    Returns:
+        Dict[str, Dict[GameRole, float]]: A dictionary mapping config names to the win rate of each role.
+    """
+    num_games = {}
+    num_wins = {}
+    for result in results:
+        num_games[result.config] = num_games.get(result.config, 0) + 1
+        wins = num_wins.setdefault(result.config, {role: 0 for role in GameRole})
+        for role in result.winners:
+            wins[role] += 1
+
+    return {
+        config: {role: wins / num_games[config] for role, wins in role_to_wins.items()}
+        for config, role_to_wins in num_wins.items()
+    }
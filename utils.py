@@ -1,5 +1,8 @@
+import sys
 from enum import Enum
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
+
+import metrics
 
 
 class GamePhase(Enum):
@@ -21,22 +24,118 @@ class GameRole(Enum):
     MRWHITE = 2
 
 
+class AgentRegistry:
+    """
+    Interns agent names to small integer ids, so that sets of agents can be stored as bitmasks.
+
+    Attributes:
+        names (List[str]): The registered names, indexed by id.
+        ids (Dict[str, int]): A dictionary mapping names to ids.
+    """
+
+    def __init__(self, names: Optional[List[str]] = None) -> None:
+        """
+        Initializes an AgentRegistry object.
+
+        Args:
+            names (Optional[List[str]]): Names to register first, e.g. the initial agents of the game. Defaults to None.
+        """
+        self.names = []
+        self.ids = {}
+        self._mask_to_names = {}
+        self._names_to_mask = {}
+        for name in names or []:
+            self.get_id(name)
+
+    def get_id(self, name: str) -> int:
+        """
+        Returns the id of a name, registering it if needed.
+
+        Args:
+            name (str): The name.
+
+        Returns:
+            int: The id.
+        """
+        agent_id = self.ids.get(name)
+        if agent_id is None:
+            agent_id = len(self.names)
+            self.names.append(sys.intern(name))
+            self.ids[name] = agent_id
+        return agent_id
+
+    def to_mask(self, names: List[str]) -> int:
+        """
+        Encodes names as a bitmask with bit i set for the agent with id i.
+
+        Args:
+            names (List[str]): The names.
+
+        Returns:
+            int: The bitmask.
+        """
+        # Games send most messages to the same few groups of agents, so masks are cached per group
+        key = tuple(names)
+        mask = self._names_to_mask.get(key)
+        if mask is None:
+            mask = 0
+            for name in names:
+                mask |= 1 << self.get_id(name)
+            self._names_to_mask[key] = mask
+        return mask
+
+    def to_names(self, mask: int) -> Tuple[str, ...]:
+        """
+        Decodes a bitmask into names, in id order.
+
+        Args:
+            mask (int): The bitmask.
+
+        Returns:
+            Tuple[str, ...]: The names.
+        """
+        names = self._mask_to_names.get(mask)
+        if names is None:
+            names = tuple(name for agent_id, name in enumerate(self.names) if mask >> agent_id & 1)
+            self._mask_to_names[mask] = names
+        return names
+
+
 class Message:
     """
     Represents a message sent from a sender to one or more receivers.
 
+    Messages are compact: the receivers are stored as a bitmask over the ids of an AgentRegistry, usually
+    shared by all messages of a pool, and the receiver list is decoded on access.
+
     Attributes:
         sender (str): The sender of the message.
         content (str): The content of the message.
         receiver (List[str]): The list of receivers of the message.
+        receiver_mask (int): The receivers of the message as a bitmask.
+        registry (AgentRegistry): The registry the receiver mask refers to.
     """
 
+    __slots__ = ("sender", "content", "receiver_mask", "registry")
+
     def __init__(
-        self, sender: str, content: str, receiver: List[str]
+        self,
+        sender: str,
+        content: str,
+        receiver: List[str],
+        registry: Optional[AgentRegistry] = None,
+        receiver_mask: Optional[int] = None,
     ) -> None:
-        self.sender = sender
+        if registry is None:
+            registry = AgentRegistry()
+        self.sender = sys.intern(sender)
         self.content = content
-        self.receiver = receiver
+        self.receiver_mask = registry.to_mask(receiver) if receiver_mask is None else receiver_mask
+        self.registry = registry
+
+    @property
+    def receiver(self) -> List[str]:
+        return list(self.registry.to_names(self.receiver_mask))
 
     def __str__(self) -> str:
         return f"{self.sender}: {self.content}"
@@ -45,66 +144,273 @@ class Message:
         return str(self)
 
 
+class MessageLog:
+    """
+    Append-only sequence of messages whose forks share the messages added before the fork.
+
+    A fork references the frozen segments of its parent instead of copying them, so forking costs the same
+    regardless of the number of messages. Both the parent and the fork can keep appending independently.
+    """
+
+    __slots__ = ("_segments", "_num_frozen", "_tail")
+
+    def __init__(self) -> None:
+        self._segments = ()  # (list, length) pairs, only the first length items of each list belong to the log
+        self._num_frozen = 0
+        self._tail = []
+
+    def append(self, message: Message) -> None:
+        """
+        Appends a message to the log.
+
+        Args:
+            message (Message): The message.
+
+        Returns:
+            None
+        """
+        self._tail.append(message)
+
+    def fork(self) -> "MessageLog":
+        """
+        Creates a log with the same messages that can be appended to independently.
+
+        Returns:
+            MessageLog: The fork.
+        """
+        log = MessageLog()
+        log._segments = self._segments
+        if self._tail:
+            # The list keeps growing with the parent, but the fork only reads the items added so far
+            log._segments += ((self._tail, len(self._tail)),)
+        log._num_frozen = len(self)
+        return log
+
+    def to_list(self, offset: int = 0) -> List[Message]:
+        """
+        Returns the messages after the first offset messages.
+
+        Args:
+            offset (int): The number of messages to skip. Defaults to 0.
+
+        Returns:
+            List[Message]: The messages.
+        """
+        if offset >= self._num_frozen:
+            return self._tail[offset - self._num_frozen:]
+        messages = []
+        for segment, length in self._segments:
+            if offset < length:
+                messages.extend(segment[offset:length])
+            offset = max(0, offset - length)
+        messages.extend(self._tail)
+        return messages
+
+    def __len__(self) -> int:
+        return self._num_frozen + len(self._tail)
+
+
 class MessagePool:
     """
     A class representing a pool of messages.
 
+    Adding a message costs the same regardless of the number of receivers: add_message does not update the
+    index of the messages visible to each agent. The index is built lazily instead, when an agent reads the pool,
+    by scanning the messages added since its last read, so each message is still indexed once per agent.
+
     Attributes:
-        messages (List[Message]): The list of messages in the pool.
+        messages (List[Message]): A new list of the messages in the pool on every access.
+        message_log (MessageLog): The messages in the pool, shared with forks.
+        visible_messages (Dict[str, MessageLog]): The messages visible to each agent that read the pool, in the
+            order they were added, up to the last read of the agent.
+        on_message (Optional[Callable[[Message], None]]): Callback invoked with every message added to the pool.
+        registry (AgentRegistry): The registry shared by the messages of the pool.
     """
 
-    def __init__(self, messages: Optional[List[Message]] = None) -> None:
+    def __init__(
+        self,
+        messages: Optional[List[Message]] = None,
+        on_message: Optional[Callable[[Message], None]] = None,
+        agent_names: Optional[List[str]] = None,
+    ) -> None:
         """
         Initializes a MessagePool object.
 
         Args:
             messages (Optional[List[Message]]): Optional list of messages to initialize the pool with. Defaults to None.
+            on_message (Optional[Callable[[Message], None]]): Callback invoked with every message added by add_message. Defaults to None.
+            agent_names (Optional[List[str]]): Agent names registered first, so that they get the smallest ids. Defaults to None.
         """
         if not messages:
             messages = []
-        self.messages = messages
+        self.message_log = MessageLog()
+        self.visible_messages = {}
+        self.on_message = on_message
+        self.registry = AgentRegistry(agent_names)
+        self._num_indexed = {}  # number of messages of the pool already indexed in visible_messages, per agent
+        for message in messages:
+            if message.registry is not self.registry:
+                message = Message(message.sender, message.content, message.receiver, self.registry)
+            self._append(message)
 
-    def add_message(self, sender: str, message: str, receiver: List[str]) -> None:
+    def add_message(
+        self, sender: str, message: str, receiver: List[str], receiver_mask: Optional[int] = None
+    ) -> None:
         """
         Adds a new message to the pool.
 
+        The receivers are encoded when the message is added, so later changes to the caller's list
+        (e.g. eliminating an agent) do not change who could see the message at the time it was sent.
+
         Args:
             sender (str): The sender of the message.
             message (str): The content of the message.
             receiver (List[str]): The list of receivers for the message.
+            receiver_mask (Optional[int]): The receivers already encoded with the registry of the pool, used
+                instead of receiver to skip encoding large groups. Defaults to None.
         """
-        self.messages.append(Message(sender, message, receiver))
+        new_message = Message(sender, message, receiver, self.registry, receiver_mask)
+        self._append(new_message)
+        if self.on_message is not None:
+            self.on_message(new_message)
 
-    def get_message(self, receiver: Optional[str] = None) -> List[Message]:
+    @metrics.timed("get_message_seconds")
+    def get_message(self, receiver: Optional[str] = None, offset: int = 0) -> List[Message]:
         """
         Retrieves messages from the pool.
 
         If no receiver is specified, returns all messages.
         If a receiver is specified, returns messages that are either received by the specified receiver or sent by the specified receiver.
 
+        The offset acts as a cursor: only messages after the first `offset` messages are returned.
+        A caller that keeps the number of messages it has already seen can fetch just the new ones.
+
         Args:
             receiver (Optional[str]): The receiver of the messages. Defaults to None.
+            offset (int): The number of messages to skip. Defaults to 0.
 
         Returns:
             List[Message]: The list of messages.
         """
         if not receiver:
-            return self.messages
-        messages = []
-        for message in self.messages:
-            if (
-                receiver in message.receiver  # if message's receiver is receiver
-                or message.sender == receiver  # or message is sent by receiver
-            ):
-                messages.append(message)
-        return messages
+            return self.message_log.to_list(offset)
+        visible_messages = self._index(receiver)
+        if visible_messages is None:
+            return []
+        return visible_messages.to_list(offset)
+
+    @property
+    def messages(self) -> List[Message]:
+        """
+        A new list of the messages in the pool, built on every access from the message log shared with forks.
+
+        The list does not follow later messages and changing it does not change the pool. Use add_message to add
+        messages, and get_message with an offset to read only the new ones.
+        """
+        return self.message_log.to_list()
+
+    def fork(self, on_message: Optional[Callable[[Message], None]] = None) -> "MessagePool":
+        """
+        Creates a pool with the same messages that can be added to independently.
+
+        The messages are shared with the fork rather than copied, so forking costs the same regardless of
+        the number of messages.
+
+        Args:
+            on_message (Optional[Callable[[Message], None]]): Callback of the fork. Defaults to None.
+
+        Returns:
+            MessagePool: The fork.
+        """
+        pool = MessagePool(on_message=on_message)
+        pool.registry = self.registry
+        pool.message_log = self.message_log.fork()
+        pool.visible_messages = {agent: log.fork() for agent, log in self.visible_messages.items()}
+        pool._num_indexed = self._num_indexed.copy()
+        return pool
+
+    def is_visible(self, message: Message, receiver: str) -> bool:
+        """
+        Checks if a message of the pool is visible to an agent, i.e. received or sent by the agent.
+
+        Args:
+            message (Message): The message.
+            receiver (str): The name of the agent.
+
+        Returns:
+            bool: True if the message is visible to the agent, False otherwise.
+        """
+        agent_id = self.registry.ids.get(receiver)
+        if agent_id is None:
+            return False
+        return bool(message.receiver_mask & 1 << agent_id) or message.sender == receiver
+
+    def count_message(self, receiver: Optional[str] = None) -> int:
+        """
+        Counts the messages in the pool.
+
+        Args:
+            receiver (Optional[str]): The receiver of the messages. Defaults to None, which counts all messages.
+
+        Returns:
+            int: The number of messages visible to the receiver, or the total number of messages.
+        """
+        if not receiver:
+            return len(self.message_log)
+        visible_messages = self._index(receiver)
+        if visible_messages is None:
+            return 0
+        return len(visible_messages)
+
+    def _append(self, message: Message) -> None:
+        """
+        Appends a message to the pool.
+
+        Args:
+            message (Message): The message to be appended.
+
+        Returns:
+            None
+        """
+        # Register the sender, so that is_visible knows it
+        self.registry.get_id(message.sender)
+        self.message_log.append(message)
+
+    def _index(self, receiver: str) -> Optional[MessageLog]:
+        """
+        Indexes the messages added since the last read of an agent that are visible to the agent.
+
+        Args:
+            receiver (str): The name of the agent.
+
+        Returns:
+            Optional[MessageLog]: The messages visible to the agent, or None if the agent is unknown to the pool.
+        """
+        agent_id = self.registry.ids.get(receiver)
+        if agent_id is None:
+            return None
+        visible_messages = self.visible_messages.get(receiver)
+        if visible_messages is None:
+            visible_messages = self.visible_messages[receiver] = MessageLog()
+        num_indexed = self._num_indexed.get(receiver, 0)
+        if num_indexed < len(self.message_log):
+            agent_bit = 1 << agent_id
+            for message in self.message_log.to_list(num_indexed):
+                # message is always visible to its sender
+                if message.receiver_mask & agent_bit or message.sender == receiver:
+                    visible_messages.append(message)
+            self._num_indexed[receiver] = len(self.message_log)
+        return visible_messages
 
 class VoteManager:
     """
     A class that manages votes from different agents.
 
+    The tally and the leading agent are updated with each vote, so adding a vote, finding the eliminated agent,
+    removing an agent and starting a new round cost the same regardless of the number of agents.
+
     Attributes:
-        votes (dict): A dictionary that stores the vote count for each agent.
+        votes (dict): A dictionary that stores the vote count of each agent that received votes this round.
     """
 
     def __init__(self, agents: List[str]) -> None:
@@ -112,34 +418,84 @@ class VoteManager:
         Initializes the VoteManager object with a list of agents.
 
         Args:
-            agents (List[str]): A list of agent names.
+            agents (List[str]): A list of agent names, in turn order.
 
         Returns:
             None
         """
-        self.votes = {
-            agent.strip().capitalize(): 0 for agent in agents
+        self.votes = {}
+        # Turn order of the agents that can receive votes, ties are broken in favor of the earliest agent
+        self._order = {
+            agent.strip().capitalize(): index for index, agent in enumerate(agents)
         }
+        self._leader = None
     
-    def add_vote(self, agent: str) -> None:
+    def add_vote(self, agent: str) -> bool:
         """
         Adds a vote for a specific agent.
 
+        Votes for agents that are not alive are dropped.
+
         Args:
             agent (str): The name of the agent.
 
         Returns:
-            None
+            bool: True if the vote was counted, False if it was dropped.
         """
         agent = agent.strip().capitalize()
-        if agent in self.votes:
-            self.votes[agent] += 1
+        order = self._order.get(agent)
+        if order is None:
+            return False
+        count = self.votes.get(agent, 0) + 1
+        self.votes[agent] = count
+
+        leader = self._leader
+        if leader is None or count > self.votes[leader] or (count == self.votes[leader] and order < self._order[leader]):
+            self._leader = agent
+        return True
 
     def get_eliminated_agent(self) -> str:
         """
         Returns the agent with the highest number of votes.
 
         Returns:
-            str: The name of the agent with the highest number of votes.
+            str: The name of the agent with the highest number of votes, or the first agent if no vote was counted.
+        """
+        if self._leader is None:
+            return next(iter(self._order))
+        return self._leader
+
+    def remove_agent(self, agent: str) -> None:
+        """
+        Removes an agent, e.g. after its elimination, so that it can no longer receive votes.
+
+        Args:
+            agent (str): The name of the agent.
+
+        Returns:
+            None
+        """
+        self._order.pop(agent.strip().capitalize(), None)
+
+    def new_round(self) -> None:
+        """
+        Clears the votes of the current round.
+
+        Returns:
+            None
+        """
+        self.votes = {}
+        self._leader = None
+
+    def copy(self) -> "VoteManager":
+        """
+        Returns a copy of the VoteManager with the same votes.
+
+        Returns:
+            VoteManager: The copy.
         """
-        return max(self.votes, key=self.votes.get)
\ No newline at end of file
+        vote_manager = VoteManager([])
+        vote_manager.votes = self.votes.copy()
+        vote_manager._order = self._order.copy()
+        vote_manager._leader = self._leader
+        return vote_manager
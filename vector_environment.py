@@ -0,0 +1,239 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from environment import get_role_counts
+from utils import GamePhase, GameRole
+
+NUM_ROLES = len(GameRole)
+
+
+class VectorEnvironment:
+    """
+    N games of Undercover played in lockstep, with the game state stored in NumPy arrays.
+
+    Meant for rule-level research with scripted or policy agents. Every call to step advances each game by one
+    phase: the description and discussion phases only move the game forward, the voting phase applies one vote
+    per agent and eliminates an agent, and the guessing phase applies Mr. White's guess. The rules are the same
+    as in Environment: ties and rounds without valid votes eliminate the first alive agent in seat order, votes
+    for eliminated or unknown agents are dropped, and an eliminated Mr. White gets to guess the keyword.
+
+    Args:
+        num_games (int): The number of games.
+        agents (List[str]): The agents of every game, in seat order.
+        seed (Optional[int]): Seed of the random number generator used to assign roles. Defaults to None.
+        record_messages (bool): Whether to keep the moderator announcements of each game as text. Defaults to False.
+        role_ratios (Optional[Dict[GameRole, float]]): Share of the agents playing the undercover and Mr. White roles.
+            Defaults to None, see environment.get_role_counts.
+
+    Attributes:
+        num_games (int): The number of games.
+        initial_agents (List[str]): The agents of every game, in seat order.
+        role_counts (List[int]): The number of civilians, undercovers and Mr. Whites of every game.
+        roles (np.ndarray): The GameRole value of each agent, shape (num_games, num_agents).
+        alive (np.ndarray): Whether each agent is alive, shape (num_games, num_agents).
+        phase (np.ndarray): The GamePhase value of each game, shape (num_games,).
+        votes (np.ndarray): The votes received by each agent in the last voting phase, shape (num_games, num_agents).
+        eliminated (np.ndarray): The seat of the agent eliminated in the last voting phase, -1 if none, shape (num_games,).
+        terminal (np.ndarray): Whether each game is in a terminal state, shape (num_games,).
+        winners (np.ndarray): Whether each role won each game, shape (num_games, len(GameRole)).
+        num_rounds (np.ndarray): The number of completed voting phases of each game, shape (num_games,).
+        messages (Optional[List[List[str]]]): The moderator announcements of each game, or None if not recorded.
+    """
+
+    def __init__(
+        self,
+        num_games: int,
+        agents: List[str],
+        seed: Optional[int] = None,
+        record_messages: bool = False,
+        role_ratios: Optional[Dict[GameRole, float]] = None,
+    ) -> None:
+        assert len(agents) >= 3, "Number of agents must be at least 3."
+
+        self.num_games = num_games
+        self.initial_agents = agents
+        self.role_counts = get_role_counts(len(agents), role_ratios)
+        self.record_messages = record_messages
+        self.rng = np.random.default_rng(seed)
+
+        self.roles = None
+        self.alive = None
+        self.phase = None
+        self.votes = None
+        self.eliminated = None
+        self.terminal = None
+        self.winners = None
+        self.num_rounds = None
+        self.messages = None
+
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Resets every game to its initial state with newly shuffled roles.
+
+        Returns:
+            None
+        """
+        num_agents = len(self.initial_agents)
+        roles = np.repeat(np.arange(NUM_ROLES), self.role_counts)
+        self.roles = self.rng.permuted(np.tile(roles, (self.num_games, 1)), axis=1)
+        self.alive = np.ones((self.num_games, num_agents), dtype=bool)
+        self.phase = np.full(self.num_games, GamePhase.DESCRIPTION.value)
+        self.votes = np.zeros((self.num_games, num_agents), dtype=np.int64)
+        self.eliminated = np.full(self.num_games, -1)
+        self.terminal = np.zeros(self.num_games, dtype=bool)
+        self.winners = np.zeros((self.num_games, NUM_ROLES), dtype=bool)
+        self.num_rounds = np.zeros(self.num_games, dtype=np.int64)
+        self.messages = [[] for _ in range(self.num_games)] if self.record_messages else None
+        self._announce(~self.terminal, "Game enters description phase.")
+
+    def step(self, votes: Optional[np.ndarray] = None, guesses: Optional[np.ndarray] = None) -> None:
+        """
+        Advances every game that is not in a terminal state by one phase.
+
+        Args:
+            votes (Optional[np.ndarray]): The seat each agent votes for, -1 to abstain, shape (num_games, num_agents).
+                Only used by games in the voting phase, where it is required. Votes of eliminated agents are ignored.
+            guesses (Optional[np.ndarray]): Whether Mr. White guesses the keyword correctly, shape (num_games,).
+                Only used by games in the guessing phase, where it is required.
+
+        Returns:
+            None
+        """
+        active = ~self.terminal
+        in_phase = {phase: active & (self.phase == phase.value) for phase in GamePhase}
+
+        # Description and discussion phases have no effect on the rules, they only move the game forward
+        for phase in [GamePhase.DESCRIPTION, GamePhase.DISCUSSION]:
+            self.phase[in_phase[phase]] = phase.value + 1
+            self._announce(in_phase[phase], f"Game enters {GamePhase(phase.value + 1).name.lower()} phase.")
+
+        if in_phase[GamePhase.VOTING].any():
+            if votes is None:
+                raise ValueError("Votes are required for games in the voting phase.")
+            self._apply_votes(in_phase[GamePhase.VOTING], np.asarray(votes))
+
+        if in_phase[GamePhase.GUESSING].any():
+            if guesses is None:
+                raise ValueError("Guesses are required for games in the guessing phase.")
+            self._apply_guesses(in_phase[GamePhase.GUESSING], np.asarray(guesses, dtype=bool))
+
+    def alive_roles(self) -> np.ndarray:
+        """
+        Counts the alive agents of each role.
+
+        Returns:
+            np.ndarray: The number of alive agents per game and role, shape (num_games, len(GameRole)).
+        """
+        return np.stack([(self.alive & (self.roles == role)).sum(axis=1) for role in range(NUM_ROLES)], axis=1)
+
+    def _apply_votes(self, games: np.ndarray, votes: np.ndarray) -> None:
+        """
+        Tallies the votes of the given games and eliminates the agent with the most votes.
+
+        Args:
+            games (np.ndarray): Mask of the games in the voting phase.
+            votes (np.ndarray): The seat each agent votes for, shape (num_games, num_agents).
+
+        Returns:
+            None
+        """
+        num_agents = len(self.initial_agents)
+        game_index = np.nonzero(games)[0]
+        votes = votes[game_index]
+
+        # Keep votes cast by alive agents for alive agents, then count them per (game, seat)
+        voter_alive = self.alive[game_index]
+        in_range = (votes >= 0) & (votes < num_agents)
+        target = np.where(in_range, votes, 0)
+        valid = voter_alive & in_range & np.take_along_axis(self.alive[game_index], target, axis=1)
+        rows = np.broadcast_to(np.arange(len(game_index))[:, None], votes.shape)
+        tally = np.zeros((len(game_index), num_agents), dtype=np.int64)
+        np.add.at(tally, (rows[valid], target[valid]), 1)
+        self.votes[game_index] = tally
+
+        # Eliminated agents cannot be picked, argmax breaks ties by seat order like VoteManager
+        eliminated = np.argmax(np.where(self.alive[game_index], tally, -1), axis=1)
+        self.eliminated[game_index] = eliminated
+        self.num_rounds[game_index] += 1
+
+        is_mrwhite = self.roles[game_index, eliminated] == GameRole.MRWHITE.value
+        guessing = np.zeros(self.num_games, dtype=bool)
+        guessing[game_index[is_mrwhite]] = True
+        self.phase[guessing] = GamePhase.GUESSING.value
+        self._announce(guessing, "Game enters guessing phase.")
+
+        eliminating = np.zeros(self.num_games, dtype=bool)
+        eliminating[game_index[~is_mrwhite]] = True
+        self._eliminate(eliminating)
+
+    def _apply_guesses(self, games: np.ndarray, guesses: np.ndarray) -> None:
+        """
+        Applies Mr. White's guess in the given games.
+
+        Args:
+            games (np.ndarray): Mask of the games in the guessing phase.
+            guesses (np.ndarray): Whether Mr. White guesses the keyword correctly, shape (num_games,).
+
+        Returns:
+            None
+        """
+        correct = games & guesses
+        self.terminal[correct] = True
+        self.winners[correct, GameRole.MRWHITE.value] = True
+        self._announce(correct, "Mr. White guessed the keyword correctly! Mr. White wins!")
+
+        self._eliminate(games & ~guesses)
+
+    def _eliminate(self, games: np.ndarray) -> None:
+        """
+        Eliminates the last voted agent of the given games, then checks if they are in a terminal state.
+
+        Args:
+            games (np.ndarray): Mask of the games.
+
+        Returns:
+            None
+        """
+        game_index = np.nonzero(games)[0]
+        self.alive[game_index, self.eliminated[game_index]] = False
+        if self.record_messages:
+            for game in game_index:
+                self.messages[game].append(f"Agent {self.initial_agents[self.eliminated[game]]} is eliminated.")
+
+        # Same rules as Environment._check_terminal
+        alive_roles = self.alive_roles()
+        num_civilian = alive_roles[:, GameRole.CIVILIAN.value]
+        num_undercover = alive_roles[:, GameRole.UNDERCOVER.value]
+        num_mrwhite = alive_roles[:, GameRole.MRWHITE.value]
+        civilian_win = games & (num_undercover + num_mrwhite == 0)
+        others_win = games & ~civilian_win & (num_civilian <= 1)
+
+        self.winners[civilian_win, GameRole.CIVILIAN.value] = True
+        self.winners[others_win & (num_undercover > 0), GameRole.UNDERCOVER.value] = True
+        self.winners[others_win & (num_mrwhite > 0), GameRole.MRWHITE.value] = True
+        self.terminal |= civilian_win | others_win
+        self._announce(civilian_win | others_win, "Game over.")
+
+        continuing = games & ~self.terminal
+        self.phase[continuing] = GamePhase.DESCRIPTION.value
+        self._announce(continuing, "Game continues.")
+        self._announce(continuing, "Game enters description phase.")
+
+    def _announce(self, games: np.ndarray, message: str) -> None:
+        """
+        Records a moderator announcement for the given games, if messages are recorded.
+
+        Args:
+            games (np.ndarray): Mask of the games.
+            message (str): The announcement.
+
+        Returns:
+            None
+        """
+        if not self.record_messages:
+            return
+        for game in np.nonzero(games)[0]:
+            self.messages[game].append(message)